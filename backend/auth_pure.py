@@ -4,17 +4,22 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import bcrypt
-from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy import Column, Integer, String, select, text
 from sqlalchemy.orm import declarative_base, Session
 
-from db_schema import _pg_base_url
+from db_schema import MAINT_ENGINE
 
 logger = logging.getLogger(__name__)
 
-_AUTH_URL = f"{_pg_base_url()}/postgres"
-_auth_engine = create_engine(_AUTH_URL, echo=False, future=True)
+_auth_engine = MAINT_ENGINE  # admin_users lives on the maintenance DB
 
 AuthBase = declarative_base()
 
@@ -27,7 +32,17 @@ class AdminUser(AuthBase):
     role          = Column(String, nullable=False, server_default="admin")
 
 
-def _ensure_table() -> None:
+# ---------------------------------------------------------------------------
+# Table setup — once per process (app lifespan).  The helpers below still call
+# _ensure_table(), but after the first success that is a flag check: no DDL
+# (and no DDL locks on the postgres DB) on the login / status / me path.
+# ---------------------------------------------------------------------------
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def _create_schema() -> None:
     logger.debug("auth_pure: creating tables on %s", _auth_engine.url)
     AuthBase.metadata.create_all(_auth_engine)
     # Add role column if table existed before this change
@@ -39,21 +54,186 @@ def _ensure_table() -> None:
     logger.debug("auth_pure: create_all completed")
 
 
+def _ensure_table() -> None:
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if not _table_ready:
+            _create_schema()
+            _table_ready = True
+
+
+# ---------------------------------------------------------------------------
+# Password hashing pool.  bcrypt releases the GIL, so a few threads keep the
+# hash cost off the request threads' CPU budget: at most AUTH_HASH_WORKERS
+# hashes run at once, at most AUTH_HASH_QUEUE more wait, and any further
+# login is refused at once with HashPoolBusy (503) instead of holding a
+# request thread for the whole backlog.  The endpoints use the *_async
+# helpers, which await the hash on the event loop, so no request thread
+# waits on bcrypt at all.  AUTH_BCRYPT_ROUNDS is the work factor for new
+# hashes.
+# ---------------------------------------------------------------------------
+
+BCRYPT_ROUNDS = int(os.environ.get("AUTH_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", "2"))
+HASH_QUEUE = int(os.environ.get("AUTH_HASH_QUEUE", "8"))
+
+
+class HashPoolBusy(RuntimeError):
+    """More password hashes pending than AUTH_HASH_WORKERS + AUTH_HASH_QUEUE."""
+
+
+_hash_pool: ThreadPoolExecutor | None = None
+_hash_lock = threading.Lock()
+_hash_stats = {"pending": 0, "max_pending": 0, "completed": 0, "rejected": 0,
+               "wait_seconds": 0.0, "hash_seconds": 0.0}
+
+
+def _submit_hash(fn, *args) -> Future:
+    """Queue fn(*args) on the hashing pool; HashPoolBusy when it is full.
+
+    The caller must call _hash_done() once it has the result."""
+    global _hash_pool
+    with _hash_lock:
+        if _hash_stats["pending"] >= HASH_WORKERS + HASH_QUEUE:
+            _hash_stats["rejected"] += 1
+            raise HashPoolBusy("password hashing queue full")
+        _hash_stats["pending"] += 1
+        _hash_stats["max_pending"] = max(_hash_stats["max_pending"], _hash_stats["pending"])
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+        pool = _hash_pool
+    queued = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with _hash_lock:
+                _hash_stats["wait_seconds"] += started - queued
+                _hash_stats["hash_seconds"] += time.perf_counter() - started
+
+    return pool.submit(job)
+
+
+def _hash_done() -> None:
+    with _hash_lock:
+        _hash_stats["pending"] -= 1
+        _hash_stats["completed"] += 1
+
+
+def _run_hash(fn, *args):
+    """Run fn(*args) on the hashing pool and wait for the result."""
+    fut = _submit_hash(fn, *args)
+    try:
+        return fut.result()
+    finally:
+        _hash_done()
+
+
+async def _await_hash(fn, *args):
+    """_run_hash for async callers: awaits the result without holding a thread."""
+    fut = _submit_hash(fn, *args)
+    try:
+        return await asyncio.wrap_future(fut)
+    finally:
+        _hash_done()
+
+
+def hash_pool_info() -> dict:
+    """Queue depth and timing counters of the hashing pool (this process)."""
+    with _hash_lock:
+        stats = dict(_hash_stats)
+    stats["queued"] = max(0, stats["pending"] - HASH_WORKERS)
+    stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+    stats["hash_seconds"] = round(stats["hash_seconds"], 3)
+    return {**stats, "workers": HASH_WORKERS, "max_queue": HASH_QUEUE, "rounds": BCRYPT_ROUNDS}
+
+
+def hash_password(password: str) -> str:
+    return _run_hash(bcrypt.hashpw, password.encode(),
+                     bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+
+async def hash_password_async(password: str) -> str:
+    return (await _await_hash(bcrypt.hashpw, password.encode(),
+                              bcrypt.gensalt(rounds=BCRYPT_ROUNDS))).decode()
+
+
+# ---------------------------------------------------------------------------
+# User count cache.  /api/auth/me and /status need the user count on every
+# page load (needs_setup) — it is cached for AUTH_CACHE_TTL seconds.
+# create_user / delete_user clear the cache of this process; other
+# workers catch up within the TTL.  "No users" is never cached, so the first
+# account is seen by every worker at once and setup cannot run twice.
+# ---------------------------------------------------------------------------
+
+CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+
+_cache_lock = threading.Lock()
+_counts: dict[str | None, tuple[float, int]] = {}   # role filter → (expires, count)
+
+
+def cache_clear() -> None:
+    with _cache_lock:
+        _counts.clear()
+
+
+def _cached(cache: dict, key):
+    with _cache_lock:
+        hit = cache.get(key)
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def _remember(cache: dict, key, value) -> None:
+    with _cache_lock:
+        cache[key] = (time.monotonic() + CACHE_TTL, value)
+
+
+# ---------------------------------------------------------------------------
+# Users
+# ---------------------------------------------------------------------------
+
 def user_count(role: str | None = None) -> int:
+    count = _cached(_counts, role)
+    if count is not None:
+        return count
     _ensure_table()
     with Session(_auth_engine) as ses:
         q = ses.query(AdminUser)
         if role:
             q = q.filter_by(role=role)
-        return q.count()
+        count = q.count()
+    if count:
+        _remember(_counts, role, count)
+    return count
 
 
-def create_user(username: str, password: str, role: str = "admin") -> None:
+def needs_setup() -> bool:
+    """True until the first account exists."""
+    return user_count() == 0
+
+
+def _insert_user(username: str, password_hash: str, role: str) -> None:
     _ensure_table()
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
     with Session(_auth_engine) as ses:
-        ses.add(AdminUser(username=username, password_hash=hashed, role=role))
+        ses.add(AdminUser(username=username, password_hash=password_hash, role=role))
         ses.commit()
+    cache_clear()
+
+
+def create_user(username: str, password: str, role: str = "admin") -> None:
+    _insert_user(username, hash_password(password), role)
+
+
+async def create_user_async(username: str, password: str, role: str = "admin") -> None:
+    """create_user for async endpoints (HashPoolBusy / IntegrityError as there)."""
+    hashed = await hash_password_async(password)
+    await asyncio.to_thread(_insert_user, username, hashed, role)
 
 
 def list_users() -> list[dict]:
@@ -70,19 +250,40 @@ def delete_user(username: str) -> bool:
             return False
         ses.delete(user)
         ses.commit()
-        return True
+    cache_clear()
+    return True
 
 
-def get_role(username: str) -> str:
+def _stored_credentials(username: str) -> tuple[str, str] | None:
+    """(password_hash, role) of *username*, None if unknown."""
+    _ensure_table()
     with Session(_auth_engine) as ses:
-        user = ses.query(AdminUser).filter_by(username=username).first()
-    return user.role if user else "user"
+        row = ses.execute(
+            select(AdminUser.password_hash, AdminUser.role).where(AdminUser.username == username)
+        ).first()
+    return tuple(row) if row else None
 
 
-def check_credentials(username: str, password: str) -> bool:
-    _ensure_table()
-    with Session(_auth_engine) as ses:
-        user = ses.query(AdminUser).filter_by(username=username).first()
-    if not user:
-        return False
-    return bcrypt.checkpw(password.encode(), user.password_hash.encode())
+def check_credentials(username: str, password: str) -> str | None:
+    """The user's role if the password matches, else None.
+
+    Raises HashPoolBusy when too many logins are pending."""
+    stored = _stored_credentials(username)
+    if stored is None:
+        return None
+    password_hash, role = stored
+    if not _run_hash(bcrypt.checkpw, password.encode(), password_hash.encode()):
+        return None
+    return role
+
+
+async def check_credentials_async(username: str, password: str) -> str | None:
+    """check_credentials for async endpoints: no thread waits on bcrypt."""
+    stored = await asyncio.to_thread(_stored_credentials, username)
+    if stored is None:
+        return None
+    password_hash, role = stored
+    if not await _await_hash(bcrypt.checkpw, password.encode(), password_hash.encode()):
+        return None
+    return role
+
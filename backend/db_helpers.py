@@ -5,30 +5,35 @@ Datenbank-Helper für das Kompetenzen-Tool (SQLAlchemy ≥ 2.0).
 """
 
 from __future__ import annotations
-from typing import List, Optional, Tuple
+import hashlib
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
 
-from sqlalchemy import select, update, delete, distinct, func, union
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, delete, distinct, func, tuple_, union
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
 
 import pandas as pd
 import numpy as np
 
 from db_schema import (
     ENGINE, Subject, Topic, Competence, SchoolClass, ClassCompetence,
-    CustomCompetence, Student, StudentSubject, Grade,
+    CustomCompetence, Student, StudentSubject, Grade, LatexCache,
 )
+from html_to_latex import CONVERTER_VERSION, html_to_latex_many
 
 # -------------------------------------------------------------------
 class _AutoSes:
-    def __init__(self, ses: Session | None = None):
+    def __init__(self, ses: Session | None = None, engine: Engine | None = None):
         self._ext = ses
+        self._engine = engine
         self.ses: Session | None = None
 
     def __enter__(self) -> Session:
         if self._ext is not None:
             self.ses = self._ext
             return self.ses
-        self.ses = Session(ENGINE)
+        self.ses = Session(self._engine or ENGINE)
         return self.ses
 
     def __exit__(self, exc_type, exc, tb):
@@ -112,19 +117,20 @@ def get_topics_by_subject(subject: str, ses: Session, class_name: str | None = N
         )
     return list(ses.scalars(stmt))
 
-def get_subjects() -> List[str]:
-    with Session(ENGINE) as ses:
+def get_subjects(engine: Engine | None = None) -> List[str]:
+    with Session(engine or ENGINE) as ses:
         return list(ses.scalars(select(Subject.name).order_by(Subject.name)))
 
-def get_blocks(subject: str) -> List[str]:
-    with Session(ENGINE) as ses:
+def get_blocks(subject: str, engine: Engine | None = None) -> List[str]:
+    with Session(engine or ENGINE) as ses:
         return list(ses.scalars(
             select(Topic.block).join(Subject, Topic.subject_id == Subject.id)
             .where(Subject.name == subject).distinct().order_by(Topic.block)
         ))
 
-def load_topic_rows(class_name: str, subject: str, block: str) -> List[Tuple[int, str, str, bool]]:
-    with Session(ENGINE) as ses:
+def load_topic_rows(class_name: str, subject: str, block: str,
+                    engine: Engine | None = None) -> List[Tuple[int, str, str, bool]]:
+    with Session(engine or ENGINE) as ses:
         school_class = _get_or_create_class(ses, class_name)
         stmt = (
             select(Competence.id, Topic.name, Competence.text, ClassCompetence.selected)
@@ -139,10 +145,11 @@ def load_topic_rows(class_name: str, subject: str, block: str) -> List[Tuple[int
         rows = ses.execute(stmt).all()
     return [(cid, topic, text, bool(sel)) for cid, topic, text, sel in rows]
 
-def save_selections(class_name: str, changes: List[Tuple[int, bool]]) -> None:
+def save_selections(class_name: str, changes: List[Tuple[int, bool]],
+                    engine: Engine | None = None) -> None:
     if not changes:
         return
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         cl = _get_or_create_class(ses, class_name)
         for comp_id, is_sel in changes:
             link = ses.scalars(
@@ -157,8 +164,9 @@ def save_selections(class_name: str, changes: List[Tuple[int, bool]]) -> None:
                 ses.add(ClassCompetence(class_id=cl.id, competence_id=comp_id, selected=is_sel))
         ses.commit()
 
-def toggle_topic(class_name: str, topic_id: int, value: bool) -> None:
-    with Session(ENGINE) as ses:
+def toggle_topic(class_name: str, topic_id: int, value: bool,
+                 engine: Engine | None = None) -> None:
+    with Session(engine or ENGINE) as ses:
         cl = _get_or_create_class(ses, class_name)
         comp_ids = [cid for (cid,) in ses.execute(
             select(Competence.id).where(Competence.topic_id == topic_id)
@@ -189,6 +197,16 @@ def get_niveau(student_id: int, subject_id: int, ses: Session) -> str:
         )
     ) or ""
 
+def get_niveaus(subject_id: int, student_ids: List[int], ses: Session) -> dict[int, str]:
+    """Batch variant of get_niveau: student_id → niveau for all given students."""
+    rows = ses.execute(
+        select(StudentSubject.student_id, StudentSubject.niveau).where(
+            (StudentSubject.subject_id == subject_id)
+            & (StudentSubject.student_id.in_(student_ids))
+        )
+    )
+    return {sid: niveau or "" for sid, niveau in rows}
+
 def set_niveau(student_id: int, subject_id: int, niveau: str, ses: Session):
     link = ses.scalars(
         select(StudentSubject).where(
@@ -202,13 +220,14 @@ def set_niveau(student_id: int, subject_id: int, niveau: str, ses: Session):
         link.niveau = niveau.strip()
     ses.commit()
 
-def sync_competences_to_parallel(source_class: str, target_classes: list[str] | None = None) -> list[str]:
+def sync_competences_to_parallel(source_class: str, target_classes: list[str] | None = None,
+                                 engine: Engine | None = None) -> list[str]:
     """Copy all ClassCompetence selections from source_class to every class
     in the same school year (same leading digit, e.g. 7a → 7b, 7c)."""
     year = next((ch for ch in source_class if ch.isdigit()), None)
     if not year:
         return []
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         src = _get_or_create_class(ses, source_class)
         all_in_year = [
             c for c in ses.scalars(select(SchoolClass)).all()
@@ -264,61 +283,306 @@ def delete_custom_competence(comp_id: int, ses: Session):
         ses.commit()
 
 # -------------------------------------------------------------------
-def fetch_grade_matrix(students: List[Student], topics: List[Topic], subject_name: str, ses: Session) -> pd.DataFrame:
+@dataclass
+class GradeMatrix:
+    """Grades and niveaus for one class × subject, keyed by ids (no DataFrame).
+
+    columns: (canonical topic, merged) in display order — merged is True when
+             several topics share the name and were coalesced into one column.
+    niveaus: student_id → niveau ("" when unset)
+    grades:  student_id → {canonical topic_id → value ("" when unset)}
+    versions: student_id → row version token (see grade_row_versions)
+    """
+    columns: list[tuple[Topic, bool]] = field(default_factory=list)
+    niveaus: dict[int, str] = field(default_factory=dict)
+    grades:  dict[int, dict[int, str]] = field(default_factory=dict)
+    versions: dict[int, str] = field(default_factory=dict)
+
+
+def _subject_id_or_raise(subject_name: str, ses: Session) -> int:
     subj_id = ses.scalar(select(Subject.id).where(Subject.name == subject_name))
     if subj_id is None:
         raise ValueError(f"Subject '{subject_name}' not found")
+    return subj_id
 
-    grade_rows = (
-        ses.query(Grade.student_id, Grade.topic_id, Grade.value)
-           .filter(Grade.student_id.in_([s.id for s in students]),
-                   Grade.topic_id.in_([t.id for t in topics]))
-           .all()
+def _grade_map(student_ids: List[int], topic_ids: List[int], ses: Session) -> dict[tuple[int, int], str]:
+    rows = ses.execute(
+        select(Grade.student_id, Grade.topic_id, Grade.value).where(
+            Grade.student_id.in_(student_ids) & Grade.topic_id.in_(topic_ids)
+        )
     )
-    gmap = {(sid, tid): val for sid, tid, val in grade_rows}
+    return {(sid, tid): val for sid, tid, val in rows}
+
+def _subject_grades(subject_id: int, student_ids: List[int], ses: Session) -> list[tuple[int, int, str]]:
+    """(student_id, topic_id, value) for every grade of the subject's topics."""
+    return [tuple(r) for r in ses.execute(
+        select(Grade.student_id, Grade.topic_id, Grade.value)
+        .join(Topic, Grade.topic_id == Topic.id)
+        .where((Topic.subject_id == subject_id) & Grade.student_id.in_(student_ids))
+    )]
+
+def _row_versions(student_ids: Iterable[int], niveaus: dict[int, str],
+                  grades: Iterable[tuple[int, int, str]]) -> dict[int, str]:
+    per_student: dict[int, list[tuple[int, str]]] = {sid: [] for sid in student_ids}
+    for sid, tid, val in grades:
+        if val and sid in per_student:
+            per_student[sid].append((tid, val))
+    versions = {}
+    for sid, cells in per_student.items():
+        h = hashlib.sha1(niveaus.get(sid, "").encode())
+        for tid, val in sorted(cells):
+            h.update(f"|{tid}={val}".encode())
+        versions[sid] = h.hexdigest()[:16]
+    return versions
+
+def grade_row_versions(subject_id: int, student_ids: List[int], ses: Session) -> dict[int, str]:
+    """student_id → version token over the student's niveau and all grades of the subject.
+
+    The token changes whenever any of those cells changes, so clients can send
+    it back with a delta save to detect concurrent edits (optimistic locking).
+    """
+    return _row_versions(student_ids, get_niveaus(subject_id, student_ids, ses),
+                         _subject_grades(subject_id, student_ids, ses))
+
+def load_grade_matrix(students: List[Student], topics: List[Topic], subject_name: str,
+                      ses: Session) -> GradeMatrix:
+    """Load the grade matrix in three queries regardless of class size.
+
+    Topics that share a name (e.g. "Arithmetik" in 5/6 and 7/8) are merged into
+    one column under the canonical topic (highest id = most recent block). An
+    empty canonical grade falls back to the first non-empty alias grade.
+    """
+    subj_id = _subject_id_or_raise(subject_name, ses)
+    stu_ids = [s.id for s in students]
+    subject_grades = _subject_grades(subj_id, stu_ids, ses)
+    gmap = {(sid, tid): val for sid, tid, val in subject_grades}
+
+    groups: dict[str, list[int]] = {}
+    for t in topics:
+        groups.setdefault(t.name, []).append(t.id)
+    topic_by_id = {t.id: t for t in topics}
+
+    # (canonical id, lookup order: canonical first, then aliases in topic order)
+    lookups: list[tuple[int, list[int]]] = []
+    matrix = GradeMatrix(niveaus=get_niveaus(subj_id, stu_ids, ses))
+    for ids in groups.values():
+        canon = max(ids)
+        lookups.append((canon, [canon] + [i for i in ids if i != canon]))
+        matrix.columns.append((topic_by_id[canon], len(ids) > 1))
+
+    for sid in stu_ids:
+        matrix.grades[sid] = {
+            canon: next((v for tid in order if (v := gmap.get((sid, tid)))), "")
+            for canon, order in lookups
+        }
+    matrix.versions = _row_versions(stu_ids, matrix.niveaus, subject_grades)
+    return matrix
+
+
+def fetch_grade_matrix(students: List[Student], topics: List[Topic], subject_name: str, ses: Session) -> pd.DataFrame:
+    subj_id = _subject_id_or_raise(subject_name, ses)
+    stu_ids = [s.id for s in students]
+    gmap = _grade_map(stu_ids, [t.id for t in topics], ses)
+    niveaus = get_niveaus(subj_id, stu_ids, ses)
 
     rows = []
     for stu in students:
         row = {"Nachname": stu.last_name, "Vorname": stu.first_name,
-               "Niveau": get_niveau(stu.id, subj_id, ses)}
+               "Niveau": niveaus.get(stu.id, "")}
         for tp in topics:
             row[str(tp.id)] = gmap.get((stu.id, tp.id), "")
         rows.append(row)
     return pd.DataFrame(rows)
 
 
-def persist_grade_matrix(class_name: str, subject_name: str, df: "pd.DataFrame", ses: Session) -> None:
-    cl = _get_or_create_class(ses, class_name)
-    stu_map = {(s.last_name, s.first_name): s for s in cl.students}
+def _insert_for(ses: Session, model):
+    """Dialect-specific INSERT that supports ON CONFLICT (PostgreSQL / SQLite)."""
+    if ses.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(model)
 
-    for _, row in df.iterrows():
-        stu = stu_map.get((row["Nachname"], row["Vorname"]))
-        if stu is None:
-            continue
+def upsert_niveaus(subject_id: int, niveaus: dict[int, Optional[str]], ses: Session) -> None:
+    """Set student_subject.niveau for many students in one statement (no commit).
+
+    HTML niveaus are rendered into latex_cache (ValueError if one cannot be
+    converted, see store_latex)."""
+    if not niveaus:
+        return
+    old = get_niveaus(subject_id, list(niveaus), ses)
+    stmt = _insert_for(ses, StudentSubject).values([
+        {"student_id": sid, "subject_id": subject_id, "niveau": niveau}
+        for sid, niveau in niveaus.items()
+    ])
+    ses.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "subject_id"],
+        set_={"niveau": stmt.excluded.niveau},
+    ))
+    store_latex(map(html_niveau, niveaus.values()), ses,
+                replaced=map(html_niveau, old.values()))
 
-        niveau = row["Niveau"] or None
-        link = (
-            ses.query(StudentSubject).filter_by(student_id=stu.id)
-               .join(Subject).filter(Subject.name == subject_name).first()
+def upsert_grades(grades: dict[tuple[int, int], str], ses: Session) -> None:
+    """Write {(student_id, topic_id): value} in one statement on uq_grade_student_topic (no commit)."""
+    if not grades:
+        return
+    stmt = _insert_for(ses, Grade).values([
+        {"student_id": sid, "topic_id": tid, "value": value}
+        for (sid, tid), value in grades.items()
+    ])
+    ses.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "topic_id"],
+        set_={"value": stmt.excluded.value},
+    ))
+
+def apply_grade_changes(subject_id: int, grades: dict[tuple[int, int], str],
+                        niveaus: dict[int, str], ses: Session) -> None:
+    """Write a delta of cells (no commit). Values are cleaned like the full
+    save (_clean_grade); an empty value clears the cell.
+
+    A merged column shows the first non-empty grade of all same-name topics
+    (see load_grade_matrix), so clearing it deletes the grades of every topic
+    of that name in the subject, not only the canonical one.
+    """
+    grades = {k: _clean_grade(v) for k, v in grades.items()}
+    upsert_grades({k: v for k, v in grades.items() if v}, ses)
+    cleared = [k for k, v in grades.items() if not v]
+    if cleared:
+        cell = aliased(Topic)
+        merged = (
+            select(Grade.id)
+            .join(Topic, Grade.topic_id == Topic.id)
+            .join(cell, (cell.subject_id == Topic.subject_id) & (cell.name == Topic.name))
+            .where(Topic.subject_id == subject_id,
+                   tuple_(Grade.student_id, cell.id).in_(cleared))
         )
-        if link is None:
-            subj = ses.query(Subject).filter_by(name=subject_name).first()
-            if subj is None:
-                continue
-            ses.add(StudentSubject(student=stu, subject=subj, niveau=niveau))
-        else:
-            link.niveau = niveau
+        ses.execute(delete(Grade).where(Grade.id.in_(merged)))
+    upsert_niveaus(subject_id, {sid: n or None for sid, n in niveaus.items()}, ses)
 
-        for col_id, raw_val in row.items():
-            if col_id in ("Nachname", "Vorname", "Niveau") or raw_val == "":
+def save_grade_matrix(class_name: str, subject_name: str,
+                      rows: Iterable[Tuple[str, str, Optional[str], dict]], ses: Session) -> None:
+    """Upsert niveaus and grades for a class × subject in a single transaction.
+
+    rows: (last_name, first_name, niveau, {topic_id: value}). Unknown students
+    and empty cells are skipped; an empty cell never clears a stored grade.
+    """
+    cl = _get_or_create_class(ses, class_name)
+    stu_ids = {
+        (last, first): sid
+        for sid, last, first in ses.execute(
+            select(Student.id, Student.last_name, Student.first_name)
+            .where(Student.class_id == cl.id)
+        )
+    }
+    subj_id = ses.scalar(select(Subject.id).where(Subject.name == subject_name))
+
+    niveaus: dict[int, Optional[str]] = {}
+    grades: dict[tuple[int, int], str] = {}
+    for last, first, niveau, cells in rows:
+        sid = stu_ids.get((last, first))
+        if sid is None:
+            continue
+        niveaus[sid] = niveau or None
+        for col_id, raw_val in cells.items():
+            if raw_val is None or raw_val == "":
                 continue
             try:
                 topic_id = int(col_id)
             except (ValueError, TypeError):
                 continue
-            grade_row = ses.query(Grade).filter_by(student_id=stu.id, topic_id=topic_id).first()
-            if grade_row:
-                grade_row.value = _clean_grade(raw_val).strip()
-            else:
-                ses.add(Grade(student_id=stu.id, topic_id=topic_id, value=_clean_grade(raw_val).strip()))
+            grades[(sid, topic_id)] = _clean_grade(raw_val).strip()
+
+    if subj_id is not None:
+        upsert_niveaus(subj_id, niveaus, ses)
+    upsert_grades(grades, ses)
+    ses.commit()
+
+
+def persist_grade_matrix(class_name: str, subject_name: str, df: "pd.DataFrame", ses: Session) -> None:
+    """DataFrame front-end for save_grade_matrix (columns Nachname/Vorname/Niveau/<topic_id>)."""
+    meta = ("Nachname", "Vorname", "Niveau")
+    save_grade_matrix(class_name, subject_name, (
+        (rec["Nachname"], rec["Vorname"], rec["Niveau"],
+         {k: v for k, v in rec.items() if k not in meta})
+        for rec in df.to_dict("records")
+    ), ses)
+
+
+# -------------------------------------------------------------------
+# Precomputed LaTeX of rich-text fields (latex_cache)
+#
+# report_text and remarks are rendered whenever saved, niveaus only when
+# they are HTML (LB/GB texts; the export prints short niveaus as they are).
+# Entries are keyed by content hash, so identical texts share one row; an
+# entry is dropped once its text is replaced everywhere.  Rows rendered by
+# another converter version are never hit and are purged at startup.
+# -------------------------------------------------------------------
+def latex_digest(html: str) -> str:
+    """latex_cache key: the text and the converter version it was rendered by."""
+    return hashlib.sha256(f"{CONVERTER_VERSION}\0{html}".encode()).hexdigest()
+
+def html_niveau(niveau: Optional[str]) -> str:
+    """The niveau as the export converts it: stripped HTML, else ""."""
+    niveau = (niveau or "").strip()
+    return niveau if niveau.startswith("<") else ""
+
+def store_latex(htmls: Iterable[Optional[str]], ses: Session,
+                replaced: Iterable[Optional[str]] = ()) -> None:
+    """Render *htmls* (cell and body mode) into latex_cache unless present, and
+    drop the entries of *replaced* texts no longer stored anywhere (no commit).
+
+    Raises ValueError when a text cannot be converted, so it is rejected on
+    save rather than failing the export.
+    """
+    new = {latex_digest(h): h for h in dict.fromkeys(htmls) if h}
+    if new:
+        have = set(ses.scalars(
+            select(LatexCache.digest).where(LatexCache.digest.in_(list(new)))
+        ))
+        todo = [h for d, h in new.items() if d not in have]
+        if todo:
+            try:
+                cells = html_to_latex_many(todo)
+                bodies = html_to_latex_many(todo, par_mode=True)
+            except Exception as e:
+                raise ValueError(str(e) or type(e).__name__) from e
+            stmt = _insert_for(ses, LatexCache).values([
+                {"digest": latex_digest(h), "cell": cell, "body": body,
+                 "converter_version": CONVERTER_VERSION}
+                for h, cell, body in zip(todo, cells, bodies)
+            ])
+            ses.execute(stmt.on_conflict_do_nothing(index_elements=["digest"]))
+
+    old = {h for h in replaced if h} - set(new.values())
+    if old:
+        ses.flush()
+        niveau = func.trim(StudentSubject.niveau)
+        used = set(ses.scalars(union(
+            select(Student.report_text).where(Student.report_text.in_(old)),
+            select(Student.remarks).where(Student.remarks.in_(old)),
+            select(niveau).where(niveau.in_(old)),
+        )))
+        gone = [latex_digest(h) for h in old - used]
+        if gone:
+            ses.execute(delete(LatexCache).where(LatexCache.digest.in_(gone)))
+
+def purge_stale_latex(engine: Engine) -> int:
+    """Delete latex_cache rows rendered by another CONVERTER_VERSION."""
+    with Session(engine) as ses:
+        n = ses.execute(delete(LatexCache)
+                        .where(LatexCache.converter_version != CONVERTER_VERSION)).rowcount
         ses.commit()
+    return n
+
+def load_latex(htmls: Iterable[str], ses: Session) -> dict[str, tuple[str, str]]:
+    """html → (cell, body) for every text of *htmls* found in latex_cache."""
+    by_digest = {latex_digest(h): h for h in dict.fromkeys(htmls) if h}
+    if not by_digest:
+        return {}
+    return {
+        by_digest[d]: (cell, body)
+        for d, cell, body in ses.execute(
+            select(LatexCache.digest, LatexCache.cell, LatexCache.body)
+            .where(LatexCache.digest.in_(list(by_digest)))
+        )
+    }
@@ -3,10 +3,14 @@
 from __future__ import annotations
 import os
 import sys
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List
 
 from sqlalchemy import (create_engine, Column, Integer, String, Date, Boolean,
                         ForeignKey, UniqueConstraint, text)
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, relationship, Session
 from competence_data import COMPETENCES, SUBJECTS as _SUBJECTS
 
@@ -37,40 +41,111 @@ def _make_engine(db_name: str):
     return create_engine(url, echo=False, future=True)
 
 
-ENGINE = _make_engine("postgres")  # maintenance DB; overridden immediately by switch_engine / db_cli
+# One pooled engine on the maintenance DB, shared by everything that talks to
+# /postgres: the report-DB list, CREATE/DROP DATABASE and admin_users (the
+# export job store has its own pool, see export_jobs).  Pre-ping replaces
+# connections that died with a Postgres restart instead of failing a request.
+MAINT_ENGINE = create_engine(f"{_pg_base_url()}/postgres", echo=False, future=True,
+                             pool_pre_ping=True)
+
+ENGINE = MAINT_ENGINE  # default for CLI scripts / switch_engine
 
 Base = declarative_base()
 
 
+# ---------------------------------------------------------------------------
+# Engine registry — one pooled engine per report database
+# ---------------------------------------------------------------------------
+# Requests resolve their engine from the X-Active-DB header via get_engine()
+# instead of mutating the process-global ENGINE, so concurrent requests (and
+# several uvicorn workers) can work on different report databases at once.
+
+ENGINE_CACHE_SIZE = int(os.environ.get("DB_ENGINE_CACHE_SIZE", "8"))
+
+_engines: "OrderedDict[str, Engine]" = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def _open_engine(db_name: str) -> Engine:
+    """Create an engine and make sure the DB schema is migrated.
+
+    Migrations run at most once per DB per process (see migrations.ensure_migrated);
+    reopening an already verified DB does not touch the database at all.
+    """
+    import migrations as _mig
+
+    eng = _make_engine(db_name)
+    try:
+        _mig.ensure_migrated(eng)
+    except Exception as exc:
+        print(f"❌  Could not connect to {db_name}: {exc}")
+        eng.dispose()
+        raise
+    return eng
+
+
+def get_engine(db_name: str) -> Engine:
+    """Return the pooled engine for *db_name*, creating it on first use.
+
+    The registry is an LRU bounded by ENGINE_CACHE_SIZE; evicted engines are
+    disposed (closing their idle pooled connections).
+    """
+    with _engines_lock:
+        eng = _engines.get(db_name)
+        if eng is not None:
+            _engines.move_to_end(db_name)
+            return eng
+
+    # Opening may hit the network — don't hold the lock for other DBs meanwhile
+    new = _open_engine(db_name)
+
+    evicted: List[Engine] = []
+    with _engines_lock:
+        eng = _engines.get(db_name)
+        if eng is None:
+            eng = _engines[db_name] = new
+            while len(_engines) > ENGINE_CACHE_SIZE:
+                evicted.append(_engines.popitem(last=False)[1])
+        else:
+            # another request opened the same DB concurrently
+            _engines.move_to_end(db_name)
+            evicted.append(new)
+
+    for old in evicted:
+        if old is not ENGINE:
+            old.dispose()
+    return eng
+
+
+def dispose_engine(db_name: str) -> None:
+    """Drop *db_name* from the registry (e.g. before DROP DATABASE)."""
+    import migrations as _mig
+
+    with _engines_lock:
+        eng = _engines.pop(db_name, None)
+    if eng is not None and eng is not ENGINE:
+        eng.dispose()
+    _mig.forget_verified(db_name)
+
+
 def switch_engine(db_name: str) -> None:
-    """Point ENGINE (and dependent modules) at a different PostgreSQL database."""
+    """Point the default ENGINE (and dependent modules) at a different database.
+
+    Only CLI scripts and legacy call sites rely on the default ENGINE; request
+    handlers get their engine from get_engine() via deps.get_db.
+    """
     global ENGINE
 
     if ENGINE.url.database == db_name:
         return
 
-    ENGINE = _make_engine(db_name)
+    ENGINE = get_engine(db_name)
 
     # propagate to all modules that imported ENGINE at load time
     for m in ("student_loader", "db_helpers", "export", "generate_test_data"):
         if m in sys.modules:
             sys.modules[m].ENGINE = ENGINE
 
-    try:
-        with ENGINE.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        print(f"✅  ENGINE switched to {db_name}")
-    except Exception as exc:
-        print(f"❌  Could not connect to {db_name}: {exc}")
-        raise
-
-    # Run any pending schema migrations on the newly selected DB
-    try:
-        import migrations as _mig
-        _mig.run_migrations(str(ENGINE.url))
-    except Exception as exc:
-        print(f"⚠️  migrations skipped for {db_name}: {exc}")
-
 
 # ---------------------------------------------------------------------------
 # PostgreSQL database management (list / create report databases)
@@ -83,31 +158,73 @@ def suggest_db_name(term: str) -> str:
     return f"reports_{y1}_{y2[2:]}_{term}"
 
 
-def list_report_dbs() -> list[str]:
-    """Return all PostgreSQL databases whose name starts with 'reports_'."""
-    admin_url = f"{_pg_base_url()}/postgres"
-    eng = create_engine(admin_url, future=True)
-    try:
-        with eng.connect() as conn:
-            rows = conn.execute(text(
-                "SELECT datname FROM pg_database "
-                "WHERE datname LIKE 'reports_%' "
-                "ORDER BY datname"
-            ))
-            return [r[0] for r in rows]
-    finally:
-        eng.dispose()
+# The report-DB list is read on every visit of the public landing page; keep
+# it for REPORT_DBS_TTL seconds.  create/drop in this process invalidate it,
+# the TTL bounds how long other workers may miss a change.
+REPORT_DBS_TTL = float(os.environ.get("REPORT_DBS_TTL", "10"))
+
+_report_dbs: tuple[float, list[str]] | None = None
+_report_dbs_gen = 0
+_report_dbs_lock = threading.Lock()
+
+
+def forget_report_dbs() -> None:
+    """Invalidate the cached report-DB list."""
+    global _report_dbs, _report_dbs_gen
+    with _report_dbs_lock:
+        _report_dbs = None
+        _report_dbs_gen += 1
+
+
+def list_report_dbs(fresh: bool = False) -> list[str]:
+    """Return all PostgreSQL databases whose name starts with 'reports_'.
+
+    Served from the cache when it is younger than REPORT_DBS_TTL, unless
+    *fresh* is set.
+    """
+    global _report_dbs
+    with _report_dbs_lock:
+        cached, gen = _report_dbs, _report_dbs_gen
+    if not fresh and cached is not None and time.monotonic() - cached[0] < REPORT_DBS_TTL:
+        return list(cached[1])
+
+    with MAINT_ENGINE.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT datname FROM pg_database "
+            "WHERE datname LIKE 'reports_%' "
+            "ORDER BY datname"
+        ))
+        names = [r[0] for r in rows]
+    with _report_dbs_lock:
+        if gen == _report_dbs_gen:  # no create/drop while we were querying
+            _report_dbs = (time.monotonic(), names)
+    return list(names)
+
+
+def _maint_ddl(sql: str) -> None:
+    """Run *sql* outside a transaction (CREATE/DROP DATABASE) on MAINT_ENGINE."""
+    with MAINT_ENGINE.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(sql))
 
 
 def create_report_db(db_name: str) -> None:
     """Create a new PostgreSQL database for a report period."""
-    admin_url = f"{_pg_base_url()}/postgres"
-    eng = create_engine(admin_url, isolation_level="AUTOCOMMIT", future=True)
     try:
-        with eng.connect() as conn:
-            conn.execute(text(f'CREATE DATABASE "{db_name}"'))
+        _maint_ddl(f'CREATE DATABASE "{db_name}"')
     finally:
-        eng.dispose()
+        forget_report_dbs()
+
+
+def drop_report_db(db_name: str) -> None:
+    """Drop a report database (closing this process's pooled connections first)."""
+    # idle pooled connections would otherwise block DROP DATABASE; this
+    # process's are closed cleanly, FORCE (PostgreSQL 13+) terminates those
+    # of the other workers
+    dispose_engine(db_name)
+    try:
+        _maint_ddl(f'DROP DATABASE IF EXISTS "{db_name}" WITH (FORCE)')
+    finally:
+        forget_report_dbs()
 
 
 # ---------------------------------------------------------------------------
@@ -245,6 +362,16 @@ class AdminUser(Base):
     password_hash = Column(String, nullable=False)
 
 
+class LatexCache(Base):
+    """Rendered LaTeX of a rich-text value (report text, remarks, HTML niveau),
+    keyed by the SHA-256 of the HTML.  Written on save, read by the export."""
+    __tablename__ = "latex_cache"
+    digest = Column(String(64), primary_key=True)
+    cell   = Column(String, nullable=False)   # html_to_latex(html)
+    body   = Column(String, nullable=False)   # html_to_latex(html, par_mode=True)
+    converter_version = Column(Integer, nullable=False)   # html_to_latex.CONVERTER_VERSION
+
+
 class Grade(Base):
     __tablename__ = "grades"
     id         = Column(Integer, primary_key=True)
@@ -271,8 +398,8 @@ DEFAULT_CLASSES = [
 ]
 
 
-def ensure_default_classes() -> None:
-    with Session(ENGINE) as ses:
+def ensure_default_classes(engine: Engine | None = None) -> None:
+    with Session(engine or ENGINE) as ses:
         existing = {c.name for c in ses.query(SchoolClass)}
         for cname in DEFAULT_CLASSES:
             if cname not in existing:
@@ -280,12 +407,13 @@ def ensure_default_classes() -> None:
         ses.commit()
 
 
-def ensure_school_year_entry() -> None:
+def ensure_school_year_entry(engine: Engine | None = None) -> None:
     """
     Adds/updates a SchoolYear row matching the current database name.
     Reads hj/ej suffix from the PostgreSQL database name, e.g. 'reports_2025_26_hj'.
     """
-    db_name = (ENGINE.url.database or "").lower()
+    engine = engine or ENGINE
+    db_name = (engine.url.database or "").lower()
     suffix  = db_name[-2:]   # "hj" | "ej"
     is_ej   = suffix == "ej"
 
@@ -296,7 +424,7 @@ def ensure_school_year_entry() -> None:
     )
     rep_date = datetime.strptime(rep_str, "%d.%m.%Y").date()
 
-    with Session(ENGINE) as ses:
+    with Session(engine) as ses:
         sy = (
             ses.query(SchoolYear)
                .filter_by(name=get_school_year(), endjahr=is_ej)
@@ -340,26 +468,27 @@ def populate_from_dict(comp_dict: Dict, session: Session) -> None:
     session.commit()
 
 
-def init_db(drop: bool = False, *, populate: bool = True) -> None:
+def init_db(drop: bool = False, *, populate: bool = True, engine: Engine | None = None) -> None:
     """
-    Create (and optionally drop) the schema in the current ENGINE database.
+    Create (and optionally drop) the schema in *engine* (default: ENGINE).
     Safe to call repeatedly – create_all / drop_all are idempotent.
     """
+    engine = engine or ENGINE
     if drop:
-        Base.metadata.drop_all(ENGINE)
+        Base.metadata.drop_all(engine)
 
-    Base.metadata.create_all(ENGINE)
-    ensure_default_classes()
+    Base.metadata.create_all(engine)
+    ensure_default_classes(engine)
 
     try:
-        ensure_school_year_entry()
+        ensure_school_year_entry(engine)
     except Exception as e:
         # Holiday fetching can fail (no internet, timeout) — not fatal.
         # The report day can be set manually in the Admin UI.
         print(f"⚠️  Schuljahr-Eintrag übersprungen: {e}")
 
     if populate:
-        with Session(ENGINE) as ses:
+        with Session(engine) as ses:
             populate_from_dict(COMPETENCES, ses)
             # Ensure every SUBJECTS entry has a Subject row (e.g. Lebenspraxis has no competences)
             for name in _SUBJECTS:
@@ -367,4 +496,4 @@ def init_db(drop: bool = False, *, populate: bool = True) -> None:
                     ses.add(Subject(name=name))
             ses.commit()
 
-    print(f"✅  Schema{' + Daten' if populate else ''} OK für {ENGINE.url.database}")
+    print(f"✅  Schema{' + Daten' if populate else ''} OK für {engine.url.database}")
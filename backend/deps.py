@@ -1,7 +1,11 @@
 # deps.py — FastAPI shared dependencies
 from __future__ import annotations
 
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -14,17 +18,22 @@ import db_schema
 JWT_SECRET  = os.environ.get("JWT_SECRET", "change-me-in-production")
 JWT_ALG     = "HS256"
 JWT_EXPIRE  = int(os.environ.get("JWT_EXPIRE_HOURS", "8"))
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "1024"))
 
 
 # ---------------------------------------------------------------------------
-# DB session: reads X-Active-DB header, switches ENGINE, yields session
+# DB session: reads X-Active-DB header, resolves that DB's engine, yields session
 # ---------------------------------------------------------------------------
 
 def get_db(request: Request):
+    """Yield a session bound to the report DB named in X-Active-DB.
+
+    Helpers that open their own sessions receive the same engine through
+    ``db.get_bind()``, so nothing depends on the process-global ENGINE.
+    """
     active_db = request.headers.get("x-active-db")
-    if active_db:
-        db_schema.switch_engine(active_db)
-    with Session(db_schema.ENGINE) as session:
+    engine = db_schema.get_engine(active_db) if active_db else db_schema.ENGINE
+    with Session(engine) as session:
         yield session
 
 
@@ -37,36 +46,86 @@ def create_token(username: str, role: str = "admin") -> str:
     return jwt.encode({"sub": username, "role": role, "exp": expire}, JWT_SECRET, algorithm=JWT_ALG)
 
 
+# Verified tokens: token → (sub, role, exp).  A session sends the same cookie
+# with every request, so the signature is checked once per token and process;
+# entries are dropped at their exp and evicted LRU beyond JWT_CACHE_SIZE.
+# Invalid tokens are not cached.
+_token_cache: "OrderedDict[str, tuple[str, str, float]]" = OrderedDict()
+_token_lock = threading.Lock()
+
+
+def token_cache_clear() -> None:
+    with _token_lock:
+        _token_cache.clear()
+
+
 def _decode_token(token: str) -> Optional[tuple[str, str]]:
+    now = time.time()
+    with _token_lock:
+        hit = _token_cache.get(token)
+        if hit is not None:
+            if hit[2] > now:
+                _token_cache.move_to_end(token)
+                return hit[0], hit[1]
+            del _token_cache[token]
+            return None
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
         sub = payload.get("sub")
         role = payload.get("role", "admin")
         if not sub:
             return None
-        return sub, role
     except JWTError:
         return None
+    if JWT_CACHE_SIZE > 0:
+        exp = float(payload.get("exp", math.inf))
+        with _token_lock:
+            _token_cache[token] = (sub, role, exp)
+            _token_cache.move_to_end(token)
+            while len(_token_cache) > JWT_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return sub, role
+
+
+def _principal(request: Optional[Request], token: str) -> Optional[tuple[str, str]]:
+    """(username, role) for *token*, resolved once per request: every auth
+    dependency of the request (router-level and endpoint-level) shares it."""
+    if request is None:
+        return _decode_token(token)
+    cached = getattr(request.state, "principal", None)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    result = _decode_token(token)
+    request.state.principal = (token, result)
+    return result
 
 
 # ---------------------------------------------------------------------------
 # Auth dependency — reads httpOnly cookie
 # ---------------------------------------------------------------------------
 
-def get_current_user(access_token: Optional[str] = Cookie(default=None)) -> str:
+def hash_pool_busy(detail: str = "Server ausgelastet – bitte gleich erneut versuchen") -> HTTPException:
+    """503 for auth_pure.HashPoolBusy (this worker's password hashing queue is full)."""
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail,
+                         headers={"Retry-After": "2"})
+
+
+def get_current_user(access_token: Optional[str] = Cookie(default=None),
+                     request: Request = None) -> str:
     if not access_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    result = _decode_token(access_token)
+    result = _principal(request, access_token)
     if not result:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
     return result[0]
 
 
-def get_current_admin(access_token: Optional[str] = Cookie(default=None)) -> str:
+def get_current_admin(access_token: Optional[str] = Cookie(default=None),
+                      request: Request = None) -> str:
     """Like get_current_user but raises 403 if the caller is not an admin."""
     if not access_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    result = _decode_token(access_token)
+    result = _principal(request, access_token)
     if not result:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
     username, role = result
@@ -75,15 +134,17 @@ def get_current_admin(access_token: Optional[str] = Cookie(default=None)) -> str
     return username
 
 
-def optional_user(access_token: Optional[str] = Cookie(default=None)) -> Optional[str]:
+def optional_user(access_token: Optional[str] = Cookie(default=None),
+                  request: Request = None) -> Optional[str]:
     if not access_token:
         return None
-    result = _decode_token(access_token)
+    result = _principal(request, access_token)
     return result[0] if result else None
 
 
-def optional_user_role(access_token: Optional[str] = Cookie(default=None)) -> Optional[tuple[str, str]]:
+def optional_user_role(access_token: Optional[str] = Cookie(default=None),
+                       request: Request = None) -> Optional[tuple[str, str]]:
     """Returns (username, role) or None."""
     if not access_token:
         return None
-    return _decode_token(access_token)
+    return _principal(request, access_token)
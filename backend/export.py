@@ -9,18 +9,29 @@ from __future__ import annotations
   history.
 """
 
+import hashlib
 import json
+import logging
+import os
+import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Set, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import select
 
-from html_to_latex import html_to_latex
+from html_to_latex import html_to_latex, html_to_latex_many
+from db_helpers import html_niveau, load_latex
 from db_schema import (
     ENGINE,
     Student,
@@ -29,9 +40,13 @@ from db_schema import (
     SchoolClass,
     ClassCompetence,
     CustomCompetence,
+    StudentSubject,
     Subject,
+    Topic,
 )
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
 # Helpers / filenames -------------------------------------------------------
 # ---------------------------------------------------------------------------
@@ -50,40 +65,95 @@ def _root_dir(sy: SchoolYear, classroom: str = "") -> Path:
     return d
 
 
-def _copy_template(dst: Path) -> None:
+def _copy_template(dst: Path) -> int:
+    """Deploy TexTemplate into *dst*; returns the number of files written.
+
+    Files whose size and mtime match the deployed copy are left alone.
+    Changed files are copied to a temp name and renamed into place, so a
+    lualatex run reading the old file is never handed a half-written one."""
     src = Path.cwd() / "TexTemplate"
     if not src.exists():
         raise FileNotFoundError("TexTemplate directory missing.")
-    for itm in src.iterdir():
-        tgt = dst / itm.name
-        if itm.is_dir():
-            shutil.copytree(itm, tgt, dirs_exist_ok=True)
-        else:
-            shutil.copy2(itm, tgt)
+    written = 0
+    for itm in src.rglob("*"):
+        if not itm.is_file():
+            continue
+        tgt = dst / itm.relative_to(src)
+        st = itm.stat()
+        try:
+            cur = tgt.stat()
+            if cur.st_size == st.st_size and cur.st_mtime_ns == st.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+        tgt.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tgt.with_name(f".{tgt.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        shutil.copy2(itm, tmp)
+        os.replace(tmp, tgt)
+        written += 1
+    return written
 
 # ---------------------------------------------------------------------------
 # Lua serializer ------------------------------------------------------------
 # ---------------------------------------------------------------------------
 
-def _lua(obj: Any, ind: int = 0) -> str:
-    sp = " " * ind
-    if isinstance(obj, dict):
-        if not obj:
-            return "{}"
-        body = ",\n".join(f"{sp}  {k} = {_lua(v, ind+2)}" for k, v in obj.items())
-        return f"{{\n{body},\n{sp}}}"
-    if isinstance(obj, list):
-        if not obj:
-            return "{}"
-        body = ",\n".join(_lua(v, ind+2) for v in obj)
-        return f"{{\n{body},\n{sp}}}"
-    if isinstance(obj, str):
-        esc = obj.replace("\\", "\\\\")
-        esc = esc.replace("\n", "\\\\")
-        esc = esc.replace("\r", "\\r")
-        esc = esc.replace("'", "\\'")
-        return f"'{esc}'"
-    return json.dumps(obj)
+# Written with an explicit stack of open tables into one list (no recursion,
+# no per-level joins), so deep or very long tables serialise in linear time.
+# Strings are single-quoted; backslash, newline (written as \\), CR and quote
+# are escaped.  EXPORT_LUA_COMPACT=1 drops indentation and line breaks.
+
+EXPORT_LUA_COMPACT = os.environ.get("EXPORT_LUA_COMPACT", "0") != "0"
+
+_LUA_CONST = {True: "true", False: "false", None: "null"}
+
+
+def _lua_scalar(v: Any) -> str:
+    t = type(v)
+    if t is str:
+        # chained replace beats str.translate here: translate takes a slow
+        # path for non-ASCII text, i.e. almost every German report text
+        return "'" + (v.replace("\\", "\\\\").replace("\n", "\\\\")
+                      .replace("\r", "\\r").replace("'", "\\'")) + "'"
+    if t is bool or v is None:
+        return _LUA_CONST[v]
+    if t is int:
+        return str(v)
+    return json.dumps(v)
+
+
+def _lua_frame(obj: dict | list, ind: int, compact: bool, tail: str = "") -> tuple:
+    """Stack entry for an open table: (items, is_dict, key indent, closing text)."""
+    is_dict = isinstance(obj, dict)
+    pad = "" if compact else " " * ind
+    return (iter(obj.items() if is_dict else obj), is_dict,
+            "" if compact else pad + "  ", pad + "}" + tail)
+
+
+def _lua(obj: Any, ind: int = 0, compact: bool | None = None) -> str:
+    if compact is None:
+        compact = EXPORT_LUA_COMPACT
+    if not isinstance(obj, (dict, list)):
+        return _lua_scalar(obj)
+    if not obj:
+        return "{}"
+    sep, open_ = (",", "{") if compact else (",\n", "{\n")
+    out: list[str] = [open_]
+    stack = [_lua_frame(obj, ind, compact)]
+    while stack:
+        items, is_dict, pad, _ = stack[-1]
+        for v in items:
+            if is_dict:
+                k, v = v
+                out.append(f"{k}=" if compact else f"{pad}{k} = ")
+            if isinstance(v, (dict, list)) and v:
+                out.append(open_)
+                stack.append(_lua_frame(v, len(pad), compact, sep))
+                break
+            out.append("{}" if isinstance(v, (dict, list)) else _lua_scalar(v))
+            out.append(sep)
+        else:
+            out.append(stack.pop()[3])
+    return "".join(out)
 
 # ---------------------------------------------------------------------------
 # Grade helper --------------------------------------------------------------
@@ -171,7 +241,82 @@ SUBJECT_ORDER = [
 _SUBJECT_RANK = {name: i for i, name in enumerate(SUBJECT_ORDER)}
 
 
-def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Session) -> str:
+# ---------------------------------------------------------------------------
+# Class-level prefetch: everything _student_to_lua reads, loaded for all
+# exported students in a fixed number of queries (students + class, subject
+# links + subjects, topics, competences, grades, custom competences).  The
+# rich-text fields are read from latex_cache (rendered on save); texts not
+# found there are converted in one html_to_latex_many call per par_mode.
+# ---------------------------------------------------------------------------
+
+@dataclass
+class ExportPrefetch:
+    grades: Dict[int, Dict[int, Any]] = field(default_factory=dict)   # student → topic → grade
+    customs: Dict[int, Dict[int, List[str]]] = field(default_factory=dict)  # class → topic → texts
+    latex: Dict[Tuple[str, bool], str] = field(default_factory=dict)  # (html, par_mode) → LaTeX
+
+    def to_latex(self, html: str, par_mode: bool = False) -> str:
+        hit = self.latex.get((html, par_mode))
+        return hit if hit is not None else html_to_latex(html, par_mode=par_mode)
+
+
+def _load_students(ses: Session, student_ids: List[int]) -> List[Student]:
+    return list(ses.scalars(
+        select(Student)
+        .where(Student.id.in_(student_ids))
+        .options(
+            joinedload(Student.school_class),
+            selectinload(Student.subjects)
+            .joinedload(StudentSubject.subject)
+            .selectinload(Subject.topics)
+            .selectinload(Topic.competences),
+        )
+        .order_by(Student.last_name, Student.first_name)
+    ))
+
+
+def _prefetch(ses: Session, students: List[Student], latex: bool = True) -> ExportPrefetch:
+    pre = ExportPrefetch(grades={stu.id: {} for stu in students})
+    if not students:
+        return pre
+    for sid, tid, val in ses.execute(
+        select(Grade.student_id, Grade.topic_id, Grade.value)
+        .where(Grade.student_id.in_(list(pre.grades)))
+    ):
+        pre.grades[sid][tid] = _numeric_or_str(val)
+    for cid, tid, txt in ses.execute(
+        select(CustomCompetence.class_id, CustomCompetence.topic_id, CustomCompetence.text)
+        .where(CustomCompetence.class_id.in_(list({stu.class_id for stu in students})))
+        .order_by(CustomCompetence.id)
+    ):
+        pre.customs.setdefault(cid, {}).setdefault(tid, []).append(txt)
+    if latex:
+        _prefetch_latex(ses, pre, students)
+    return pre
+
+
+def _prefetch_latex(ses: Session, pre: ExportPrefetch, students: List[Student]) -> None:
+    """LaTeX of the report texts, remarks and HTML niveaus of *students* into
+    pre.latex: precomputed where available, converted otherwise."""
+    texts = [t for stu in students for t in (stu.report_text or "", stu.remarks or "")]
+    levels = [lvl for stu in students for link in stu.subjects
+              if (lvl := html_niveau(link.niveau))]
+    stored = load_latex(texts + levels, ses)
+    for html, (cell, body) in stored.items():
+        pre.latex[(html, False)] = cell
+        pre.latex[(html, True)] = body
+    texts = [t for t in texts if t not in stored]
+    levels = [lvl for lvl in levels if lvl not in stored]
+    pre.latex.update(((t, True), out) for t, out in zip(texts, html_to_latex_many(texts, True)))
+    pre.latex.update(((t, False), out) for t, out in zip(levels, html_to_latex_many(levels)))
+
+
+def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Session,
+                    prefetch: ExportPrefetch | None = None) -> str:
+    """Lua data file for one student.  Pass *prefetch* (from _prefetch) when
+    exporting many students; without it grades/customs are queried here."""
+    if prefetch is None:
+        prefetch = _prefetch(ses, [stu])
     data: Dict[str, Any] = {
         "first_name": stu.first_name,
         "last_name": stu.last_name,
@@ -180,8 +325,8 @@ def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Sessi
         "school_year": sy.name,
         "part_of_year": "Endjahr" if sy.endjahr else "Halbjahr",
         "report_date": sy.report_day.strftime("%d.%m.%Y") if sy.report_day else "",
-        "personal_text": html_to_latex(stu.report_text or "", par_mode=True),
-        "comment": html_to_latex(stu.remarks or "", par_mode=True),
+        "personal_text": prefetch.to_latex(stu.report_text or "", par_mode=True),
+        "comment": prefetch.to_latex(stu.remarks or "", par_mode=True),
         "absenceDaysTotal": (stu.days_absent_excused or 0) + (stu.days_absent_unexcused or 0),
         "absenceDaysUnauthorized": stu.days_absent_unexcused or 0,
         "absenceHoursTotal": (stu.lessons_absent_excused or 0) + (stu.lessons_absent_unexcused or 0),
@@ -191,12 +336,9 @@ def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Sessi
         "subjects": [],
     }
 
-    grade_map = {g.topic_id: _numeric_or_str(g.value) for g in ses.query(Grade).filter_by(student_id=stu.id)}
-
+    grade_map = prefetch.grades.get(stu.id, {})
     # Custom competences for this class, grouped by topic_id
-    custom_by_topic: Dict[int, List[str]] = {}
-    for cc in ses.query(CustomCompetence).filter_by(class_id=stu.school_class.id):
-        custom_by_topic.setdefault(cc.topic_id, []).append(cc.text)
+    custom_by_topic = prefetch.customs.get(stu.school_class.id, {})
 
     want_wp = stu.school_class.name.startswith("7")
 
@@ -215,7 +357,7 @@ def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Sessi
             # tabularray X[l] cell without affecting surrounding content.
             level_val = (
                 r"{\setstretch{1.15}\setlength{\parskip}{4pt}"
-                + html_to_latex(raw_level) + "}"
+                + prefetch.to_latex(raw_level) + "}"
             )
         elif long_level_text:
             level_val = format_level_text(raw_level)
@@ -265,9 +407,11 @@ def _student_to_lua(stu: Student, sy: SchoolYear, sel_comp: Set[int], ses: Sessi
 # ---------------------------------------------------------------------------
 
 def _write_student_files(stu: Student, sy: SchoolYear, cl_dir: Path, template: str,
-                         sel_comp: Set[int], ses: Session) -> str:
+                         sel_comp: Set[int], ses: Session,
+                         prefetch: ExportPrefetch | None = None) -> str:
     base = f"{_slug(stu.last_name)}_{_slug(stu.first_name)}"
-    (cl_dir / f"{base}.lua").write_text(_student_to_lua(stu, sy, sel_comp, ses), encoding="utf-8")
+    lua = _student_to_lua(stu, sy, sel_comp, ses, prefetch)
+    (cl_dir / f"{base}.lua").write_text(lua, encoding="utf-8")
     tex = template.replace('require("studentdata")', f'require("{base}")')
     tex = tex.replace("studentdata.lua", f"{base}.lua")  # fallback for \input style
     (cl_dir / f"{base}.tex").write_text(tex, encoding="utf-8")
@@ -277,49 +421,309 @@ def _write_student_files(stu: Student, sy: SchoolYear, cl_dir: Path, template: s
 # TeX compilation -----------------------------------------------------------
 # ---------------------------------------------------------------------------
 
+# lualatex runs as a subprocess, so plain threads are enough to keep every
+# core busy.  One pool per process: concurrent export jobs share the cores
+# instead of each starting EXPORT_WORKERS compilers.
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def compile_pool() -> ThreadPoolExecutor:
+    """Shared, bounded pool for lualatex runs (EXPORT_WORKERS threads)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="lualatex")
+        return _pool
+
+
 def _lualatex_exe() -> str:
     return "lualatex.exe" if sys.platform.startswith("win") else "lualatex"
 
 
-def _compile_tex(class_dir: Path, base: str) -> Path:
+# ---------------------------------------------------------------------------
+# PDF cache: a PDF is reused when the sha256 over TexTemplate + .lua + .tex
+# (and the EXPORT_FORMAT setting) is unchanged since it was built.  The digest lives next to the PDF in
+# ".<base>.srchash" and is removed before each compile, so a failed run never
+# leaves a stale PDF marked as current.
+# ---------------------------------------------------------------------------
+
+# Compile inputs only: the build log and other lualatex output that may sit in
+# TexTemplate do not change the PDF.
+TEMPLATE_SUFFIXES = {".tex", ".sty", ".cls", ".lua", ".png", ".jpg", ".jpeg"}
+
+_tpl_cache: Tuple[tuple, str] | None = None
+_tpl_lock = threading.Lock()
+
+
+def template_digest() -> str:
+    """sha256 over the compile inputs in TexTemplate (relative path + content).
+
+    Cached per process and recomputed only when a file's mtime or size
+    changes, or files are added or removed."""
+    global _tpl_cache
+    src = Path.cwd() / "TexTemplate"
+    files = sorted(p for p in src.rglob("*")
+                   if p.is_file() and p.suffix.lower() in TEMPLATE_SUFFIXES) if src.exists() else []
+    key = (str(src),) + tuple((f.relative_to(src).as_posix(), st.st_mtime_ns, st.st_size)
+                              for f in files for st in (f.stat(),))
+    with _tpl_lock:
+        if _tpl_cache is not None and _tpl_cache[0] == key:
+            return _tpl_cache[1]
+        h = hashlib.sha256()
+        for f in files:
+            h.update(f.relative_to(src).as_posix().encode())
+            h.update(f.read_bytes())
+        _tpl_cache = (key, h.hexdigest())
+        return _tpl_cache[1]
+
+
+def _source_digest(class_dir: Path, base: str, tpl_digest: str) -> str:
+    h = hashlib.sha256(tpl_digest.encode())
+    if EXPORT_FORMAT:  # compiled against zeugnis.fmt, not the plain preamble
+        h.update(b"\0fmt")
+    for suffix in (".lua", ".tex"):
+        f = class_dir / f"{base}{suffix}"
+        h.update(f.read_bytes() if f.exists() else b"")
+    return h.hexdigest()
+
+
+def _hash_file(class_dir: Path, base: str) -> Path:
+    return class_dir / f".{base}.srchash"
+
+
+def pdf_is_current(class_dir: Path, base: str, tpl_digest: str) -> bool:
+    """True when <base>.pdf exists and was built from the current sources."""
+    hf = _hash_file(class_dir, base)
+    if not (class_dir / f"{base}.pdf").exists() or not hf.exists():
+        return False
+    return hf.read_text().strip() == _source_digest(class_dir, base, tpl_digest)
+
+
+# ---------------------------------------------------------------------------
+# Precompiled format: the part of ZeugnisFormat.tex above \endofdump is
+# dumped once into zeugnis.fmt (mylatexformat) next to the deployed template;
+# compiles load it and skip that part of the preamble.  Rebuilt when the
+# TexTemplate digest changes; if the build fails, compiles run without it.
+# Opt-in (EXPORT_FORMAT=1) until format and plain compiles are verified to
+# give the same PDF.  ZeugnisFormat.tex is ZeugnisPackages.tex reordered for
+# the dump; the generated .tex files only input it when the format is on, so
+# plain compiles keep the original preamble.
+# ---------------------------------------------------------------------------
+
+EXPORT_FORMAT = os.environ.get("EXPORT_FORMAT", "0") != "0"
+FORMAT_NAME = "zeugnis"
+FORMAT_PREAMBLE = "ZeugnisFormat.tex"
+
+_format_lock = threading.Lock()
+
+
+def _format_file(root: Path) -> Path:
+    return root / f"{FORMAT_NAME}.fmt"
+
+
+def _template_tex(src: Path) -> str:
+    """TexTemplate/Zeugnis.tex, inputting FORMAT_PREAMBLE when the format is on."""
+    tex = src.read_text(encoding="utf-8")
+    return tex.replace("ZeugnisPackages.tex", FORMAT_PREAMBLE) if EXPORT_FORMAT else tex
+
+
+def build_format(root: Path, tpl_digest: str | None = None) -> Path | None:
+    """Dump the shared preamble into <root>/zeugnis.fmt unless it is current.
+
+    *root* is the directory the template was copied to.  Returns the format
+    path, or None when disabled or the build failed."""
+    if not EXPORT_FORMAT:
+        return None
+    fmt = _format_file(root)
+    stamp = root / f".{FORMAT_NAME}.fmt.srchash"
+    digest = tpl_digest or template_digest()
+    with _format_lock:
+        if fmt.exists() and stamp.exists() and stamp.read_text().strip() == digest:
+            return fmt
+        stamp.unlink(missing_ok=True)
+        fmt.unlink(missing_ok=True)
+        # per-process jobname: several workers may rebuild at the same time
+        job = f"{FORMAT_NAME}-{os.getpid()}"
+        driver = root / f"{job}.tex"
+        driver.write_text(f"\\input{{{FORMAT_PREAMBLE}}}\n\\begin{{document}}\n\\end{{document}}\n")
+        cmd = [_lualatex_exe(), "-ini", f"-jobname={job}", "-interaction=nonstopmode",
+               "&lualatex", "mylatexformat.ltx", driver.name]
+        try:
+            subprocess.run(cmd, cwd=root, check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            os.replace(root / f"{job}.fmt", fmt)
+        except (subprocess.CalledProcessError, OSError) as err:
+            logger.warning("export: building %s failed, compiling without it: %s", fmt, err)
+            return None
+        finally:
+            for suffix in (".tex", ".log"):
+                (root / f"{job}{suffix}").unlink(missing_ok=True)
+        stamp.write_text(digest)
+        return fmt
+
+
+# ---------------------------------------------------------------------------
+# lualatex runs: repeat only while the .log asks for it (LaTeX compares the
+# .aux it read with the one it wrote and warns "Label(s) may have changed";
+# packages print "Rerun to get ..." / "Rerun LaTeX"), at most EXPORT_MAX_PASSES.
+# ---------------------------------------------------------------------------
+
+EXPORT_MAX_PASSES = int(os.environ.get("EXPORT_MAX_PASSES", "3"))
+
+_RERUN = re.compile(rb"Rerun to get|Rerun LaTeX|Label\(s\) may have changed")
+_OUTPUT = re.compile(rb"Output written on .*?\((\d+) pages?")
+
+
+@dataclass
+class CompilePass:
+    seconds: float
+    log_bytes: int
+    rerun: bool                         # the log asked for another pass
+    cpu_seconds: float | None = None    # user + system time of the lualatex child
+    max_rss_kb: int | None = None       # peak resident set size of the child
+    pages: int | None = None            # from "Output written on ... (n pages"
+
+
+def _read_log(log: Path) -> Tuple[bool, int, int | None]:
+    """(rerun requested, log size, pages) for a finished lualatex pass."""
+    try:
+        data = log.read_bytes()
+    except FileNotFoundError:
+        return False, 0, None
+    m = _OUTPUT.search(data)
+    return _RERUN.search(data) is not None, len(data), int(m.group(1)) if m else None
+
+
+def _run_lualatex(cmd: List[str], cwd: Path) -> Tuple[float | None, int | None]:
+    """subprocess.run(cmd, check=True) that also returns the child's
+    (cpu_seconds, max_rss_kb).  Both are None where os.wait4 is missing
+    (Windows).  Output goes to temp files: wait4 reaps the child itself, so
+    the pipes cannot be drained by communicate()."""
+    if not hasattr(os, "wait4"):
+        subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return None, None
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=err)
+        _, status, ru = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            out.seek(0)
+            err.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, cmd, out.read(), err.read())
+    return round(ru.ru_utime + ru.ru_stime, 3), ru.ru_maxrss
+
+
+def _compile_tex(class_dir: Path, base: str,
+                 passes: List[CompilePass] | None = None) -> Path:
+    """Run lualatex until the log stops asking for a rerun.
+
+    One CompilePass per run is appended to *passes* if given."""
     tex = class_dir / f"{base}.tex"
     pdf = tex.with_suffix(".pdf")
     if not tex.exists():
         return pdf
     cmd = [_lualatex_exe(), "-interaction=nonstopmode", "-halt-on-error", tex.name]
-    subprocess.run(cmd, cwd=class_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    fmt = _format_file(class_dir.parent.parent)   # \input{../../...} root
+    if EXPORT_FORMAT and fmt.exists():
+        cmd.insert(1, f"--fmt={fmt}")
+    for n in range(1, EXPORT_MAX_PASSES + 1):
+        t0 = time.perf_counter()
+        cpu, rss = _run_lualatex(cmd, class_dir)
+        rerun, log_bytes, pages = _read_log(class_dir / f"{base}.log")
+        if passes is not None:
+            passes.append(CompilePass(round(time.perf_counter() - t0, 3), log_bytes, rerun,
+                                      cpu, rss, pages))
+        if not rerun:
+            break
+        if n == EXPORT_MAX_PASSES:
+            logger.warning("export: %s still asks for a rerun after %d passes", tex, n)
     return pdf
 
 
-def _compile_selected(class_dir: Path, basenames: List[str]) -> Tuple[List[Path], Dict[str, str]]:
-    """Returns (compiled_pdfs, errors) where errors maps basename → stderr."""
+def _compile_selected(class_dir: Path, basenames: List[str],
+                      force: bool = False) -> Tuple[List[Path], Dict[str, str]]:
+    """Returns (compiled_pdfs, errors) where errors maps basename → stderr.
+    PDFs whose sources are unchanged are reused unless *force* is set."""
     cache = class_dir / ".compiled"
     done: Set[str] = set(cache.read_text().splitlines()) if cache.exists() else set()
     compiled: List[Path] = []
     errors: Dict[str, str] = {}
+    tpl = template_digest()
 
-    for base in basenames:
-        try:
-            pdf = _compile_tex(class_dir, base)
+    def _one(base: str) -> Tuple[Path | None, str | None]:
+        if not force and pdf_is_current(class_dir, base, tpl):
+            return class_dir / f"{base}.pdf", None
+        return compile_one(class_dir, base, tpl_digest=tpl)
+
+    pool = compile_pool()
+    for base, (pdf, err) in zip(basenames, pool.map(_one, basenames)):
+        if err is None:
             compiled.append(pdf)
             done.add(base)
-        except subprocess.CalledProcessError as err:
-            stderr = err.stderr.decode(errors="ignore")
-            stdout = err.stdout.decode(errors="ignore") if err.stdout else ""
-            errors[base] = stderr or stdout or f"lualatex exited with code {err.returncode}"
-        except FileNotFoundError:
-            errors[base] = "lualatex nicht gefunden – ist texlive-luatex installiert?"
+        else:
+            errors[base] = err
 
     cache.write_text("\n".join(sorted(done)))
     return compiled, errors
 
+# ---------------------------------------------------------------------------
+# Class booklet: one lualatex run for a whole class.  The body of Zeugnis.tex
+# is repeated once per student; before each copy the page counter is reset
+# and `student` is pointed at the next Lua table.  The physical start page of
+# every student is written to <booklet>.pages so the PDF can be split later.
+# ---------------------------------------------------------------------------
+
+_BOOKLET_LUA = r"""
+\begin{luacode*}
+	booklet_students = {
+%s
+	}
+	booklet_starts = {}
+	function booklet_begin(i)
+		student = booklet_students[i]
+		booklet_starts[i] = status.total_pages + 1
+		local f = io.open(tex.jobname .. ".pages", "w")
+		f:write(table.concat(booklet_starts, "\n"))
+		f:close()
+	end
+\end{luacode*}
+"""
+
+
+def booklet_base(classroom: str) -> str:
+    return f"klasse_{_slug(classroom)}"
+
+
+def _booklet_tex(template: str, bases: List[str], sources: str) -> str:
+    preamble, rest = template.split(r"\begin{document}", 1)
+    body = rest.rsplit(r"\end{document}", 1)[0]
+    preamble = preamble.replace('require("studentdata")', "nil")
+    requires = ",\n".join(f'\t\trequire("{b}")' for b in bases)
+    parts = [f"% sources: {sources}\n", preamble, _BOOKLET_LUA % requires, "\\begin{document}\n"]
+    for i in range(1, len(bases) + 1):
+        parts.append(f"\\clearpage\\setcounter{{page}}{{1}}\\directlua{{booklet_begin({i})}}%\n")
+        parts.append(body)
+    parts.append("\\end{document}\n")
+    return "".join(parts)
+
+
 # ---------------------------------------------------------------------------
 # Public API ----------------------------------------------------------------
 # ---------------------------------------------------------------------------
 
-def prepare_export(student_ids: List[int], classroom: str) -> Tuple[Path, List[str]]:
-    """Generate Lua/TeX files for students; return (cl_dir, basenames) for compilation."""
-    with Session(ENGINE) as ses:
+def prepare_export(student_ids: List[int], classroom: str, engine: Engine | None = None,
+                   timings: Dict[str, float] | None = None) -> Tuple[Path, List[str]]:
+    """Generate Lua/TeX files for students; return (cl_dir, basenames) for compilation.
+
+    If *timings* is given it receives the seconds spent per phase: "db"
+    (queries), "template" (deploy + format), "latex" (rich-text fields:
+    latex_cache lookup and conversion of the rest) and "lua" (Lua/TeX generation)."""
+    t0 = time.perf_counter()
+    spent: Dict[str, float] = {"db": 0.0}
+    with Session(engine or ENGINE) as ses:
         sy = ses.query(SchoolYear).order_by(SchoolYear.id.desc()).first()
         if not sy:
             raise RuntimeError("Kein Schuljahreintrag gefunden.")
@@ -335,25 +739,49 @@ def prepare_export(student_ids: List[int], classroom: str) -> Tuple[Path, List[s
                 "TexTemplate/Zeugnis.tex nicht gefunden. "
                 "Bitte die LaTeX-Vorlage in das TexTemplate-Verzeichnis legen."
             )
-        template_tex = src_template.read_text(encoding="utf-8")
-        _copy_template(cl_dir.parent.parent)
-
-        bases: List[str] = []
-        for stu in (
-            ses.query(Student)
-            .filter(Student.id.in_(student_ids))
-            .order_by(Student.last_name, Student.first_name)
-        ):
-            base = _write_student_files(stu, sy, cl_dir, template_tex, sel_comp, ses)
-            bases.append(base)
+        template_tex = _template_tex(src_template)
+        spent["db"] += time.perf_counter() - t0
 
+        t0 = time.perf_counter()
+        _copy_template(cl_dir.parent.parent)
+        build_format(cl_dir.parent.parent)
+        spent["template"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        students = _load_students(ses, student_ids)
+        prefetch = _prefetch(ses, students, latex=False)
+        spent["db"] += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        _prefetch_latex(ses, prefetch, students)
+        spent["latex"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bases: List[str] = [
+            _write_student_files(stu, sy, cl_dir, template_tex, sel_comp, ses, prefetch)
+            for stu in students
+        ]
+        spent["lua"] = time.perf_counter() - t0
+
+    if timings is not None:
+        timings.update({k: round(v, 3) for k, v in spent.items()})
     return cl_dir, bases
 
 
-def compile_one(cl_dir: Path, base: str) -> Tuple[Path | None, str | None]:
-    """Compile a single student's TeX file. Returns (pdf_path, error_or_None)."""
+def compile_one(cl_dir: Path, base: str, tpl_digest: str | None = None,
+                passes: List[CompilePass] | None = None) -> Tuple[Path | None, str | None]:
+    """Compile a single student's TeX file. Returns (pdf_path, error_or_None).
+
+    Always runs lualatex (check pdf_is_current first to skip); on success the
+    source digest is recorded for the PDF cache.  Per-pass timings and log
+    sizes are appended to *passes* if given."""
+    hf = _hash_file(cl_dir, base)
+    hf.unlink(missing_ok=True)
     try:
-        pdf = _compile_tex(cl_dir, base)
+        pdf = _compile_tex(cl_dir, base, passes)
+        if pdf.exists():
+            digest = _source_digest(cl_dir, base, tpl_digest or template_digest())
+            hf.write_text(digest)
         return pdf, None
     except subprocess.CalledProcessError as err:
         stderr = err.stderr.decode(errors="ignore")
@@ -363,10 +791,56 @@ def compile_one(cl_dir: Path, base: str) -> Tuple[Path | None, str | None]:
         return None, "lualatex nicht gefunden – ist texlive-luatex installiert?"
 
 
-def export_students(student_ids: List[int], classroom: str) -> Tuple[Dict[str, str], List[Path], Dict[str, str]]:
+def write_booklet(cl_dir: Path, classroom: str, bases: List[str]) -> str:
+    """Write the class booklet .tex for already generated student .lua files.
+
+    The .tex embeds a digest of all student .lua files, so the PDF cache
+    (pdf_is_current) sees any student change.  Returns the booklet basename.
+    """
+    src_template = Path.cwd() / "TexTemplate" / "Zeugnis.tex"
+    h = hashlib.sha256()
+    for base in bases:
+        h.update(base.encode())
+        h.update((cl_dir / f"{base}.lua").read_bytes())
+    name = booklet_base(classroom)
+    tex = _booklet_tex(_template_tex(src_template), bases, h.hexdigest())
+    (cl_dir / f"{name}.tex").write_text(tex, encoding="utf-8")
+    return name
+
+
+def split_booklet(cl_dir: Path, booklet: str, bases: List[str]) -> List[Path]:
+    """Split <booklet>.pdf into <base>.pdf per student (needs pypdf).
+
+    The student PDFs are not recorded in the PDF cache: their page numbers
+    and layout come from the booklet run, so a normal export compiles them
+    anew.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    starts = [int(x) for x in (cl_dir / f"{booklet}.pages").read_text().split()]
+    if len(starts) != len(bases):
+        raise RuntimeError(f"{booklet}.pages: {len(starts)} Einträge für {len(bases)} Schüler")
+    reader = PdfReader(cl_dir / f"{booklet}.pdf")
+    ends = starts[1:] + [len(reader.pages) + 1]
+    out: List[Path] = []
+    for base, first, end in zip(bases, starts, ends):
+        writer = PdfWriter()
+        for page in reader.pages[first - 1:end - 1]:
+            writer.add_page(page)
+        # replaces a singly compiled PDF, so its digest no longer applies
+        _hash_file(cl_dir, base).unlink(missing_ok=True)
+        pdf = cl_dir / f"{base}.pdf"
+        with open(pdf, "wb") as fh:
+            writer.write(fh)
+        out.append(pdf)
+    return out
+
+
+def export_students(student_ids: List[int], classroom: str, engine: Engine | None = None,
+                    force: bool = False) -> Tuple[Dict[str, str], List[Path], Dict[str, str]]:
     """Generate Lua/TeX for given students and compile new PDFs.
     Returns (lua_path_map, compiled_pdf_paths)."""
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         sy = ses.query(SchoolYear).order_by(SchoolYear.id.desc()).first()
         if not sy:
             raise RuntimeError("No SchoolYear row found")
@@ -383,21 +857,20 @@ def export_students(student_ids: List[int], classroom: str) -> Tuple[Dict[str, s
                 "TexTemplate/Zeugnis.tex nicht gefunden. "
                 "Bitte die LaTeX-Vorlage in das TexTemplate-Verzeichnis legen."
             )
-        template_tex = src_template.read_text(encoding="utf-8")
+        template_tex = _template_tex(src_template)
         _copy_template(cl_dir.parent.parent)
+        build_format(cl_dir.parent.parent)
 
         lua_map: Dict[str, str] = {}
         bases: List[str] = []
-        for stu in (
-            ses.query(Student)
-            .filter(Student.id.in_(student_ids))
-            .order_by(Student.last_name, Student.first_name)
-        ):
-            base = _write_student_files(stu, sy, cl_dir, template_tex, sel_comp, ses)
+        students = _load_students(ses, student_ids)
+        prefetch = _prefetch(ses, students)
+        for stu in students:
+            base = _write_student_files(stu, sy, cl_dir, template_tex, sel_comp, ses, prefetch)
             bases.append(base)
             lua_map[base] = str(cl_dir / f"{base}.lua")
 
-        compiled, errors = _compile_selected(cl_dir, bases)
+        compiled, errors = _compile_selected(cl_dir, bases, force=force)
         return lua_map, compiled, errors
 
 
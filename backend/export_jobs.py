@@ -0,0 +1,442 @@
+# export_jobs.py
+# ---------------------------------------------------------------------------
+# Export job store shared by all uvicorn workers.  Jobs and their per-student
+# outcomes live in two tables on the maintenance DB (like admin_users), so
+# progress survives a restart and any worker can answer progress/stream/cancel
+# requests.  Set EXPORT_JOBS_URL to use another DB, e.g. a local SQLite file:
+#     EXPORT_JOBS_URL=sqlite:////backend/data/export_jobs.db
+# The store has its own connection pool (EXPORT_JOBS_POOL_SIZE +
+# EXPORT_JOBS_MAX_OVERFLOW per worker): SSE polling and per-compile writes
+# during a large export must not use up the connections logins need.
+#
+# Finished jobs are pruned after EXPORT_JOB_TTL_HOURS, and at most
+# EXPORT_JOB_MAX jobs are kept; pruning runs whenever a job is created.
+#
+# The worker running a job holds a lease on it (owner + heartbeat_at, renewed
+# every EXPORT_JOB_LEASE_SECONDS / 3).  Jobs whose lease ran out — the worker
+# died or was restarted — are finished by fail_unfinished, at startup and
+# whenever a job is created; jobs another live worker is running are left
+# alone.  Result indexes come from a per-job counter (next_idx), so concurrent
+# writers never hand out the same index.
+# ---------------------------------------------------------------------------
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text,
+    create_engine, delete, func, select, update,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, declarative_base
+
+from db_schema import _pg_base_url
+from migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOBS_URL = os.environ.get("EXPORT_JOBS_URL") or f"{_pg_base_url()}/postgres"
+JOB_TTL = timedelta(hours=float(os.environ.get("EXPORT_JOB_TTL_HOURS", "24")))
+MAX_JOBS = int(os.environ.get("EXPORT_JOB_MAX", "200"))
+LEASE = timedelta(seconds=float(os.environ.get("EXPORT_JOB_LEASE_SECONDS", "60")))
+
+# identifies this worker process in export_jobs.owner
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+POOL_SIZE = int(os.environ.get("EXPORT_JOBS_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("EXPORT_JOBS_MAX_OVERFLOW", "5"))
+
+
+def _create_engine(url: str):
+    """Engine with its own, sized pool (SQLite keeps SQLAlchemy's default pool)."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, echo=False, future=True)
+    return create_engine(url, echo=False, future=True, pool_pre_ping=True,
+                         pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
+
+
+_engine = _create_engine(EXPORT_JOBS_URL)
+
+JobBase = declarative_base()
+
+
+class ExportJob(JobBase):
+    __tablename__ = "export_jobs"
+    id          = Column(String(36), primary_key=True)
+    cl_dir      = Column(Text, nullable=False)
+    basenames   = Column(Text, nullable=False)          # JSON list
+    active_db   = Column(String, nullable=True)
+    force       = Column(Boolean, nullable=False, default=False)
+    cancelled   = Column(Boolean, nullable=False, default=False)
+    done        = Column(Boolean, nullable=False, default=False)
+    created_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    prepare     = Column(Text, nullable=True)            # JSON: seconds per prepare phase
+    owner        = Column(String(64), nullable=True)     # OWNER of the worker running it
+    heartbeat_at = Column(DateTime, nullable=True)       # lease renewed by that worker
+    next_idx     = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class ExportJobResult(JobBase):
+    __tablename__ = "export_job_results"
+    id       = Column(Integer, primary_key=True)
+    job_id   = Column(String(36), ForeignKey("export_jobs.id", ondelete="CASCADE"),
+                      nullable=False, index=True)
+    idx      = Column(Integer, nullable=False)          # 1-based completion order
+    basename = Column(String, nullable=False)
+    success  = Column(Boolean, nullable=False)
+    error    = Column(Text, nullable=True)
+    cached   = Column(Boolean, nullable=False, default=False)
+    seconds  = Column(Float, nullable=True)             # wall time incl. cache check
+    passes   = Column(Text, nullable=True)              # JSON list, one dict per lualatex run
+    cpu_seconds = Column(Float, nullable=True)          # all passes, lualatex child only
+    max_rss_kb  = Column(Integer, nullable=True)
+    pages       = Column(Integer, nullable=True)
+    pdf_bytes   = Column(Integer, nullable=True)
+
+
+# ---------------------------------------------------------------------------
+# Table setup — once per process
+# ---------------------------------------------------------------------------
+
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+
+# Columns added since the tables were first created, in order; the position
+# is the schema version recorded in export_jobs_migrations (never reorder or
+# remove entries).  Fresh tables get them from create_all and are recorded as
+# migrated without running anything.
+_ADDED_COLUMNS: list[tuple[str, str, str]] = [
+    ("export_job_results", "passes", "TEXT"),
+    ("export_job_results", "cpu_seconds", "FLOAT"),
+    ("export_job_results", "max_rss_kb", "INTEGER"),
+    ("export_job_results", "pages", "INTEGER"),
+    ("export_job_results", "pdf_bytes", "INTEGER"),
+    ("export_jobs", "prepare", "TEXT"),
+    ("export_jobs", "owner", "VARCHAR(64)"),
+    ("export_jobs", "heartbeat_at", "TIMESTAMP"),
+    ("export_jobs", "next_idx", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def _migrations() -> list[tuple[str, str, str]]:
+    """_ADDED_COLUMNS as migrations.run_migrations entries for _engine's dialect
+    (the store may live on PostgreSQL or SQLite)."""
+    if _engine.dialect.name == "sqlite":
+        check = "SELECT 1 FROM pragma_table_info('{t}') WHERE name = '{c}'"
+    else:
+        check = ("SELECT 1 FROM information_schema.columns "
+                 "WHERE table_name = '{t}' AND column_name = '{c}'")
+    return [
+        (f"{t}.{c}", f"ALTER TABLE {t} ADD COLUMN {c} {ty}", check.format(t=t, c=c))
+        for t, c, ty in _ADDED_COLUMNS
+    ]
+
+
+def ensure_tables() -> None:
+    global _tables_ready
+    if _tables_ready:
+        return
+    with _tables_lock:
+        if not _tables_ready:
+            JobBase.metadata.create_all(_engine)
+            if not run_migrations(_engine, _migrations(), "export_jobs_migrations"):
+                raise RuntimeError("export_jobs: schema migration incomplete")
+            _tables_ready = True
+
+
+def _session() -> Session:
+    ensure_tables()
+    return Session(_engine)
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def create_job(cl_dir: str, basenames: list[str], active_db: str | None,
+               force: bool = False, prepare: dict | None = None) -> str:
+    """Store a new job and return its id (prunes expired jobs first)."""
+    fail_unfinished()
+    prune()
+    job_id = str(uuid.uuid4())
+    with _session() as ses:
+        ses.add(ExportJob(id=job_id, cl_dir=cl_dir, basenames=json.dumps(basenames),
+                          active_db=active_db, force=force,
+                          prepare=json.dumps(prepare) if prepare else None))
+        ses.commit()
+    return job_id
+
+
+def _result_dict(r: ExportJobResult, total: int) -> dict:
+    return {
+        "type": "progress",
+        "basename": r.basename,
+        "success": r.success,
+        "error": r.error,
+        "cached": r.cached,
+        "seconds": r.seconds,
+        "passes": json.loads(r.passes) if r.passes else None,
+        "cpu_seconds": r.cpu_seconds,
+        "max_rss_kb": r.max_rss_kb,
+        "pages": r.pages,
+        "pdf_bytes": r.pdf_bytes,
+        "index": r.idx,
+        "total": total,
+    }
+
+
+def get_job(job_id: str, results_after: int = 0) -> dict | None:
+    """Job state as a dict, with the results whose index is > results_after."""
+    with _session() as ses:
+        job = ses.get(ExportJob, job_id)
+        if job is None:
+            return None
+        basenames = json.loads(job.basenames)
+        results = ses.scalars(
+            select(ExportJobResult)
+            .where(ExportJobResult.job_id == job_id, ExportJobResult.idx > results_after)
+            .order_by(ExportJobResult.idx)
+        )
+        return {
+            "cl_dir": job.cl_dir,
+            "basenames": basenames,
+            "active_db": job.active_db,
+            "force": job.force,
+            "cancelled": job.cancelled,
+            "done": job.done,
+            "prepare": json.loads(job.prepare) if job.prepare else None,
+            "results": [_result_dict(r, len(basenames)) for r in results],
+        }
+
+
+def _next_index(ses: Session, job_id: str) -> int | None:
+    """Take the job's next result index (None if the job is gone).
+
+    The increment runs in the database, and the row stays locked until the
+    caller commits, so concurrent writers get distinct indexes."""
+    ses.execute(update(ExportJob).where(ExportJob.id == job_id)
+                .values(next_idx=ExportJob.next_idx + 1, heartbeat_at=datetime.utcnow()))
+    return ses.scalar(select(ExportJob.next_idx).where(ExportJob.id == job_id))
+
+
+def add_result(job_id: str, basename: str, error: str | None,
+               cached: bool = False, seconds: float | None = None,
+               passes: list[dict] | None = None, cpu_seconds: float | None = None,
+               max_rss_kb: int | None = None, pages: int | None = None,
+               pdf_bytes: int | None = None) -> int | None:
+    """Record one outcome; returns its 1-based index (None if the job is gone)."""
+    with _session() as ses:
+        index = _next_index(ses, job_id)
+        if index is None:
+            return None
+        ses.add(ExportJobResult(job_id=job_id, idx=index, basename=basename,
+                                success=error is None, error=error,
+                                cached=cached, seconds=seconds,
+                                passes=json.dumps(passes) if passes else None,
+                                cpu_seconds=cpu_seconds, max_rss_kb=max_rss_kb,
+                                pages=pages, pdf_bytes=pdf_bytes))
+        ses.commit()
+    return index
+
+
+def is_cancelled(job_id: str) -> bool:
+    with _session() as ses:
+        return bool(ses.scalar(select(ExportJob.cancelled).where(ExportJob.id == job_id)))
+
+
+def cancel(job_id: str) -> None:
+    with _session() as ses:
+        ses.execute(update(ExportJob).where(ExportJob.id == job_id).values(cancelled=True))
+        ses.commit()
+
+
+def finish(job_id: str) -> None:
+    with _session() as ses:
+        ses.execute(update(ExportJob).where(ExportJob.id == job_id)
+                    .values(done=True, finished_at=datetime.utcnow()))
+        ses.commit()
+
+
+def _renew(job_id: str, claim: bool = False) -> None:
+    values = {"heartbeat_at": datetime.utcnow()}
+    cond = [ExportJob.id == job_id]
+    if claim:
+        values["owner"] = OWNER
+    else:
+        cond.append(ExportJob.owner == OWNER)
+    with _session() as ses:
+        ses.execute(update(ExportJob).where(*cond).values(**values))
+        ses.commit()
+
+
+@contextmanager
+def lease(job_id: str):
+    """Hold the job's lease while the block runs: claim it for this worker and
+    renew the heartbeat in a background thread every LEASE / 3."""
+    _renew(job_id, claim=True)
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(LEASE.total_seconds() / 3):
+            try:
+                _renew(job_id)
+            except Exception:
+                logger.warning("export_jobs: could not renew lease of %s", job_id, exc_info=True)
+
+    t = threading.Thread(target=beat, name=f"lease-{job_id[:8]}", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        t.join()
+
+
+# Recorded for the students a job never got to because its worker went away
+RESTART_ERROR = "Export durch Neustart des Servers abgebrochen"
+
+
+def fail_unfinished(now: datetime | None = None) -> int:
+    """Finish the running jobs whose lease expired (no heartbeat for LEASE;
+    never-claimed jobs count from created_at), i.e. whose worker died or was
+    restarted.  Each student without a result gets one with RESTART_ERROR
+    (unless the job was cancelled), so pollers and streams see the job end.
+    Returns the job count.
+    """
+    now = now or datetime.utcnow()
+    expired = func.coalesce(ExportJob.heartbeat_at, ExportJob.created_at) < now - LEASE
+    with _session() as ses:
+        jobs = list(ses.scalars(select(ExportJob)
+                                .where(ExportJob.done.is_(False), expired)
+                                .with_for_update()))
+        for job in jobs:
+            have = ses.execute(select(ExportJobResult.basename, ExportJobResult.idx)
+                               .where(ExportJobResult.job_id == job.id)).all()
+            seen = {b for b, _ in have}
+            # jobs from before next_idx existed start at 0
+            job.next_idx = max([job.next_idx or 0] + [i for _, i in have])
+            if not job.cancelled:
+                for base in json.loads(job.basenames):
+                    if base not in seen:
+                        job.next_idx += 1
+                        ses.add(ExportJobResult(job_id=job.id, idx=job.next_idx, basename=base,
+                                                success=False, error=RESTART_ERROR))
+            job.done = True
+            job.finished_at = now
+        ses.commit()
+    if jobs:
+        logger.info("export_jobs: finished %d job(s) whose worker went away", len(jobs))
+    return len(jobs)
+
+
+# ---------------------------------------------------------------------------
+# Metrics — aggregates over stored results
+# ---------------------------------------------------------------------------
+
+SLOWEST = 5
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def _summarise(results: list[ExportJobResult]) -> dict:
+    compiled = [r for r in results if not r.cached and r.seconds is not None]
+    wall = [r.seconds for r in compiled]
+    cpu = [r.cpu_seconds for r in compiled if r.cpu_seconds is not None]
+    rss = [r.max_rss_kb for r in compiled if r.max_rss_kb is not None]
+    slowest = sorted(compiled, key=lambda r: r.seconds, reverse=True)[:SLOWEST]
+    return {
+        "results": len(results),
+        "compiled": len(compiled),
+        "cached": sum(1 for r in results if r.cached),
+        "failed": sum(1 for r in results if not r.success),
+        "wall_p50": _percentile(wall, 50),
+        "wall_p95": _percentile(wall, 95),
+        "wall_total": round(sum(wall), 3),
+        "cpu_p50": _percentile(cpu, 50),
+        "cpu_p95": _percentile(cpu, 95),
+        "cpu_total": round(sum(cpu), 3) if cpu else None,
+        "max_rss_kb": max(rss) if rss else None,
+        "pages": sum(r.pages or 0 for r in results),
+        "pdf_bytes": sum(r.pdf_bytes or 0 for r in results),
+        "slowest": [{"basename": r.basename, "seconds": r.seconds,
+                     "passes": len(json.loads(r.passes)) if r.passes else None}
+                    for r in slowest],
+    }
+
+
+def job_metrics(job_id: str) -> dict | None:
+    """Aggregates for one job, plus its prepare timings; None if unknown."""
+    with _session() as ses:
+        job = ses.get(ExportJob, job_id)
+        if job is None:
+            return None
+        results = list(ses.scalars(select(ExportJobResult)
+                                   .where(ExportJobResult.job_id == job_id)))
+        out = _summarise(results)
+        out["prepare"] = json.loads(job.prepare) if job.prepare else None
+        return out
+
+
+def recent_metrics() -> dict:
+    """Aggregates over every stored job (i.e. the last JOB_TTL)."""
+    with _session() as ses:
+        results = list(ses.scalars(select(ExportJobResult)))
+        prepares = [json.loads(p) for p in ses.scalars(
+            select(ExportJob.prepare).where(ExportJob.prepare.is_not(None)))]
+        jobs = ses.scalar(select(func.count(ExportJob.id))) or 0
+    out = _summarise(results)
+    out["jobs"] = jobs
+    out["prepare"] = {
+        phase: round(sum(p.get(phase, 0) for p in prepares), 3)
+        for phase in sorted({k for p in prepares for k in p})
+    }
+    return out
+
+
+def _delete_jobs(ses: Session, job_ids: list[str]) -> None:
+    # explicit child delete: SQLite does not enforce ON DELETE CASCADE by default
+    ses.execute(delete(ExportJobResult).where(ExportJobResult.job_id.in_(job_ids)))
+    ses.execute(delete(ExportJob).where(ExportJob.id.in_(job_ids)))
+
+
+def prune(now: datetime | None = None) -> int:
+    """Drop jobs older than JOB_TTL and the oldest ones beyond MAX_JOBS.
+
+    Unfinished jobs are only dropped by TTL (e.g. orphaned by a restart).
+    Returns the number of jobs removed.
+    """
+    cutoff = (now or datetime.utcnow()) - JOB_TTL
+    with _session() as ses:
+        expired = list(ses.scalars(select(ExportJob.id).where(ExportJob.created_at < cutoff)))
+        if expired:
+            _delete_jobs(ses, expired)
+        overflow: list[str] = []
+        count = ses.scalar(select(func.count(ExportJob.id))) or 0
+        if count >= MAX_JOBS:
+            overflow = list(ses.scalars(
+                select(ExportJob.id).where(ExportJob.done.is_(True))
+                .order_by(ExportJob.created_at).limit(count - MAX_JOBS + 1)
+            ))
+            if overflow:
+                _delete_jobs(ses, overflow)
+        ses.commit()
+    removed = len(expired) + len(overflow)
+    if removed:
+        logger.info("export_jobs: pruned %d job(s)", removed)
+    return removed
@@ -9,6 +9,7 @@ import random
 from datetime import date
 
 from sqlalchemy import delete as sql_delete
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
 from db_schema import (
@@ -524,11 +525,11 @@ def _fill_student(ses: Session, stu: Student, sdef: dict,
 # Public API
 # ---------------------------------------------------------------------------
 
-def generate_class_7ef(seed: int = 42) -> str:
+def generate_class_7ef(seed: int = 42, engine: Engine | None = None) -> str:
     """Populate test data for class 7ef. Idempotent."""
     rng = random.Random(seed)
 
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         school_class = ses.query(SchoolClass).filter_by(name=CLASS_NAME).first()
         if school_class is None:
             school_class = SchoolClass(name=CLASS_NAME)
@@ -564,9 +565,9 @@ def generate_class_7ef(seed: int = 42) -> str:
     return msg
 
 
-def clear_class_7ef() -> str:
+def clear_class_7ef(engine: Engine | None = None) -> str:
     """Remove class 7ef and all its data (students, grades, competence selections)."""
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         school_class = ses.query(SchoolClass).filter_by(name=CLASS_NAME).first()
         if school_class is None:
             return f"ℹ️ Klasse {CLASS_NAME} nicht in der Datenbank."
@@ -14,9 +14,20 @@ Supported elements
   Fallback: legacy plain-text (not starting with "<")
 """
 from __future__ import annotations
+import os
 import re
-from html.parser import HTMLParser
-
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from html import unescape
+
+# Bump whenever a change alters the output for some input: stored conversions
+# (db_helpers.latex_digest) are keyed by it, so texts saved before the change
+# are converted afresh instead of exporting stale LaTeX (the old rows are
+# purged at startup, db_helpers.purge_stale_latex).
+CONVERTER_VERSION = 2
 # ---------------------------------------------------------------------------
 # Character sanitisation (Word / copy-paste trash)
 # ---------------------------------------------------------------------------
@@ -24,51 +35,43 @@ from html.parser import HTMLParser
 # Characters that are outright illegal in LaTeX / TeX input and should be
 # dropped silently.  Includes control chars, zero-width joiners, soft hyphen,
 # BOM, and the Unicode replacement character.
-_STRIP_RE = re.compile(
-    "["
-    "\x00-\x08\x0b\x0c\x0e-\x1f"   # C0 controls except \t \n \r
-    "­"                          # soft hyphen
-    "​-‏"                   # zero-width space / joiners / marks
-    "  "                    # line / paragraph separators (handled below)
-    "﻿"                          # BOM
-    "�"                          # replacement character
-    "]"
+_STRIP_CHARS = (
+    "".join(map(chr, range(0x00, 0x09))) + "\x0b\x0c"
+    + "".join(map(chr, range(0x0e, 0x20)))          # C0 controls except \t \n \r
+    + "\u00ad"                                      # soft hyphen
+    + "".join(map(chr, range(0x200b, 0x2010)))      # zero-width space / joiners / marks
+    + "\u2028\u2029"                                # line / paragraph separators
+    + "\ufeff"                                      # BOM
+    + "\ufffd"                                      # replacement character
 )
 
 # Characters that should be normalised rather than dropped.
-_NORMALIZE = str.maketrans({
+_NORMALIZE = {
     # Space variants → plain space (whitespace-only lines are then stripped
     # in latex() so these become empty-line paragraph signals)
-    " ": " ",   # non-breaking space
-    " ": " ",   # figure space
-    " ": " ",   # punctuation space
-    " ": " ",   # thin space  ("half space" in Word)
-    " ": " ",   # hair space
-    " ": " ",   # narrow no-break space
-    " ": " ",   # medium mathematical space
+    "\u00a0": " ",   # non-breaking space
+    "\u2007": " ",   # figure space
+    "\u2008": " ",   # punctuation space
+    "\u2009": " ",   # thin space  ("half space" in Word)
+    "\u200a": " ",   # hair space
+    "\u202f": " ",   # narrow no-break space
+    "\u205f": " ",   # medium mathematical space
     # Typographic punctuation → ASCII equivalents
-    "‘": "'",  # left single quotation mark
-    "’": "'",  # right single quotation mark / apostrophe
-    "“": '"',  # left double quotation mark
-    "”": '"',  # right double quotation mark
-    "–": "--",  # en dash
-    "—": "---", # em dash
-    "…": "...", # ellipsis
-})
-
-
-def _sanitize(t: str) -> str:
-    """Remove/normalise characters that cause problems in LuaLaTeX."""
-    t = t.translate(_NORMALIZE)
-    t = _STRIP_RE.sub("", t)
-    return t
+    "\u2018": "'",   # left single quotation mark
+    "\u2019": "'",   # right single quotation mark / apostrophe
+    "\u201c": '"',   # left double quotation mark
+    "\u201d": '"',   # right double quotation mark
+    "\u2013": "--",  # en dash
+    "\u2014": "---", # em dash
+    "\u2026": "...", # ellipsis
+}
 
 
 # ---------------------------------------------------------------------------
 # Character escaping
 # ---------------------------------------------------------------------------
 
-_SPECIAL = str.maketrans({
+_SPECIAL = {
     "&":  r"\&",
     "%":  r"\%",
     "$":  r"\$",
@@ -79,22 +82,97 @@ _SPECIAL = str.maketrans({
     "~":  r"\textasciitilde{}",
     "^":  r"\textasciicircum{}",
     "\\": r"\textbackslash{}",
-})
+}
+
+# normalise + strip + escape in one pass: the three key sets are disjoint
+# and single characters, so one character class finds them all.  Not
+# str.translate: with multi-character replacements it takes a slow path for
+# non-ASCII text (about 4x slower on German report text); not chained
+# str.replace either, since "\\" and "{}" escape into each other.
+_ESCAPE = {**_NORMALIZE, **dict.fromkeys(_STRIP_CHARS, ""), **_SPECIAL}
+_ESCAPE_RE = re.compile("[" + "".join(map(re.escape, _ESCAPE)) + "]")
 
 
 def _esc(t: str) -> str:
-    return _sanitize(t).translate(_SPECIAL)
+    return _ESCAPE_RE.sub(lambda m: _ESCAPE[m.group()], t)
 
 
 # ---------------------------------------------------------------------------
 # HTML → LaTeX converter
+#
+# One regex scan over the input yields text, tags and ignorable markup
+# (comments, doctype, processing instructions); there is no element stack —
+# the only structural question ("inside an <ol>?") is answered by the
+# ordered-list counter stack.  Tag names are case-insensitive, entities in
+# text and attributes are decoded, <script>/<style> content is raw text, and
+# an unterminated tag or comment, a lone "<" or a possible entity at the end
+# of the input is dropped with the rest of it (as HTMLParser did).
 # ---------------------------------------------------------------------------
 
-class _Conv(HTMLParser):
+_TOKEN = re.compile(r"""
+    (?P<text>[^<]+)
+  | <!--.*?-->
+  | </\s*(?P<end>[a-zA-Z][^\t\n\r\f />\x00]*)[^>]*>
+  | <(?P<start>[a-zA-Z][^\t\n\r\f />\x00]*)
+     (?P<attrs>(?>                       # attributes as HTMLParser scans them:
+       (?:[\s/]*                         # bare values may contain quotes and "/"
+         (?:(?<=['"\s/])[^\s/>][^\s/=>]*
+           (?:\s*=+\s*(?:'[^']*'|"[^"]*"|(?!['"])[^>\s]*)\s*)?
+           (?:\s|/(?!>))*
+         )*
+       )?\s*))
+     /?>
+  | <(?!!--)[!?/][^>]*>
+""", re.VERBOSE | re.DOTALL)
+_INCOMPLETE = re.compile(r"<[a-zA-Z!?/]")
+_ATTR = re.compile(r"""(?<=['"\s/])[^\s/>][^\s/=>]*(?:\s*=+\s*(?:'[^']*'|"[^"]*"|(?!['"])[^>\s]*))?(?:\s|/(?!>))*""")
+_TAG_TAIL = re.compile(r"(?:\s|/(?!>))*")
+# HTMLParser (never close()d) held back a final text run whose last "&" within
+# 34 characters might still start an entity
+_HELD_TAIL = re.compile(r"&[^\s;]*\Z")
+_STYLE_ATTR = re.compile(r"""(?:^|[\s/])style\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]*))""",
+                         re.IGNORECASE)
+_TEXT_ALIGN = re.compile(r"text-align:\s*(\w+)")
+_CDATA_END = {"script": re.compile(r"</script", re.I), "style": re.compile(r"</style", re.I)}
+
+# Inline formatting / headings: opening LaTeX, closed with "}"
+_OPEN = {
+    "strong": r"\textbf{", "b": r"\textbf{",
+    "em": r"\textit{", "i": r"\textit{",
+    "u": r"\underline{",
+    "s": r"\sout{", "strike": r"\sout{", "del": r"\sout{",
+    "code": r"\texttt{",
+    "sup": r"\textsuperscript{",
+    "sub": r"\textsubscript{",
+    "h1": r"\textbf{\large ", "h2": r"\textbf{\large ",
+    "h3": r"\textbf{", "h4": r"\textbf{",
+}
+
+
+def _style(attrs: str) -> str:
+    """Value of the (last) style attribute in a raw attribute string."""
+    value = ""
+    for m in _STYLE_ATTR.finditer(attrs):
+        value = next(g for g in m.groups() if g is not None)
+    return unescape(value) if "&" in value else value
+
+
+def _self_closing(html: str, m: re.Match) -> bool:
+    """Whether a start tag ending in "/>" is self-closing: not when the "/"
+    is part of a bare attribute value (<p class=x/>)."""
+    k = _TAG_TAIL.match(html, m.end("start")).end()
+    while (a := _ATTR.match(html, k)) is not None:
+        k = a.end()
+    return html[k:m.end()].strip().endswith("/>")
+
+
+class _Conv:
     def __init__(self) -> None:
-        super().__init__()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all output and state, so one instance can convert many inputs."""
         self._out:    list[str] = []
-        self._stack:  list[str] = []
         # paragraph buffer (collect content before we know alignment)
         self._pbuf:   list[str] | None = None
         self._palign: str | None = None
@@ -105,7 +183,7 @@ class _Conv(HTMLParser):
         self._thead:  list[list[str]] = []
         self._tcols:  int = 0
         self._in_head: bool = False
-        # ordered-list counter stack (one entry per nesting level)
+        # ordered-list counter stack (one entry per open <ol>)
         self._ol_counters: list[int] = []
 
     # ---- active write target -----------------------------------------------
@@ -117,47 +195,57 @@ class _Conv(HTMLParser):
             return self._pbuf
         return self._out
 
-    # ---- helpers -----------------------------------------------------------
-
-    def _in_list(self) -> bool:
-        return any(t in ("ul", "ol") for t in self._stack)
-
-    # ---- SAX callbacks -----------------------------------------------------
-
-    def handle_starttag(self, tag: str, attrs: list) -> None:
-        self._stack.append(tag)
-        ad = dict(attrs)
+    # ---- scanner -----------------------------------------------------------
+
+    def feed(self, html: str) -> None:
+        pos, n = 0, len(html)
+        match = _TOKEN.match
+        while pos < n:
+            m = match(html, pos)
+            if m is None:
+                # a lone "<": text, unless it starts a tag that never closes
+                # or ends the input
+                if pos == n - 1 or _INCOMPLETE.match(html, pos):
+                    return
+                self.handle_data("<")
+                pos += 1
+                continue
+            pos = m.end()
+            kind = m.lastgroup
+            if kind == "text":
+                data = m.group("text")
+                if pos == n and _HELD_TAIL.search(data, max(0, len(data) - 34)):
+                    return
+                self.handle_data(unescape(data) if "&" in data else data)
+            elif kind == "end":
+                self.handle_endtag(m.group("end").lower())
+            elif kind == "attrs":
+                tag = m.group("start").lower()
+                self.handle_starttag(tag, m.group("attrs"))
+                if m.group(0).endswith("/>") and _self_closing(html, m):
+                    self.handle_endtag(tag)
+                elif tag in _CDATA_END:
+                    end = _CDATA_END[tag].search(html, pos)
+                    if end is None:
+                        return
+                    if end.start() > pos:
+                        self.handle_data(html[pos:end.start()])
+                    pos = end.start()
+
+    # ---- tag / text handlers -----------------------------------------------
+
+    def handle_starttag(self, tag: str, attrs: str) -> None:
+        # --- inline formatting / headings ---
+        opener = _OPEN.get(tag)
+        if opener is not None:
+            self._buf().append(opener)
 
         # --- paragraph ---
-        if tag == "p":
+        elif tag == "p":
             self._pbuf = []
-            m = re.search(r"text-align:\s*(\w+)", ad.get("style", ""))
+            m = _TEXT_ALIGN.search(_style(attrs)) if attrs else None
             self._palign = m.group(1) if m else None
 
-        # --- inline formatting ---
-        elif tag in ("strong", "b"):
-            self._buf().append(r"\textbf{")
-        elif tag in ("em", "i"):
-            self._buf().append(r"\textit{")
-        elif tag == "u":
-            self._buf().append(r"\underline{")
-        elif tag in ("s", "strike", "del"):
-            self._buf().append(r"\sout{")
-        elif tag == "code":
-            self._buf().append(r"\texttt{")
-        elif tag == "sup":
-            self._buf().append(r"\textsuperscript{")
-        elif tag == "sub":
-            self._buf().append(r"\textsubscript{")
-        elif tag == "a":
-            pass  # just output link text, ignore href
-
-        # --- headings ---
-        elif tag in ("h1", "h2"):
-            self._buf().append(r"\textbf{\large ")
-        elif tag in ("h3", "h4"):
-            self._buf().append(r"\textbf{")
-
         # --- line break ---
         elif tag == "br":
             # \newline avoids tabularray row-separator interpretation of \\
@@ -166,13 +254,11 @@ class _Conv(HTMLParser):
         # --- lists ---
         # No \begin{itemize}/\begin{enumerate} — these break tabularray cells.
         # Each <li> opens a hanging-indent paragraph instead.
-        elif tag == "ul":
-            pass  # structure handled per <li>
         elif tag == "ol":
             self._ol_counters.append(0)
 
         elif tag == "li":
-            if "ol" in self._stack:
+            if self._ol_counters:
                 self._ol_counters[-1] += 1
                 n = self._ol_counters[-1]
                 self._out.append(
@@ -196,13 +282,15 @@ class _Conv(HTMLParser):
             self._row = []
         elif tag in ("td", "th"):
             self._cbuf = []
+        # a, ul and unknown tags: no output of their own
 
     def handle_endtag(self, tag: str) -> None:
-        if self._stack and self._stack[-1] == tag:
-            self._stack.pop()
+        # --- inline closing brace ---
+        if tag in _OPEN:
+            self._buf().append("}")
 
         # --- paragraph ---
-        if tag == "p":
+        elif tag == "p":
             txt   = "".join(self._pbuf or [])
             align = self._palign
             self._pbuf, self._palign = None, None
@@ -214,11 +302,6 @@ class _Conv(HTMLParser):
             else:
                 self._out.append(f"\n{txt}\n")
 
-        # --- inline closing brace ---
-        elif tag in ("strong", "b", "em", "i", "u", "s", "strike", "del",
-                      "code", "sup", "sub", "h1", "h2", "h3", "h4"):
-            self._buf().append("}")
-
         # --- lists end: close the last hanging paragraph ---
         elif tag in ("ul", "ol"):
             self._out.append("\n\\par\n")
@@ -287,34 +370,94 @@ class _Conv(HTMLParser):
     # ---- result ------------------------------------------------------------
 
     def latex(self, par_mode: bool = False) -> str:
-        raw = "".join(self._out)
+        result = "".join(self._out)
         # Normalise Windows CRLF / bare CR in text content to LF so that the
         # newline-counting logic below works regardless of source platform.
-        result = re.sub(r"\r\n?", "\n", raw)
-        # Collapse whitespace-only lines (plain spaces/tabs — _sanitize() has
-        # already normalised all Unicode space variants to regular space).
-        # These become empty lines and feed into the newline-tier logic below.
-        result = re.sub(r"^[ \t]+$", "", result, flags=re.MULTILINE)
+        if "\r" in result:
+            result = _CR.sub("\n", result)
         result = result.strip()
-        # Normalise 4+ newlines to exactly 3 so the three tiers are distinct.
-        result = re.sub(r"\n{4,}", "\n\n\n", result)
-        # str.replace not re.sub: re.sub interprets backslashes in replacements.
+        # Each run of newlines (whitespace-only lines inside it count as empty
+        # lines — _esc() has already normalised all Unicode space variants)
+        # becomes one of three gap tiers: 1 newline = inline wrap, 2 = normal
+        # gap, 3+ = wide gap.
         if par_mode:
             # Document-body context: real \par boundaries let TeX apply widow/
             # orphan penalties across page breaks.
-            # <br> tags emit \newline\n — promote to paragraph break so \par
-            # replaces them too (single \n would otherwise become a space).
-            result = result.replace("\\newline\n", "\n\n")
-            result = result.replace("\n\n\n", "\\par\\bigskip ")   # wide gap
-            result = result.replace("\n\n",   "\\par ")            # normal gap
-        else:
-            # Tabularray cell context: \par switches cells to vertical mode and
-            # causes "Dimension too large"; use \newline instead.
-            # \vspace BEFORE \newline: \vadjust attaches to the current line.
-            result = result.replace("\n\n\n", "\\vspace{2em}\\newline ")   # wide gap
-            result = result.replace("\n\n",   "\\vspace{1em}\\newline ")   # normal gap
-        result = result.replace("\n", " ")                         # inline wrap
-        return result
+            # <br> (\newline + newline) is promoted to a paragraph break, i.e.
+            # counts as one extra newline in the run it starts.
+            return _PAR_RUN.sub(_par_gap, result)
+        # Tabularray cell context: \par switches cells to vertical mode and
+        # causes "Dimension too large"; use \newline instead.
+        # \vspace BEFORE \newline: \vadjust attaches to the current line.
+        return _NL_RUN.sub(_cell_gap, result)
+
+
+_CR = re.compile(r"\r\n?")
+_NL_RUN = re.compile(r"\n(?:[ \t]*\n)*")
+_PAR_RUN = re.compile(r"(?:\\newline)?\n(?:[ \t]*\n)*(?:\\newline\n(?:[ \t]*\n)*)*")
+_CELL_GAPS = (" ", "\\vspace{1em}\\newline ", "\\vspace{2em}\\newline ")
+_PAR_GAPS = ("", " ", "\\par ")
+_WIDE_PAR_GAP = "\\par\\bigskip "
+
+
+def _cell_gap(m: re.Match) -> str:
+    return _CELL_GAPS[min(m.group().count("\n"), 3) - 1]
+
+
+def _par_gap(m: re.Match) -> str:
+    # newlines per run are capped at 3 before <br> promotion adds one each
+    runs = m.group().split("\\newline")
+    total = min(runs[0].count("\n"), 3)
+    for run in runs[1:]:
+        total += min(run.count("\n"), 3) + 1
+    wide, rest = divmod(total, 3)
+    return _WIDE_PAR_GAP * wide + _PAR_GAPS[rest]
+
+
+# ---------------------------------------------------------------------------
+# Conversion cache — LRU keyed on (html, par_mode).  Report texts and LB
+# niveau HTML rarely change between exports, so repeated exports skip the
+# parser.  Bounded by entry count and by total characters (html + result).
+# ---------------------------------------------------------------------------
+
+CACHE_SIZE = int(os.environ.get("HTML_LATEX_CACHE_SIZE", "4096"))
+CACHE_CHARS = int(os.environ.get("HTML_LATEX_CACHE_CHARS", str(8 * 1024 * 1024)))
+
+_cache: OrderedDict[tuple[str, bool], str] = OrderedDict()
+_cache_chars = 0
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def cache_info() -> dict:
+    """Hit/miss/eviction counters and current size of the conversion cache."""
+    with _cache_lock:
+        return {**_stats, "entries": len(_cache), "chars": _cache_chars,
+                "max_entries": CACHE_SIZE, "max_chars": CACHE_CHARS}
+
+
+def cache_clear() -> None:
+    global _cache_chars
+    with _cache_lock:
+        _cache.clear()
+        _cache_chars = 0
+        _stats.update(hits=0, misses=0, evictions=0)
+
+
+def _cache_put(key: tuple[str, bool], value: str) -> None:
+    global _cache_chars
+    size = len(key[0]) + len(value)
+    if size > CACHE_CHARS or CACHE_SIZE <= 0:
+        return
+    with _cache_lock:
+        if key in _cache:
+            return
+        _cache[key] = value
+        _cache_chars += size
+        while len(_cache) > CACHE_SIZE or _cache_chars > CACHE_CHARS:
+            (html, _), old = _cache.popitem(last=False)
+            _cache_chars -= len(html) + len(old)
+            _stats["evictions"] += 1
 
 
 # ---------------------------------------------------------------------------
@@ -331,9 +474,25 @@ def html_to_latex(html: str, par_mode: bool = False) -> str:
     If *html* does not look like HTML (legacy plain text stored before the
     rich-text editor was introduced) it is escaped and paragraph/line breaks
     are converted to LaTeX equivalents.
+
+    Results are memoised (see cache_info()).
     """
     if not html:
         return ""
+    key = (html, par_mode)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return hit
+        _stats["misses"] += 1
+    result = _convert(html, par_mode)
+    _cache_put(key, result)
+    return result
+
+
+def _convert(html: str, par_mode: bool, conv: _Conv | None = None) -> str:
     if not html.strip().startswith("<"):
         # Legacy plain-text path (plain text stored before rich-text editor)
         import textwrap
@@ -346,6 +505,88 @@ def html_to_latex(html: str, par_mode: bool = False) -> str:
             return txt.replace("\n", "\\par ")
         txt = re.sub(r"\n{2,}", r"\\vspace{1em}", txt)
         return txt.replace("\n", r"\\")
-    c = _Conv()
-    c.feed(html)
-    return c.latex(par_mode=par_mode)
+    if conv is None:
+        conv = _Conv()
+    else:
+        conv.reset()
+    conv.feed(html)
+    return conv.latex(par_mode=par_mode)
+
+
+# ---------------------------------------------------------------------------
+# Batch conversion — one call per export for a whole class.  Identical inputs
+# (shared remarks, the same niveau text for several students) are converted
+# once, cache hits are served first, and the misses run through a single
+# reused converter.  Only when the misses add up to BATCH_POOL_CHARS or more
+# are they spread over BATCH_PROCESSES worker processes (0 = never).  The
+# worker pool is started on first use and kept for the life of the process;
+# the app shuts it down on exit.
+# ---------------------------------------------------------------------------
+
+BATCH_PROCESSES = int(os.environ.get("HTML_LATEX_PROCESSES", "0"))
+BATCH_POOL_CHARS = int(os.environ.get("HTML_LATEX_POOL_CHARS", str(4 * 1024 * 1024)))
+
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def batch_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared spawn pool with *workers* processes (one per size, per process)."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+        return pool
+
+
+def shutdown_batch_pool() -> None:
+    """Stop the worker processes started by batch_pool()."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+
+def _convert_chunk(htmls: list[str], par_mode: bool) -> list[str]:
+    if not htmls:
+        return []
+    conv = _Conv()
+    return [_convert(html, par_mode, conv) for html in htmls]
+
+
+def html_to_latex_many(htmls: Iterable[str], par_mode: bool = False,
+                       processes: int | None = None) -> list[str]:
+    """html_to_latex() for many inputs at once; results in input order.
+
+    *processes* overrides BATCH_PROCESSES.  Results are memoised like single
+    conversions and count towards the same cache_info() hits/misses.
+    """
+    htmls = list(htmls)
+    done: dict[str, str] = {"": ""}
+    with _cache_lock:
+        for html in htmls:
+            if html in done:
+                continue
+            hit = _cache.get((html, par_mode))
+            if hit is not None:
+                _cache.move_to_end((html, par_mode))
+                done[html] = hit
+        todo = [html for html in dict.fromkeys(htmls) if html not in done]
+        # repeats of a miss within the batch count as hits, as they would
+        # for consecutive single calls
+        _stats["hits"] += sum(1 for html in htmls if html) - len(todo)
+        _stats["misses"] += len(todo)
+
+    workers = BATCH_PROCESSES if processes is None else processes
+    if workers > 1 and len(todo) > 1 and sum(map(len, todo)) >= BATCH_POOL_CHARS:
+        chunks = [todo[i::workers] for i in range(min(workers, len(todo)))]
+        converted = batch_pool(workers).map(_convert_chunk, chunks, [par_mode] * len(chunks))
+        results = dict(zip((h for c in chunks for h in c), (r for c in converted for r in c)))
+    else:
+        results = dict(zip(todo, _convert_chunk(todo, par_mode)))
+
+    for html, result in results.items():
+        _cache_put((html, par_mode), result)
+    done.update(results)
+    return [done[html] for html in htmls]
@@ -9,6 +9,8 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 import auth_pure
+import export_jobs
+from html_to_latex import shutdown_batch_pool
 from routers import auth, setup, competences, students, stammdaten, admin, overview
 from migrations import run_migrations_all_report_dbs
 logger = logging.getLogger(__name__)
@@ -24,6 +26,15 @@ async def lifespan(app: FastAPI):
         logger.exception("FATAL: could not create admin_users table — check POSTGRES_URL")
         raise
 
+    # Export job store (shared by all workers); jobs whose worker went away
+    # (lease expired) would otherwise stay "running" until pruned
+    try:
+        export_jobs.ensure_tables()
+        export_jobs.fail_unfinished()
+        export_jobs.prune()
+    except Exception:
+        logger.warning("Could not prepare export job tables (DB may not be reachable yet)")
+
     # Run schema migrations on all existing report databases
     try:
         run_migrations_all_report_dbs()
@@ -32,6 +43,9 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    # html_to_latex worker processes (started by the first large batch)
+    shutdown_batch_pool()
+
 
 app = FastAPI(title="Kompetenzen-Tool API", version="1.0.0", lifespan=lifespan)
 
@@ -1,14 +1,22 @@
 # migrations.py
 # ---------------------------------------------------------------------------
-# Idempotent schema migrations applied automatically at startup and on every
-# DB switch.  Add new migrations as entries in MIGRATIONS — each one is a
-# (description, sql) tuple.  Every migration checks whether it is needed
-# before doing anything, so re-running is always safe.
+# Idempotent schema migrations applied automatically at startup and the first
+# time a report DB is opened in a process.  Add new migrations as entries in
+# MIGRATIONS — each one is a (description, sql, check) tuple.  Every migration
+# checks whether it is needed before doing anything, so re-running is always
+# safe.
+#
+# Applied migrations are recorded in a schema_migrations table (version = 1-
+# based index into MIGRATIONS).  Once a DB is fully migrated it is remembered
+# in-process, so later opens of the same DB cost a set lookup, not a round trip.
 # ---------------------------------------------------------------------------
 from __future__ import annotations
 
 import logging
+import threading
+
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +25,7 @@ logger = logging.getLogger(__name__)
 # Each entry: (human-readable description, SQL to run if needed, SQL check)
 # The check returns 1 row with value '1' when the migration IS ALREADY done,
 # and 0 rows (or value '0') when the migration still needs to run.
+# Never reorder or remove entries: the list index is the schema version.
 # ---------------------------------------------------------------------------
 
 MIGRATIONS: list[tuple[str, str, str]] = [
@@ -30,34 +39,116 @@ MIGRATIONS: list[tuple[str, str, str]] = [
           AND data_type = 'text'
         """,
     ),
+    (
+        "latex_cache table (precomputed LaTeX of rich-text fields)",
+        """
+        CREATE TABLE IF NOT EXISTS latex_cache (
+            digest            VARCHAR(64) PRIMARY KEY,
+            cell              VARCHAR NOT NULL,
+            body              VARCHAR NOT NULL,
+            converter_version INTEGER NOT NULL
+        )
+        """,
+        """
+        SELECT 1 FROM information_schema.tables
+        WHERE table_name = 'latex_cache'
+        """,
+    ),
 ]
 
+_VERSION_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    version     INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# DB names whose schema_migrations table is known to be complete in this process.
+# Each DB migrates under its own lock, so a slow DB does not hold up the others;
+# _verified_lock only guards the set and the lock table.
+_verified: set[str] = set()
+_verified_lock = threading.Lock()
+_db_locks: dict[str, threading.Lock] = {}
+
 
-def run_migrations(db_url: str) -> None:
-    """Apply all pending migrations to the database at db_url."""
-    eng = create_engine(db_url, future=True)
+def _applied_versions(conn, table: str) -> set[int]:
+    conn.execute(text(_VERSION_TABLE_SQL.format(table=table)))
+    conn.commit()
+    return {v for (v,) in conn.execute(text(f"SELECT version FROM {table}"))}
+
+
+def run_migrations(db: str | Engine,
+                   migrations: list[tuple[str, str, str]] | None = None,
+                   version_table: str = "schema_migrations") -> bool:
+    """Apply all pending migrations to *db* (a URL or an existing engine).
+
+    *migrations* defaults to the report-DB MIGRATIONS; other stores (see
+    export_jobs) pass their own list and version table.
+    Returns True when every migration is recorded as applied afterwards.
+    """
+    if migrations is None:
+        migrations = MIGRATIONS
+    own_engine = isinstance(db, str)
+    eng = create_engine(db, future=True) if own_engine else db
+    complete = True
     try:
         with eng.connect() as conn:
-            for desc, sql, check in MIGRATIONS:
+            applied = _applied_versions(conn, version_table)
+            for version, (desc, sql, check) in enumerate(migrations, start=1):
+                if version in applied:
+                    continue
                 try:
-                    result = conn.execute(text(check))
-                    already_done = result.fetchone() is not None
-                    if already_done:
-                        continue
-                    conn.execute(text(sql))
+                    already_done = conn.execute(text(check)).fetchone() is not None
+                    if not already_done:
+                        conn.execute(text(sql))
+                        logger.info("Migration applied: %s", desc)
+                    conn.execute(
+                        text(f"INSERT INTO {version_table} (version, description) "
+                             "VALUES (:version, :description)"),
+                        {"version": version, "description": desc},
+                    )
                     conn.commit()
-                    logger.info("Migration applied: %s", desc)
                 except Exception:
+                    conn.rollback()
+                    complete = False
                     logger.warning("Migration skipped (table may not exist yet): %s", desc)
     finally:
-        eng.dispose()
+        if own_engine:
+            eng.dispose()
+    return complete
+
+
+def ensure_migrated(engine: Engine) -> None:
+    """Run migrations on *engine*'s DB unless already verified in this process."""
+    db_name = engine.url.database or ""
+    if db_name in _verified:
+        return
+    with _verified_lock:
+        lock = _db_locks.setdefault(db_name, threading.Lock())
+    with lock:
+        if db_name in _verified:
+            return
+        if run_migrations(engine):
+            with _verified_lock:
+                _verified.add(db_name)
+
+
+def forget_verified(db_name: str) -> None:
+    """Drop *db_name* from the verified cache (e.g. after DROP DATABASE)."""
+    with _verified_lock:
+        _verified.discard(db_name)
 
 
 def run_migrations_all_report_dbs() -> None:
-    """Run migrations on every reports_* database."""
-    from db_schema import _pg_base_url, list_report_dbs
-    base_url = _pg_base_url()
-    for db_name in list_report_dbs():
-        url = f"{base_url}/{db_name}"
+    """Run migrations on every reports_* database, then drop latex_cache rows
+    rendered by another html_to_latex version.
+
+    Goes through the engine registry, so the pools opened here are the ones
+    the first requests use (get_engine migrates on open).
+    """
+    from db_schema import get_engine, list_report_dbs
+    from db_helpers import purge_stale_latex
+    for db_name in list_report_dbs(fresh=True):
         logger.info("Running migrations on %s", db_name)
-        run_migrations(url)
+        purge_stale_latex(get_engine(db_name))
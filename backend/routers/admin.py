@@ -1,31 +1,33 @@
-# routers/admin.py — student list and PDF export via background task + polling
+# routers/admin.py — student list and PDF export via background task + polling / SSE
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
-import uuid
+import time
+from concurrent.futures import as_completed
+from dataclasses import asdict
 from pathlib import Path
 
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from db_helpers import get_students_by_class
-from export import compile_one, prepare_export
-from deps import get_current_admin, get_current_user, get_db
+from html_to_latex import cache_info as html_cache_info
+from export import (compile_one, compile_pool, pdf_is_current, prepare_export,
+                    split_booklet, template_digest, write_booklet)
+from deps import get_current_admin, get_current_user, get_db, hash_pool_busy
 from schemas import (AdminStudentItem, CreateUserRequest, ExportPrepareRequest,
                      ExportPrepareResponse, UserOut, CompetenceSyncDiff)
 from sync_competences import compute_diff, apply_full_sync, CompetenceSyncResult
 import auth_pure
-import db_schema
+import export_jobs
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# In-memory job store
-# {job_id: {cl_dir, basenames, active_db, done: bool, results: list}}
-_jobs: dict[str, dict] = {}
-
 
 @router.get("/students", response_model=list[AdminStudentItem])
 def list_students(
@@ -45,33 +47,103 @@ def list_students(
     ]
 
 
+def _compile_or_reuse(cl_dir: Path, base: str, tpl: str, force: bool) -> dict:
+    """Compile one PDF unless the cached one is current.
+
+    Returns the keyword arguments for export_jobs.add_result: error, wall
+    time, per-pass details and the lualatex resource totals."""
+    t0 = time.perf_counter()
+    pdf = cl_dir / f"{base}.pdf"
+    if not force and pdf_is_current(cl_dir, base, tpl):
+        return {"error": None, "cached": True, "seconds": round(time.perf_counter() - t0, 3),
+                "pdf_bytes": pdf.stat().st_size if pdf.exists() else None}
+    passes = []
+    _, err = compile_one(cl_dir, base, tpl_digest=tpl, passes=passes)
+    cpu = [p.cpu_seconds for p in passes if p.cpu_seconds is not None]
+    rss = [p.max_rss_kb for p in passes if p.max_rss_kb is not None]
+    return {
+        "error": err,
+        "cached": False,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "passes": [asdict(p) for p in passes],
+        "cpu_seconds": round(sum(cpu), 3) if cpu else None,
+        "max_rss_kb": max(rss) if rss else None,
+        "pages": passes[-1].pages if passes else None,
+        "pdf_bytes": pdf.stat().st_size if err is None and pdf.exists() else None,
+    }
+
+
 def _run_export(job_id: str) -> None:
-    """Background task: compile all students and update _jobs in place."""
-    job = _jobs.get(job_id)
+    """Background task: compile all students on the shared compile pool and
+    record each outcome in the job store, in completion order."""
+    job = export_jobs.get_job(job_id)
     if not job:
         return
 
     cl_dir = Path(job["cl_dir"])
     basenames: list[str] = job["basenames"]
-    active_db = job.get("active_db")
-
-    if active_db:
-        db_schema.switch_engine(active_db)
-
-    for base in basenames:
-        if job.get("cancelled"):
-            break
-        pdf, err = compile_one(cl_dir, base)
-        job["results"].append({
-            "type": "progress",
-            "basename": base,
-            "success": err is None,
-            "error": err,
-            "index": len(job["results"]) + 1,
-            "total": len(basenames),
-        })
+    tpl = template_digest()
+
+    def _compile(base: str):
+        if export_jobs.is_cancelled(job_id):
+            return None
+        return _compile_or_reuse(cl_dir, base, tpl, job["force"])
+
+    with export_jobs.lease(job_id):
+        futures = {compile_pool().submit(_compile, base): base for base in basenames}
+        cancelled = False
+        try:
+            for fut in as_completed(futures):
+                # after a cancel, compiles already running still finish and are
+                # recorded; the queued ones are cancelled or skip themselves
+                if fut.cancelled():
+                    continue
+                outcome = fut.result()
+                if outcome is None:  # skipped after cancel
+                    continue
+                export_jobs.add_result(job_id, futures[fut], **outcome)
+                if not cancelled and export_jobs.is_cancelled(job_id):
+                    cancelled = True
+                    for pending in futures:
+                        pending.cancel()
+        finally:
+            for fut in futures:
+                fut.cancel()
+            export_jobs.finish(job_id)
+
+
+def _run_booklet(job_id: str, split: bool) -> None:
+    """Background task: compile the class booklet (first basename) in one
+    lualatex run, then optionally split it into the student PDFs (the rest)."""
+    job = export_jobs.get_job(job_id)
+    if not job:
+        return
 
-    job["done"] = True
+    cl_dir = Path(job["cl_dir"])
+    booklet, *bases = job["basenames"]
+    tpl = template_digest()
+
+    with export_jobs.lease(job_id):
+        try:
+            if export_jobs.is_cancelled(job_id):
+                return
+            outcome = compile_pool().submit(_compile_or_reuse, cl_dir, booklet, tpl,
+                                            job["force"]).result()
+            export_jobs.add_result(job_id, booklet, **outcome)
+            if not split or outcome["error"] or export_jobs.is_cancelled(job_id):
+                return
+            t0 = time.perf_counter()
+            try:
+                split_booklet(cl_dir, booklet, bases)
+                split_err = None
+            except Exception as e:
+                logger.exception("split_booklet failed")
+                split_err = f"Aufteilen fehlgeschlagen: {e}"
+            seconds = round((time.perf_counter() - t0) / max(len(bases), 1), 3)
+            for base in bases:
+                export_jobs.add_result(job_id, base, split_err, seconds=seconds)
+        finally:
+            export_jobs.finish(job_id)
 
 
 @router.post("/export/prepare", response_model=ExportPrepareResponse)
@@ -86,42 +158,109 @@ def export_prepare(
         raise HTTPException(400, "Keine Schüler ausgewählt")
 
     active_db = request.headers.get("x-active-db")
+    timings: dict[str, float] = {}
     try:
-        cl_dir, basenames = prepare_export(req.student_ids, req.classroom)
+        cl_dir, basenames = prepare_export(req.student_ids, req.classroom,
+                                           engine=db.get_bind(), timings=timings)
     except Exception as e:
         logger.exception("export_prepare failed")
         raise HTTPException(500, f"Export-Vorbereitung fehlgeschlagen: {e}")
 
-    job_id = str(uuid.uuid4())
-    _jobs[job_id] = {
-        "cl_dir": str(cl_dir),
-        "basenames": basenames,
-        "active_db": active_db,
-        "done": False,
-        "cancelled": False,
-        "results": [],
-    }
-    background_tasks.add_task(_run_export, job_id)
+    if req.booklet:
+        try:
+            booklet = write_booklet(cl_dir, req.classroom, basenames)
+        except Exception as e:
+            logger.exception("write_booklet failed")
+            raise HTTPException(500, f"Export-Vorbereitung fehlgeschlagen: {e}")
+        basenames = [booklet] + (basenames if req.split else [])
+        job_id = export_jobs.create_job(str(cl_dir), basenames, active_db,
+                                        force=req.force, prepare=timings)
+        background_tasks.add_task(_run_booklet, job_id, req.split)
+    else:
+        job_id = export_jobs.create_job(str(cl_dir), basenames, active_db,
+                                        force=req.force, prepare=timings)
+        background_tasks.add_task(_run_export, job_id)
     return ExportPrepareResponse(job_id=job_id, cl_dir=str(cl_dir), total=len(basenames))
 
 
 @router.get("/export/progress/{job_id}")
 def export_progress(job_id: str, _: str = Depends(get_current_user)):
-    job = _jobs.get(job_id)
+    job = export_jobs.get_job(job_id)
     if not job:
         raise HTTPException(404, "Export-Job nicht gefunden")
     return {
         "done": job["done"],
         "total": len(job["basenames"]),
         "results": job["results"],
+        "metrics": export_jobs.job_metrics(job_id),
     }
 
 
+@router.get("/export/metrics")
+def export_metrics(_: str = Depends(get_current_user)):
+    """Compile/prepare aggregates over all stored export jobs, plus the
+    html_to_latex cache counters of this worker."""
+    return {**export_jobs.recent_metrics(), "html_cache": html_cache_info()}
+
+
+@router.get("/export/metrics/{job_id}")
+def export_job_metrics(job_id: str, _: str = Depends(get_current_user)):
+    metrics = export_jobs.job_metrics(job_id)
+    if metrics is None:
+        raise HTTPException(404, "Export-Job nicht gefunden")
+    return metrics
+
+
+# How often the SSE stream looks for new results, and after how many idle
+# checks it sends a keep-alive comment (keeps proxies from closing the stream)
+_STREAM_INTERVAL = 0.5
+_STREAM_KEEPALIVE = 30
+
+
+async def _export_events(job_id: str, request: Request):
+    """Yield one SSE event per new result, then a final "done" event."""
+    sent = idle = 0
+    while True:
+        job = await asyncio.to_thread(export_jobs.get_job, job_id, sent)
+        if job is None:  # pruned while streaming
+            return
+        for result in job["results"]:
+            yield f"data: {json.dumps(result)}\n\n"
+            sent = result["index"]
+            idle = 0
+        # not on "cancelled": results of compiles still running arrive until done
+        if job["done"]:
+            yield "data: " + json.dumps({
+                "type": "done",
+                "index": sent,
+                "total": len(job["basenames"]),
+                "cancelled": job["cancelled"],
+            }) + "\n\n"
+            return
+        if await request.is_disconnected():
+            return
+        idle += 1
+        if idle >= _STREAM_KEEPALIVE:
+            idle = 0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(_STREAM_INTERVAL)
+
+
+@router.get("/export/stream/{job_id}")
+async def export_stream(job_id: str, request: Request, _: str = Depends(get_current_user)):
+    """Server-sent events: one event per compiled student, closed on done/cancel."""
+    if await asyncio.to_thread(export_jobs.get_job, job_id) is None:
+        raise HTTPException(404, "Export-Job nicht gefunden")
+    return StreamingResponse(
+        _export_events(job_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/export/cancel/{job_id}")
 def export_cancel(job_id: str, _: str = Depends(get_current_user)):
-    job = _jobs.get(job_id)
-    if job:
-        job["cancelled"] = True
+    export_jobs.cancel(job_id)
     return {"ok": True}
 
 
@@ -174,12 +313,20 @@ def list_users(_: str = Depends(get_current_admin)):
     return auth_pure.list_users()
 
 
+@router.get("/users/hash-metrics")
+def user_hash_metrics(_: str = Depends(get_current_admin)):
+    """Password hashing pool of this worker: queue depth, rejections, timings."""
+    return auth_pure.hash_pool_info()
+
+
 @router.post("/users", status_code=201)
-def create_user(body: CreateUserRequest, _: str = Depends(get_current_admin)):
+async def create_user(body: CreateUserRequest, _: str = Depends(get_current_admin)):
     try:
-        auth_pure.create_user(body.username, body.password, body.role)
+        await auth_pure.create_user_async(body.username, body.password, body.role)
     except IntegrityError:
         raise HTTPException(400, "Benutzername bereits vergeben")
+    except auth_pure.HashPoolBusy:
+        raise hash_pool_busy()
     return {"ok": True}
 
 
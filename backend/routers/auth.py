@@ -1,11 +1,14 @@
 # routers/auth.py
 from __future__ import annotations
 
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.responses import JSONResponse
 
 import auth_pure
-from deps import create_token, get_current_admin, optional_user, optional_user_role
+from deps import (create_token, get_current_admin, hash_pool_busy, optional_user,
+                  optional_user_role)
 from schemas import AuthSetupRequest, AuthStatusResponse, CreateUserRequest, LoginRequest
 
 router = APIRouter()
@@ -13,32 +16,33 @@ router = APIRouter()
 
 @router.get("/status", response_model=AuthStatusResponse)
 def auth_status():
-    count = auth_pure.user_count()
     return AuthStatusResponse(
         authenticated=False,
         username=None,
-        needs_setup=(count == 0),
+        needs_setup=auth_pure.needs_setup(),
         role=None,
     )
 
 
 @router.get("/me", response_model=AuthStatusResponse)
 def auth_me(user_role: tuple[str, str] | None = Depends(optional_user_role)):
-    count = auth_pure.user_count()
     return AuthStatusResponse(
         authenticated=user_role is not None,
         username=user_role[0] if user_role else None,
-        needs_setup=(count == 0),
+        needs_setup=auth_pure.needs_setup(),
         role=user_role[1] if user_role else None,
     )
 
 
 @router.post("/login")
-def login(req: LoginRequest, response: Response):
-    if not auth_pure.check_credentials(req.username, req.password):
+async def login(req: LoginRequest, response: Response):
+    try:
+        role = await auth_pure.check_credentials_async(req.username, req.password)
+    except auth_pure.HashPoolBusy:
+        raise hash_pool_busy("Zu viele Anmeldungen gleichzeitig – bitte gleich erneut versuchen")
+    if not role:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Ungültige Anmeldedaten")
 
-    role = auth_pure.get_role(req.username)
     token = create_token(req.username, role)
     response.set_cookie(
         key="access_token",
@@ -58,15 +62,18 @@ def logout(response: Response):
 
 
 @router.post("/setup", response_model=AuthStatusResponse)
-def setup(req: AuthSetupRequest, response: Response):
-    if auth_pure.user_count() > 0:
+async def setup(req: AuthSetupRequest, response: Response):
+    if not await asyncio.to_thread(auth_pure.needs_setup):
         raise HTTPException(status_code=400, detail="Admin-Konto bereits vorhanden")
     if not req.username or not req.password:
         raise HTTPException(status_code=400, detail="Benutzername und Passwort dürfen nicht leer sein")
     if len(req.password) < 8:
         raise HTTPException(status_code=400, detail="Passwort muss mindestens 8 Zeichen lang sein")
 
-    auth_pure.create_user(req.username, req.password, role="admin")
+    try:
+        await auth_pure.create_user_async(req.username, req.password, role="admin")
+    except auth_pure.HashPoolBusy:
+        raise hash_pool_busy()
     token = create_token(req.username, "admin")
     response.set_cookie(
         key="access_token",
@@ -80,7 +87,7 @@ def setup(req: AuthSetupRequest, response: Response):
 
 
 @router.post("/users")
-def create_user(req: CreateUserRequest, _: str = Depends(get_current_admin)):
+async def create_user(req: CreateUserRequest, _: str = Depends(get_current_admin)):
     """Admin-only: create an additional user account (e.g. lehrer)."""
     if not req.username or not req.password:
         raise HTTPException(status_code=400, detail="Benutzername und Passwort erforderlich")
@@ -90,7 +97,9 @@ def create_user(req: CreateUserRequest, _: str = Depends(get_current_admin)):
         raise HTTPException(status_code=400, detail="Ungültige Rolle (admin oder lehrer)")
     from sqlalchemy.exc import IntegrityError
     try:
-        auth_pure.create_user(req.username, req.password, role=req.role)
+        await auth_pure.create_user_async(req.username, req.password, role=req.role)
     except IntegrityError:
         raise HTTPException(status_code=409, detail=f"Benutzer '{req.username}' existiert bereits")
+    except auth_pure.HashPoolBusy:
+        raise hash_pool_busy()
     return {"ok": True, "username": req.username, "role": req.role}
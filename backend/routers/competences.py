@@ -28,13 +28,13 @@ def list_classes(db: Session = Depends(get_db)):
 
 
 @router.get("/subjects", response_model=SubjectListResponse)
-def list_subjects():
-    return SubjectListResponse(subjects=get_subjects())
+def list_subjects(db: Session = Depends(get_db)):
+    return SubjectListResponse(subjects=get_subjects(engine=db.get_bind()))
 
 
 @router.get("/subjects/{name}/blocks", response_model=BlockListResponse)
-def list_blocks(name: str):
-    return BlockListResponse(blocks=get_blocks(name))
+def list_blocks(name: str, db: Session = Depends(get_db)):
+    return BlockListResponse(blocks=get_blocks(name, engine=db.get_bind()))
 
 
 @router.get("/competences", response_model=CompetenceListResponse)
@@ -44,7 +44,7 @@ def list_competences(
     block: str,
     db: Session = Depends(get_db),
 ):
-    rows = load_topic_rows(class_name, subject, block)
+    rows = load_topic_rows(class_name, subject, block, engine=db.get_bind())
 
     # Group by topic, preserving order
     topic_map: dict[str, dict] = {}
@@ -83,14 +83,14 @@ def list_competences(
 
 
 @router.post("/competences/save")
-def save_competences(req: CompetenceSaveRequest):
-    save_selections(req.class_name, req.changes)
+def save_competences(req: CompetenceSaveRequest, db: Session = Depends(get_db)):
+    save_selections(req.class_name, req.changes, engine=db.get_bind())
     return {"ok": True}
 
 
 @router.post("/competences/toggle-topic")
-def toggle_topic_endpoint(req: ToggleTopicRequest):
-    toggle_topic(req.class_name, req.topic_id, req.value)
+def toggle_topic_endpoint(req: ToggleTopicRequest, db: Session = Depends(get_db)):
+    toggle_topic(req.class_name, req.topic_id, req.value, engine=db.get_bind())
     return {"ok": True}
 
 
@@ -114,14 +114,14 @@ def preview_table(
     db: Session = Depends(get_db),
 ):
     """Return all selected competences for class+subject across all blocks, merged by topic name."""
-    blocks = get_blocks(subject)
+    blocks = get_blocks(subject, engine=db.get_bind())
     class_id = _get_or_create_class_id(class_name, db)
 
     # Collect (topic_name, block, comp_id, text) for selected competences only
     topic_rows: dict[str, dict] = {}  # topic_name → {block, topic_id, competences}
 
     for block in blocks:
-        rows = load_topic_rows(class_name, subject, block)
+        rows = load_topic_rows(class_name, subject, block, engine=db.get_bind())
         for comp_id, topic_name, text, selected in rows:
             if not selected:
                 continue
@@ -175,9 +175,14 @@ def preview_table(
 
 
 @router.post("/competences/sync-to-parallel")
-def sync_parallel(class_name: str, body: dict | None = None, _user=Depends(get_current_user)):
+def sync_parallel(
+    class_name: str,
+    body: dict | None = None,
+    db: Session = Depends(get_db),
+    _user=Depends(get_current_user),
+):
     """Copy competence selections from class_name to parallel classes.
     Optional JSON body: {"target_classes": ["7b", "7c"]} — if omitted, syncs to all parallel."""
     targets = (body or {}).get("target_classes") or None
-    synced = sync_competences_to_parallel(class_name, targets)
+    synced = sync_competences_to_parallel(class_name, targets, engine=db.get_bind())
     return {"synced_to": synced}
@@ -6,17 +6,16 @@ from datetime import datetime
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import StreamingResponse
-from sqlalchemy import inspect as sa_inspect, text
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.orm import Session
 
-import db_schema
 from student_loader import (
     count_students, sync_students_from_upload, preview_students_from_upload,
     ALL_UPDATE_FIELDS,
 )
 from db_schema import (
-    SchoolYear, create_report_db, init_db, list_report_dbs,
-    suggest_db_name, switch_engine, _pg_base_url,
+    SchoolYear, create_report_db, drop_report_db, get_engine, init_db,
+    list_report_dbs, suggest_db_name, _pg_base_url,
 )
 from deps import get_current_user, get_db
 from schemas import (
@@ -39,7 +38,7 @@ def public_latest_db():
     dbs = sorted(list_report_dbs())
     if not dbs:
         return {"db": None}
-    switch_engine(dbs[-1])
+    get_engine(dbs[-1])
     return {"db": dbs[-1]}
 
 
@@ -51,6 +50,12 @@ def _current_db(request: Request) -> str | None:
     return request.headers.get("x-active-db")
 
 
+def _db_exists(name: str) -> bool:
+    """Check the cached list first; re-read it before answering no (the DB may
+    have been created by another worker within the cache TTL)."""
+    return name in list_report_dbs() or name in list_report_dbs(fresh=True)
+
+
 @router.get("/databases", response_model=DatabaseListResponse)
 def list_databases(request: Request, _: str = Depends(get_current_user)):
     dbs = list_report_dbs()
@@ -62,34 +67,26 @@ def create_database(req: DatabaseCreateRequest, request: Request, _: str = Depen
     import re
     if not re.match(r"^reports_\d{4}_\d{2}_(hj|ej)$", req.name):
         raise HTTPException(400, "Ungültiger Datenbankname (erwartet: reports_YYYY_YY_hj|ej)")
-    existing = list_report_dbs()
+    existing = list_report_dbs(fresh=True)
     if req.name not in existing:
         create_report_db(req.name)
-    switch_engine(req.name)
-    init_db(drop=False, populate=True)
+    init_db(drop=False, populate=True, engine=get_engine(req.name))
     return DatabaseListResponse(databases=list_report_dbs(), current=req.name)
 
 
 @router.post("/databases/select")
 def select_database(req: DatabaseSelectRequest, _: str = Depends(get_current_user)):
-    if req.name not in list_report_dbs():
+    if not _db_exists(req.name):
         raise HTTPException(404, "Datenbank nicht gefunden")
-    switch_engine(req.name)
+    get_engine(req.name)
     return {"ok": True, "db": req.name}
 
 
 @router.delete("/databases/{name}")
 def delete_database(name: str, _: str = Depends(get_current_user)):
-    if name not in list_report_dbs():
+    if not _db_exists(name):
         raise HTTPException(404, "Datenbank nicht gefunden")
-    admin_url = f"{_pg_base_url()}/postgres"
-    from sqlalchemy import create_engine
-    eng = create_engine(admin_url, isolation_level="AUTOCOMMIT", future=True)
-    try:
-        with eng.connect() as conn:
-            conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
-    finally:
-        eng.dispose()
+    drop_report_db(name)
     return {"ok": True}
 
 
@@ -104,7 +101,7 @@ def suggest_database(term: str = "hj", _: str = Depends(get_current_user)):
 
 def _schema_ready(db: Session) -> bool:
     try:
-        inspector = sa_inspect(db_schema.ENGINE)
+        inspector = sa_inspect(db.get_bind())
         return "subjects" in inspector.get_table_names()
     except Exception:
         return False
@@ -116,18 +113,20 @@ def schema_status(db: Session = Depends(get_db), _: str = Depends(get_current_us
     count = 0
     if ready:
         try:
-            count = count_students()
+            count = count_students(engine=db.get_bind())
         except Exception:
             pass
-    db_name = db_schema.ENGINE.url.database or ""
+    db_name = db.get_bind().url.database or ""
     return SchemaStatusResponse(db_name=db_name, schema_ready=ready, student_count=count)
 
 
 @router.post("/setup/init-schema", response_model=SchemaStatusResponse)
 def init_schema(db: Session = Depends(get_db), _: str = Depends(get_current_user)):
-    init_db(drop=False, populate=True)
-    db_name = db_schema.ENGINE.url.database or ""
-    return SchemaStatusResponse(db_name=db_name, schema_ready=True, student_count=count_students())
+    engine = db.get_bind()
+    init_db(drop=False, populate=True, engine=engine)
+    db_name = engine.url.database or ""
+    return SchemaStatusResponse(db_name=db_name, schema_ready=True,
+                                student_count=count_students(engine=engine))
 
 
 # ---------------------------------------------------------------------------
@@ -183,14 +182,14 @@ def fetch_report_day(type: str = "hj", _: str = Depends(get_current_user)):
 @router.post("/setup/testdata")
 def generate_testdata(_: str = Depends(get_current_user), db: Session = Depends(get_db)):
     from generate_test_data import generate_class_7ef
-    msg = generate_class_7ef()
+    msg = generate_class_7ef(engine=db.get_bind())
     return {"message": msg}
 
 
 @router.delete("/setup/testdata")
 def remove_testdata(_: str = Depends(get_current_user), db: Session = Depends(get_db)):
     from generate_test_data import clear_class_7ef
-    msg = clear_class_7ef()
+    msg = clear_class_7ef(engine=db.get_bind())
     return {"message": msg}
 
 
@@ -203,12 +202,14 @@ async def preview_students(
     file: UploadFile = File(...),
     remove_missing: bool = Form(False),
     update_fields: str = Form("klasse,fehltage,zeugnistext,bemerkungen"),
+    db: Session = Depends(get_db),
     _: str = Depends(get_current_user),
 ):
     csv_bytes = await file.read()
     fields = {f.strip() for f in update_fields.split(",") if f.strip()}
     try:
-        diff = preview_students_from_upload(csv_bytes, remove_missing, fields)
+        diff = preview_students_from_upload(csv_bytes, remove_missing, fields,
+                                            engine=db.get_bind())
     except Exception as e:
         raise HTTPException(400, str(e))
     return StudentPreviewResponse(**diff)
@@ -219,13 +220,14 @@ async def upload_students(
     file: UploadFile = File(...),
     remove_missing: bool = Form(False),
     update_fields: str = Form("klasse,fehltage"),
+    db: Session = Depends(get_db),
     _: str = Depends(get_current_user),
 ):
     csv_bytes = await file.read()
     fields = {f.strip() for f in update_fields.split(",") if f.strip()}
     try:
         added, updated, removed, errors = sync_students_from_upload(
-            csv_bytes, remove_missing, update_fields=fields
+            csv_bytes, remove_missing, update_fields=fields, engine=db.get_bind()
         )
     except Exception as e:
         raise HTTPException(400, str(e))
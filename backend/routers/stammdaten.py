@@ -6,7 +6,7 @@ from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from db_helpers import get_students_by_class
+from db_helpers import get_students_by_class, store_latex
 from db_schema import Student
 from deps import get_db, get_current_user
 from schemas import StudentBaseData, StudentBaseDataUpdate, ReportTextUpdate, RemarksUpdate
@@ -31,6 +31,15 @@ def _student_to_schema(stu: Student) -> StudentBaseData:
     )
 
 
+def _store_latex(db: Session, texts: list[str | None], replaced: list[str | None]) -> None:
+    """Render saved rich text for the export; 422 if it cannot be converted."""
+    try:
+        store_latex(texts, db, replaced=replaced)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(422, f"Text kann nicht für das Zeugnis umgewandelt werden: {e}")
+
+
 @router.get("", response_model=list[StudentBaseData])
 def list_stammdaten(
     class_name: str,
@@ -46,6 +55,8 @@ def save_stammdaten_batch(
     db: Session = Depends(get_db),
 ):
     updated = 0
+    texts: list[str | None] = []
+    replaced: list[str | None] = []
     for item in data:
         stu = db.get(Student, item.id)
         if stu is None:
@@ -59,10 +70,14 @@ def save_stammdaten_batch(
         stu.days_absent_unexcused  = item.days_absent_unexcused
         stu.lessons_absent_excused  = item.lessons_absent_excused
         stu.lessons_absent_unexcused = item.lessons_absent_unexcused
+        if item.remarks != stu.remarks:
+            replaced.append(stu.remarks)
+            texts.append(item.remarks)
         stu.remarks = item.remarks
         stu.lb = item.lb
         stu.gb = item.gb
         updated += 1
+    _store_latex(db, texts, replaced)
     db.commit()
     return {"ok": True, "updated": updated}
 
@@ -90,8 +105,9 @@ def update_student(
         stu.lessons_absent_excused = req.lessons_absent_excused
     if req.lessons_absent_unexcused is not None:
         stu.lessons_absent_unexcused = req.lessons_absent_unexcused
-    if req.remarks is not None:
-        stu.remarks = req.remarks
+    if req.remarks is not None and req.remarks != stu.remarks:
+        old, stu.remarks = stu.remarks, req.remarks
+        _store_latex(db, [stu.remarks], [old])
     if req.lb is not None:
         stu.lb = req.lb
     if req.gb is not None:
@@ -132,7 +148,8 @@ def save_remarks(
     stu = db.get(Student, student_id)
     if stu is None:
         raise HTTPException(404, "Schüler nicht gefunden")
-    stu.remarks = req.remarks
+    old, stu.remarks = stu.remarks, req.remarks
+    _store_latex(db, [stu.remarks], [old])
     db.commit()
     return {"ok": True}
 
@@ -146,6 +163,7 @@ def save_report_text(
     stu = db.get(Student, student_id)
     if stu is None:
         raise HTTPException(404, "Schüler nicht gefunden")
-    stu.report_text = req.report_text
+    old, stu.report_text = stu.report_text, req.report_text
+    _store_latex(db, [stu.report_text], [old])
     db.commit()
     return {"ok": True}
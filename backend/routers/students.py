@@ -1,7 +1,6 @@
 # routers/students.py — grade matrix
 from __future__ import annotations
 
-import pandas as pd
 from collections import defaultdict
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
@@ -9,7 +8,8 @@ from sqlalchemy.orm import Session
 
 from db_helpers import (
     get_students_by_class, get_topics_by_subject,
-    fetch_grade_matrix, persist_grade_matrix, get_niveau,
+    load_grade_matrix, save_grade_matrix, get_niveaus, upsert_niveaus,
+    apply_grade_changes, grade_row_versions,
 )
 from db_schema import (
     Subject, Student, SchoolClass, Topic, Competence, ClassCompetence,
@@ -18,6 +18,7 @@ from db_schema import (
 from deps import get_db, get_current_user
 from schemas import (
     GradeMatrixColumn, GradeMatrixResponse, GradeMatrixRow, GradeMatrixSaveRequest,
+    GradeMatrixPatchRequest, GradeMatrixPatchResponse,
 )
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
@@ -25,6 +26,12 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 LEBENSPRAXIS = "Lebenspraxis"
 
 
+def _latex_error(db: Session, e: ValueError) -> HTTPException:
+    """An HTML niveau that html_to_latex cannot convert (see store_latex)."""
+    db.rollback()
+    return HTTPException(422, f"Niveau-Text kann nicht für das Zeugnis umgewandelt werden: {e}")
+
+
 @router.get("/matrix", response_model=GradeMatrixResponse)
 def get_matrix(
     class_name: str,
@@ -41,10 +48,12 @@ def get_matrix(
         if not lb_gb:
             return GradeMatrixResponse(columns=[], rows=[])
         subj = db.query(Subject).filter_by(name=LEBENSPRAXIS).first()
-        subj_id = subj.id if subj else None
+        lb_ids = [s.id for s in lb_gb]
+        niveaus = get_niveaus(subj.id, lb_ids, db) if subj else {}
+        versions = grade_row_versions(subj.id, lb_ids, db) if subj else {}
         rows = []
         for stu in lb_gb:
-            niveau = (get_niveau(stu.id, subj_id, db) if subj_id else "") or ""
+            niveau = niveaus.get(stu.id, "")
             stype = "gb" if stu.gb else "lb"
             rows.append(GradeMatrixRow(
                 student_id=stu.id,
@@ -53,6 +62,7 @@ def get_matrix(
                 niveau=niveau,
                 grades={},
                 student_type=stype,
+                version=versions.get(stu.id, ""),
             ))
         return GradeMatrixResponse(columns=[], rows=rows)
 
@@ -60,63 +70,28 @@ def get_matrix(
     if not topics:
         return GradeMatrixResponse(columns=[], rows=[])
 
-    df = fetch_grade_matrix(students, topics, subject, db)
-
-    # Merge topics that share the same name (e.g. "Arithmetik" in 5/6 and 7/8).
-    # The canonical topic (highest id = most recent block) wins; grades from
-    # other blocks in the group are coalesced into the canonical column.
-    name_to_ids: dict[str, list[int]] = defaultdict(list)
-    for t in topics:
-        name_to_ids[t.name].append(t.id)
-
-    topic_by_id = {t.id: t for t in topics}
-    canonical_id_for: dict[str, int] = {
-        name: max(ids) for name, ids in name_to_ids.items()
-    }
-
-    # Coalesce duplicate-name columns in the DataFrame
-    for name, ids in name_to_ids.items():
-        if len(ids) < 2:
-            continue
-        canon_col = str(canonical_id_for[name])
-        other_cols = [str(tid) for tid in ids if tid != canonical_id_for[name]]
-        for row_idx in df.index:
-            if not df.at[row_idx, canon_col]:
-                for col in other_cols:
-                    if col in df.columns and df.at[row_idx, col]:
-                        df.at[row_idx, canon_col] = df.at[row_idx, col]
-                        break
-
-    # Build deduplicated topic list preserving first-occurrence order
-    seen: set[str] = set()
-    deduped: list = []
-    for t in topics:
-        if t.name not in seen:
-            seen.add(t.name)
-            deduped.append(topic_by_id[canonical_id_for[t.name]])
-
-    merged_names = {name for name, ids in name_to_ids.items() if len(ids) > 1}
+    matrix = load_grade_matrix(students, topics, subject, db)
 
     columns = [
         GradeMatrixColumn(
             topic_id=t.id,
-            label=t.name if t.name in merged_names else f"{t.name} ({t.block})",
+            label=t.name if merged else f"{t.name} ({t.block})",
         )
-        for t in deduped
+        for t, merged in matrix.columns
     ]
 
     rows: list[GradeMatrixRow] = []
-    for i, stu in enumerate(students):
-        row_data = df.iloc[i]
-        grades = {str(t.id): str(row_data.get(str(t.id), "") or "") for t in deduped}
+    for stu in students:
+        grades = matrix.grades[stu.id]
         stype = "gb" if stu.gb else ("lb" if stu.lb else "normal")
         rows.append(GradeMatrixRow(
             student_id=stu.id,
             last_name=stu.last_name,
             first_name=stu.first_name,
-            niveau=str(row_data.get("Niveau", "") or ""),
-            grades=grades,
+            niveau=matrix.niveaus.get(stu.id, ""),
+            grades={str(tid): str(val or "") for tid, val in grades.items()},
             student_type=stype,
+            version=matrix.versions.get(stu.id, ""),
         ))
 
     return GradeMatrixResponse(columns=columns, rows=rows)
@@ -126,21 +101,19 @@ def get_matrix(
 def save_matrix(req: GradeMatrixSaveRequest, db: Session = Depends(get_db)):
     # Lebenspraxis: save only Niveau per student (no topic grades)
     if req.subject == LEBENSPRAXIS:
-        from db_schema import Student, StudentSubject
         subj = db.query(Subject).filter_by(name=LEBENSPRAXIS).first()
         if not subj:
             return {"ok": True}
-        for row in req.rows:
-            stu = db.query(Student).filter_by(id=row.student_id).first()
-            if not stu:
-                continue
-            link = db.query(StudentSubject).filter_by(
-                student_id=stu.id, subject_id=subj.id
-            ).first()
-            if link:
-                link.niveau = row.niveau or None
-            else:
-                db.add(StudentSubject(student_id=stu.id, subject_id=subj.id, niveau=row.niveau or None))
+        known = set(db.scalars(
+            select(Student.id).where(Student.id.in_([row.student_id for row in req.rows]))
+        ))
+        try:
+            upsert_niveaus(subj.id, {
+                row.student_id: row.niveau or None
+                for row in req.rows if row.student_id in known
+            }, db)
+        except ValueError as e:
+            raise _latex_error(db, e)
         db.commit()
         return {"ok": True}
 
@@ -148,23 +121,76 @@ def save_matrix(req: GradeMatrixSaveRequest, db: Session = Depends(get_db)):
     if not topics:
         raise HTTPException(404, f"Keine Themen für Fach '{req.subject}' gefunden")
 
-    # Reconstruct pandas DataFrame expected by persist_grade_matrix
-    records = []
-    for row in req.rows:
-        record = {
-            "Nachname": row.last_name,
-            "Vorname": row.first_name,
-            "Niveau": row.niveau,
-        }
-        for t in topics:
-            record[str(t.id)] = row.grades.get(str(t.id), "")
-        records.append(record)
-
-    df = pd.DataFrame(records)
-    persist_grade_matrix(req.class_name, req.subject, df, db)
+    topic_cols = {str(t.id) for t in topics}
+    try:
+        save_grade_matrix(req.class_name, req.subject, (
+            (row.last_name, row.first_name, row.niveau,
+             {tid: val for tid, val in row.grades.items() if tid in topic_cols})
+            for row in req.rows
+        ), db)
+    except ValueError as e:
+        raise _latex_error(db, e)
     return {"ok": True}
 
 
+@router.patch("/matrix", response_model=GradeMatrixPatchResponse)
+def patch_matrix(req: GradeMatrixPatchRequest, db: Session = Depends(get_db)):
+    """Save only the changed cells. Each touched row must carry the version it
+    was loaded with; if another editor changed the row since, nothing is
+    written and 409 lists the conflicting student ids."""
+    subj_id = db.scalar(select(Subject.id).where(Subject.name == req.subject))
+    if subj_id is None:
+        raise HTTPException(404, f"Fach '{req.subject}' nicht gefunden")
+
+    touched = sorted({c.student_id for c in req.changes})
+    if not touched:
+        return GradeMatrixPatchResponse(versions={})
+    missing = [sid for sid in touched if str(sid) not in req.versions]
+    if missing:
+        raise HTTPException(428, f"Versionsangabe fehlt für Schüler {missing}")
+
+    # Lock the touched rows so check-and-write is atomic (no-op on SQLite)
+    found = set(db.scalars(
+        select(Student.id)
+        .join(SchoolClass, Student.class_id == SchoolClass.id)
+        .where(SchoolClass.name == req.class_name, Student.id.in_(touched))
+        .with_for_update(of=Student)
+    ))
+    if len(found) != len(touched):
+        raise HTTPException(404, f"Schüler nicht in Klasse '{req.class_name}': "
+                                 f"{sorted(set(touched) - found)}")
+
+    topic_ids = {c.topic_id for c in req.changes if c.topic_id is not None}
+    valid_topics = set(db.scalars(
+        select(Topic.id).where(Topic.subject_id == subj_id, Topic.id.in_(topic_ids))
+    )) if topic_ids else set()
+    if topic_ids - valid_topics:
+        raise HTTPException(400, f"Themen gehören nicht zu '{req.subject}': "
+                                 f"{sorted(topic_ids - valid_topics)}")
+
+    current = grade_row_versions(subj_id, touched, db)
+    conflicts = [sid for sid in touched if current[sid] != req.versions[str(sid)]]
+    if conflicts:
+        db.rollback()
+        raise HTTPException(409, f"Zwischenzeitlich von anderer Stelle geändert: Schüler {conflicts}")
+
+    grades: dict[tuple[int, int], str] = {}
+    niveaus: dict[int, str] = {}
+    for c in req.changes:
+        if c.topic_id is None:
+            niveaus[c.student_id] = c.value.strip()
+        else:
+            grades[(c.student_id, c.topic_id)] = c.value  # cleaned by apply_grade_changes
+    try:
+        apply_grade_changes(subj_id, grades, niveaus, db)
+    except ValueError as e:
+        raise _latex_error(db, e)
+    db.flush()
+    versions = grade_row_versions(subj_id, touched, db)
+    db.commit()
+    return GradeMatrixPatchResponse(versions={str(sid): v for sid, v in versions.items()})
+
+
 # Subjects shown for LB/GB students per grade level
 _LB_RELEVANT: dict[str, list[str]] = {
     "5": [
@@ -177,6 +177,7 @@ class GradeMatrixRow(BaseModel):
     niveau: str
     grades: dict[str, str]      # str(topic_id) → grade value
     student_type: str = "normal"  # "normal" | "lb" | "gb"
+    version: str = ""           # row version token for PATCH /matrix
 
 
 class GradeMatrixResponse(BaseModel):
@@ -190,6 +191,23 @@ class GradeMatrixSaveRequest(BaseModel):
     rows: list[GradeMatrixRow]
 
 
+class GradeCellChange(BaseModel):
+    student_id: int
+    topic_id: Optional[int] = None  # None → the row's Niveau
+    value: str                      # "" clears the cell
+
+
+class GradeMatrixPatchRequest(BaseModel):
+    class_name: str
+    subject: str
+    changes: list[GradeCellChange]
+    versions: dict[str, str]    # str(student_id) → version from GET /matrix
+
+
+class GradeMatrixPatchResponse(BaseModel):
+    versions: dict[str, str]    # new versions of the changed rows
+
+
 # ---------------------------------------------------------------------------
 # Stammdaten (Student Base Data)
 # ---------------------------------------------------------------------------
@@ -300,6 +318,9 @@ class AdminStudentItem(BaseModel):
 class ExportPrepareRequest(BaseModel):
     student_ids: list[int]
     classroom: str
+    force: bool = False         # recompile even if the cached PDF is current
+    booklet: bool = False       # one PDF for the whole class (single lualatex run)
+    split: bool = False         # booklet only: also split it into per-student PDFs
 
 
 class ExportPrepareResponse(BaseModel):
@@ -6,6 +6,7 @@ from pathlib import Path
 from datetime import date, datetime
 from typing import Dict, List, Optional, Set, Tuple
 
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from db_schema import ENGINE, Student
 from db_helpers import _get_or_create_class
@@ -95,6 +96,7 @@ def compute_diff(
     rows: List[Dict],
     remove_missing: bool,
     update_fields: Set[str],
+    engine: Engine | None = None,
 ) -> dict:
     """
     Compare CSV rows against the current DB and return a structured diff.
@@ -108,7 +110,7 @@ def compute_diff(
     unchanged = 0
     errors: list[str] = []
 
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         processed_ids: Set[int] = set()
 
         for row in rows:
@@ -215,6 +217,7 @@ def _sync_rows(
     rows: List[Dict],
     remove_missing: bool = True,
     update_fields: Optional[Set[str]] = None,
+    engine: Engine | None = None,
 ) -> Tuple[int, int, int, list]:
     """
     Synchronise DB students against parsed CSV rows.
@@ -228,7 +231,7 @@ def _sync_rows(
 
     added = updated = removed = 0
 
-    with Session(ENGINE) as ses:
+    with Session(engine or ENGINE) as ses:
         processed_ids: Set[int] = set()
         errors: list[str] = []
 
@@ -316,24 +319,28 @@ def sync_students_from_upload(
     csv_bytes: bytes,
     remove_missing: bool = True,
     update_fields: Optional[Set[str]] = None,
+    engine: Engine | None = None,
 ) -> Tuple[int, int, int, list]:
     """Sync from uploaded CSV bytes. Returns (added, updated, removed, errors)."""
     rows = _parse_rows(_decode_csv(csv_bytes))
-    return _sync_rows(rows, remove_missing=remove_missing, update_fields=update_fields)
+    return _sync_rows(rows, remove_missing=remove_missing, update_fields=update_fields,
+                      engine=engine)
 
 
 def preview_students_from_upload(
     csv_bytes: bytes,
     remove_missing: bool,
     update_fields: Set[str],
+    engine: Engine | None = None,
 ) -> dict:
     """Dry-run: compute diff without writing to DB."""
     rows = _parse_rows(_decode_csv(csv_bytes))
-    return compute_diff(rows, remove_missing=remove_missing, update_fields=update_fields)
+    return compute_diff(rows, remove_missing=remove_missing, update_fields=update_fields,
+                        engine=engine)
 
 
-def count_students() -> int:
-    with Session(ENGINE) as ses:
+def count_students(engine: Engine | None = None) -> int:
+    with Session(engine or ENGINE) as ses:
         return ses.query(Student).count()
 
 
@@ -8,6 +8,8 @@ Strategy
 - FastAPI TestClient with dependency overrides replaces get_db and auth deps.
 - The app lifespan (auth_pure._ensure_table, run_migrations_all_report_dbs)
   is mocked so tests don't need a live PostgreSQL.
+- The export job store (export_jobs) runs on a SQLite file per session; a
+  file rather than :memory: because compile threads use it concurrently.
 
 psycopg2 note
 -------------
@@ -134,6 +136,28 @@ def fresh_engine():
     eng.dispose()
 
 
+# ---------------------------------------------------------------------------
+# Export job store
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope="session")
+def jobs_engine(tmp_path_factory):
+    eng = create_engine(f"sqlite:///{tmp_path_factory.mktemp('jobs') / 'export_jobs.db'}")
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def job_store(jobs_engine):
+    """export_jobs bound to the session's SQLite file."""
+    import export_jobs
+    with (
+        patch.object(export_jobs, "_engine", jobs_engine),
+        patch.object(export_jobs, "_tables_ready", False),
+    ):
+        yield export_jobs
+
+
 # ---------------------------------------------------------------------------
 # Auth tokens
 # ---------------------------------------------------------------------------
@@ -153,12 +177,13 @@ def lehrer_token():
 # ---------------------------------------------------------------------------
 
 @pytest.fixture
-def client(sqlite_engine):
+def client(sqlite_engine, job_store):
     """
     TestClient with:
     - get_db → SQLite session
     - get_current_user / get_current_admin → bypassed (returns "testadmin")
     - lifespan calls to PostgreSQL → mocked
+    - export job store → SQLite file (job_store)
     """
     def _override_get_db():
         with Session(sqlite_engine) as session:
@@ -33,25 +33,14 @@ def _cleanup():
 class TestAuthPureIntegration:
     def test_create_user_and_verify(self):
         auth_pure.create_user("inttest_user", "Secure1234!", role="lehrer")
-        assert auth_pure.check_credentials("inttest_user", "Secure1234!") is True
+        assert auth_pure.check_credentials("inttest_user", "Secure1234!") == "lehrer"
 
     def test_wrong_password_rejected(self):
         auth_pure.create_user("inttest_user", "Secure1234!", role="lehrer")
-        assert auth_pure.check_credentials("inttest_user", "wrongpw") is False
+        assert auth_pure.check_credentials("inttest_user", "wrongpw") is None
 
     def test_unknown_user_rejected(self):
-        assert auth_pure.check_credentials("nobody_int", "pw") is False
-
-    def test_get_role_lehrer(self):
-        auth_pure.create_user("inttest_user", "Secure1234!", role="lehrer")
-        assert auth_pure.get_role("inttest_user") == "lehrer"
-
-    def test_get_role_admin(self):
-        auth_pure.create_user("inttest_user", "Secure1234!", role="admin")
-        assert auth_pure.get_role("inttest_user") == "admin"
-
-    def test_get_role_unknown_returns_user(self):
-        assert auth_pure.get_role("nobody_int") == "user"
+        assert auth_pure.check_credentials("nobody_int", "pw") is None
 
     def test_list_users_contains_created(self):
         auth_pure.create_user("inttest_user", "Secure1234!", role="lehrer")
@@ -1,7 +1,7 @@
 """test_api_admin.py — HTTP-layer tests for routers/admin.py.
 
 Covers: student listing, user management (list/create/delete),
-competence-sync diff/apply, export prepare/progress/cancel.
+competence-sync diff/apply, export prepare/progress/stream/cancel.
 Export compile is mocked — we only verify the HTTP layer.
 """
 from __future__ import annotations
@@ -105,14 +105,14 @@ class TestAdminListUsers:
 
 class TestAdminCreateUser:
     def test_returns_201(self, client):
-        with patch("auth_pure.create_user"):
+        with patch("auth_pure.create_user_async"):
             r = client.post("/api/admin/users", json={
                 "username": "newteacher", "password": "pass123", "role": "lehrer",
             })
         assert r.status_code == 201
 
     def test_returns_ok(self, client):
-        with patch("auth_pure.create_user"):
+        with patch("auth_pure.create_user_async"):
             r = client.post("/api/admin/users", json={
                 "username": "newteacher", "password": "pass123", "role": "lehrer",
             })
@@ -120,12 +120,21 @@ class TestAdminCreateUser:
 
     def test_duplicate_returns_400(self, client):
         from sqlalchemy.exc import IntegrityError
-        with patch("auth_pure.create_user", side_effect=IntegrityError("", "", None)):
+        with patch("auth_pure.create_user_async", side_effect=IntegrityError("", "", None)):
             r = client.post("/api/admin/users", json={
                 "username": "dup", "password": "pass123", "role": "admin",
             })
         assert r.status_code == 400
 
+    def test_hash_pool_busy_returns_503(self, client):
+        import auth_pure
+        with patch("auth_pure.create_user_async", side_effect=auth_pure.HashPoolBusy()):
+            r = client.post("/api/admin/users", json={
+                "username": "newteacher", "password": "pass123", "role": "lehrer",
+            })
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "2"
+
 
 # ---------------------------------------------------------------------------
 # DELETE /api/admin/users/{username}
@@ -255,6 +264,75 @@ class TestExportEndpoints:
         assert "done" in r.json()
         assert "results" in r.json()
 
+    def _sse(self, client, job_id: str) -> list[dict]:
+        import json
+        r = client.get(f"/api/admin/export/stream/{job_id}")
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/event-stream")
+        return [json.loads(line[len("data: "):])
+                for line in r.text.splitlines() if line.startswith("data: ")]
+
+    def test_progress_includes_metrics(self, client, job_store):
+        job_id = job_store.create_job("/tmp/cl", ["a"], None)
+        job_store.add_result(job_id, "a", None, seconds=2.0, cpu_seconds=1.5)
+        metrics = client.get(f"/api/admin/export/progress/{job_id}").json()["metrics"]
+        assert metrics["wall_p50"] == 2.0 and metrics["cpu_total"] == 1.5
+
+    def test_metrics_endpoints(self, client, job_store):
+        job_id = job_store.create_job("/tmp/cl", ["a"], None)
+        assert client.get("/api/admin/export/metrics").status_code == 200
+        assert client.get(f"/api/admin/export/metrics/{job_id}").json()["results"] == 0
+        assert client.get("/api/admin/export/metrics/nope").status_code == 404
+
+    def test_stream_unknown_job_returns_404(self, client):
+        r = client.get("/api/admin/export/stream/nonexistent-job-id")
+        assert r.status_code == 404
+
+    def test_stream_sends_one_event_per_result_then_done(self, client, job_store):
+        job_id = job_store.create_job("/tmp/cl", ["a", "b"], None)
+        job_store.add_result(job_id, "a", None)
+        job_store.add_result(job_id, "b", "boom")
+        job_store.finish(job_id)
+        events = self._sse(client, job_id)
+        assert [(e["basename"], e["success"]) for e in events[:-1]] == [("a", True), ("b", False)]
+        assert events[-1] == {"type": "done", "index": 2, "total": 2, "cancelled": False}
+
+    def test_stream_sends_results_finished_after_cancel(self, client, job_store):
+        import threading, time
+        job_id = job_store.create_job("/tmp/cl", ["a", "b"], None)
+        job_store.cancel(job_id)
+
+        def worker():  # "a" was already compiling when the cancel came
+            time.sleep(0.05)
+            job_store.add_result(job_id, "a", None)
+            job_store.finish(job_id)
+
+        with patch("routers.admin._STREAM_INTERVAL", 0.01):
+            t = threading.Thread(target=worker)
+            t.start()
+            events = self._sse(client, job_id)
+            t.join()
+        assert events[0]["basename"] == "a"
+        assert events[-1] == {"type": "done", "index": 1, "total": 2, "cancelled": True}
+
+    def test_stream_follows_running_job(self, client, job_store):
+        import threading, time
+        job_id = job_store.create_job("/tmp/cl", ["a", "b"], None)
+
+        def worker():
+            for b in ["a", "b"]:
+                time.sleep(0.05)
+                job_store.add_result(job_id, b, None)
+            job_store.finish(job_id)
+
+        with patch("routers.admin._STREAM_INTERVAL", 0.01):
+            t = threading.Thread(target=worker)
+            t.start()
+            events = self._sse(client, job_id)
+            t.join()
+        assert [e.get("basename") for e in events] == ["a", "b", None]
+        assert events[-1]["type"] == "done"
+
     def test_cancel_known_job(self, client, admin_student):
         with patch("routers.admin.prepare_export", return_value=("/tmp/cl", ["student1"])):
             prep = client.post("/api/admin/export/prepare", json={
@@ -264,3 +342,140 @@ class TestExportEndpoints:
         r = client.post(f"/api/admin/export/cancel/{job_id}")
         assert r.status_code == 200
         assert r.json()["ok"] is True
+
+
+# ---------------------------------------------------------------------------
+# _run_export (compile pool)
+# ---------------------------------------------------------------------------
+
+class TestRunExport:
+    @pytest.fixture
+    def pool(self, job_store):
+        from concurrent.futures import ThreadPoolExecutor
+        p = ThreadPoolExecutor(max_workers=4)
+        with patch("routers.admin.compile_pool", return_value=p), \
+             patch("routers.admin.template_digest", return_value="tpl"), \
+             patch("routers.admin.pdf_is_current", return_value=False):
+            yield p
+        p.shutdown(wait=True)
+
+    def _job(self, store, basenames: list[str], force: bool = False) -> str:
+        return store.create_job("/tmp/cl", basenames, None, force=force)
+
+    def test_compiles_concurrently(self, pool, job_store):
+        import threading, time
+        from routers import admin
+        running, peak, lock = 0, 0, threading.Lock()
+
+        def fake_compile(cl_dir, base, **_):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return None, None
+
+        job_id = self._job(job_store, [f"s{i}" for i in range(8)])
+        with patch("routers.admin.compile_one", side_effect=fake_compile):
+            admin._run_export(job_id)
+        job = job_store.get_job(job_id)
+        assert job["done"] is True
+        assert peak > 1
+        assert [r["index"] for r in job["results"]] == list(range(1, 9))
+        assert {r["basename"] for r in job["results"]} == {f"s{i}" for i in range(8)}
+        assert all(r["seconds"] is not None for r in job["results"])
+
+    def test_per_student_errors_captured(self, pool, job_store):
+        from routers import admin
+        job_id = self._job(job_store, ["ok", "bad"])
+        with patch("routers.admin.compile_one",
+                   side_effect=lambda d, b, **_: (None, "boom") if b == "bad" else (None, None)):
+            admin._run_export(job_id)
+        results = {r["basename"]: r for r in job_store.get_job(job_id)["results"]}
+        assert results["ok"]["success"] is True
+        assert results["bad"]["success"] is False
+        assert results["bad"]["error"] == "boom"
+
+    def test_current_pdfs_are_reused(self, pool, job_store):
+        from routers import admin
+        job_id = self._job(job_store, ["same", "changed"])
+        with patch("routers.admin.pdf_is_current", side_effect=lambda d, b, t: b == "same"), \
+             patch("routers.admin.compile_one", return_value=(None, None)) as run:
+            admin._run_export(job_id)
+        results = {r["basename"]: r for r in job_store.get_job(job_id)["results"]}
+        run.assert_called_once()
+        assert results["same"]["cached"] is True
+        assert results["changed"]["cached"] is False
+
+    def test_force_recompiles_current_pdfs(self, pool, job_store):
+        from routers import admin
+        job_id = self._job(job_store, ["same"], force=True)
+        with patch("routers.admin.pdf_is_current", return_value=True), \
+             patch("routers.admin.compile_one", return_value=(None, None)) as run:
+            admin._run_export(job_id)
+        run.assert_called_once()
+
+    def test_cancel_stops_pending_compiles(self, pool, job_store):
+        from routers import admin
+        job_id = self._job(job_store, [f"s{i}" for i in range(20)])
+        calls = []
+
+        def fake_compile(cl_dir, base, **_):
+            calls.append(base)
+            job_store.cancel(job_id)
+            return None, None
+
+        with patch("routers.admin.compile_one", side_effect=fake_compile):
+            admin._run_export(job_id)
+        job = job_store.get_job(job_id)
+        assert job["done"] is True
+        assert len(calls) < 20
+        # compiles already running at the cancel are still recorded
+        assert sorted(r["basename"] for r in job["results"]) == sorted(calls)
+
+
+class TestRunBooklet:
+    @pytest.fixture
+    def pool(self, job_store):
+        from concurrent.futures import ThreadPoolExecutor
+        p = ThreadPoolExecutor(max_workers=2)
+        with patch("routers.admin.compile_pool", return_value=p), \
+             patch("routers.admin.template_digest", return_value="tpl"), \
+             patch("routers.admin.pdf_is_current", return_value=False):
+            yield p
+        p.shutdown(wait=True)
+
+    def test_prepare_booklet_creates_one_entry_per_pdf(self, client, admin_student):
+        with patch("routers.admin.prepare_export", return_value=("/tmp/cl", ["a", "b"])), \
+             patch("routers.admin.write_booklet", return_value="klasse_10a"), \
+             patch("routers.admin._run_booklet"):
+            r = client.post("/api/admin/export/prepare", json={
+                "student_ids": [admin_student], "classroom": "10a",
+                "booklet": True, "split": True,
+            })
+        assert r.json()["total"] == 3
+
+    def test_compiles_once_then_splits(self, pool, job_store):
+        from routers import admin
+        job_id = job_store.create_job("/tmp/cl", ["klasse_5a", "anna", "ben"], None)
+        with patch("routers.admin.compile_one", return_value=(None, None)) as run, \
+             patch("routers.admin.split_booklet") as split:
+            admin._run_booklet(job_id, split=True)
+        run.assert_called_once()
+        split.assert_called_once()
+        job = job_store.get_job(job_id)
+        assert job["done"] is True
+        assert [r["basename"] for r in job["results"]] == ["klasse_5a", "anna", "ben"]
+        assert all(r["success"] for r in job["results"])
+
+    def test_compile_error_skips_split(self, pool, job_store):
+        from routers import admin
+        job_id = job_store.create_job("/tmp/cl", ["klasse_5a", "anna"], None)
+        with patch("routers.admin.compile_one", return_value=(None, "boom")), \
+             patch("routers.admin.split_booklet") as split:
+            admin._run_booklet(job_id, split=True)
+        split.assert_not_called()
+        results = job_store.get_job(job_id)["results"]
+        assert [(r["basename"], r["error"]) for r in results] == [("klasse_5a", "boom")]
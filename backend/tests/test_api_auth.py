@@ -71,40 +71,35 @@ class TestAuthMe:
 
 class TestLogin:
     def test_valid_credentials_returns_200(self, client):
-        with (
-            patch("auth_pure.check_credentials", return_value=True),
-            patch("auth_pure.get_role", return_value="admin"),
-        ):
+        with patch("auth_pure.check_credentials_async", return_value="admin"):
             r = client.post("/api/auth/login", json={"username": "alice", "password": "secret"})
         assert r.status_code == 200
 
     def test_returns_username_and_role(self, client):
-        with (
-            patch("auth_pure.check_credentials", return_value=True),
-            patch("auth_pure.get_role", return_value="lehrer"),
-        ):
+        with patch("auth_pure.check_credentials_async", return_value="lehrer"):
             r = client.post("/api/auth/login", json={"username": "bob", "password": "pw"})
         assert r.json()["username"] == "bob"
         assert r.json()["role"] == "lehrer"
 
     def test_sets_cookie(self, client):
-        with (
-            patch("auth_pure.check_credentials", return_value=True),
-            patch("auth_pure.get_role", return_value="admin"),
-        ):
+        with patch("auth_pure.check_credentials_async", return_value="admin"):
             r = client.post("/api/auth/login", json={"username": "alice", "password": "secret"})
         assert "access_token" in r.cookies
 
     def test_wrong_credentials_returns_401(self, client):
-        with patch("auth_pure.check_credentials", return_value=False):
+        with patch("auth_pure.check_credentials_async", return_value=None):
             r = client.post("/api/auth/login", json={"username": "alice", "password": "wrong"})
         assert r.status_code == 401
 
+    def test_hash_pool_busy_returns_503(self, client):
+        import auth_pure
+        with patch("auth_pure.check_credentials_async", side_effect=auth_pure.HashPoolBusy()):
+            r = client.post("/api/auth/login", json={"username": "alice", "password": "pw"})
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "2"
+
     def test_ok_field_true_on_success(self, client):
-        with (
-            patch("auth_pure.check_credentials", return_value=True),
-            patch("auth_pure.get_role", return_value="admin"),
-        ):
+        with patch("auth_pure.check_credentials_async", return_value="admin"):
             r = client.post("/api/auth/login", json={"username": "alice", "password": "pw"})
         assert r.json()["ok"] is True
 
@@ -138,7 +133,7 @@ class TestSetup:
     def test_creates_first_admin(self, client):
         with (
             patch("auth_pure.user_count", return_value=0),
-            patch("auth_pure.create_user") as mock_create,
+            patch("auth_pure.create_user_async") as mock_create,
         ):
             r = client.post("/api/auth/setup", json={"username": "admin", "password": "securepass"})
         assert r.status_code == 200
@@ -147,7 +142,7 @@ class TestSetup:
     def test_returns_authenticated_true(self, client):
         with (
             patch("auth_pure.user_count", return_value=0),
-            patch("auth_pure.create_user"),
+            patch("auth_pure.create_user_async"),
         ):
             r = client.post("/api/auth/setup", json={"username": "admin", "password": "securepass"})
         assert r.json()["authenticated"] is True
@@ -156,11 +151,21 @@ class TestSetup:
     def test_sets_cookie_on_setup(self, client):
         with (
             patch("auth_pure.user_count", return_value=0),
-            patch("auth_pure.create_user"),
+            patch("auth_pure.create_user_async"),
         ):
             r = client.post("/api/auth/setup", json={"username": "admin", "password": "securepass"})
         assert "access_token" in r.cookies
 
+    def test_hash_pool_busy_returns_503(self, client):
+        import auth_pure
+        with (
+            patch("auth_pure.user_count", return_value=0),
+            patch("auth_pure.create_user_async", side_effect=auth_pure.HashPoolBusy()),
+        ):
+            r = client.post("/api/auth/setup", json={"username": "admin", "password": "securepass"})
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "2"
+
     def test_already_setup_returns_400(self, client):
         with patch("auth_pure.user_count", return_value=1):
             r = client.post("/api/auth/setup", json={"username": "admin", "password": "securepass"})
@@ -183,7 +188,7 @@ class TestSetup:
 
 class TestCreateUserEndpoint:
     def test_creates_user(self, client):
-        with patch("auth_pure.create_user") as mock_create:
+        with patch("auth_pure.create_user_async") as mock_create:
             r = client.post(
                 "/api/auth/users",
                 json={"username": "teacher1", "password": "pass123", "role": "lehrer"},
@@ -192,7 +197,7 @@ class TestCreateUserEndpoint:
         mock_create.assert_called_once()
 
     def test_returns_username_and_role(self, client):
-        with patch("auth_pure.create_user"):
+        with patch("auth_pure.create_user_async"):
             r = client.post(
                 "/api/auth/users",
                 json={"username": "teacher1", "password": "pass123", "role": "lehrer"},
@@ -214,9 +219,19 @@ class TestCreateUserEndpoint:
         )
         assert r.status_code == 400
 
+    def test_hash_pool_busy_returns_503(self, client):
+        import auth_pure
+        with patch("auth_pure.create_user_async", side_effect=auth_pure.HashPoolBusy()):
+            r = client.post(
+                "/api/auth/users",
+                json={"username": "teacher1", "password": "pass123", "role": "lehrer"},
+            )
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "2"
+
     def test_duplicate_user_returns_409(self, client):
         from sqlalchemy.exc import IntegrityError
-        with patch("auth_pure.create_user", side_effect=IntegrityError("", "", None)):
+        with patch("auth_pure.create_user_async", side_effect=IntegrityError("", "", None)):
             r = client.post(
                 "/api/auth/users",
                 json={"username": "dup", "password": "password", "role": "admin"},
@@ -7,7 +7,7 @@ and mocks for endpoints that just proxy to db_helpers.
 from __future__ import annotations
 
 from datetime import date
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 import pytest
 from sqlalchemy.orm import Session
@@ -194,7 +194,7 @@ class TestSaveCompetences:
                 "class_name": "9a",
                 "changes": [[5, True]],
             })
-        mock_save.assert_called_once_with("9a", [(5, True)])
+        mock_save.assert_called_once_with("9a", [(5, True)], engine=ANY)
 
 
 # ---------------------------------------------------------------------------
@@ -214,7 +214,7 @@ class TestToggleTopic:
             client.post("/api/competences/toggle-topic", json={
                 "class_name": "9a", "topic_id": 3, "value": False,
             })
-        mock_toggle.assert_called_once_with("9a", 3, False)
+        mock_toggle.assert_called_once_with("9a", 3, False, engine=ANY)
 
 
 # ---------------------------------------------------------------------------
@@ -289,13 +289,13 @@ class TestSyncToParallel:
             client.post("/api/competences/sync-to-parallel",
                         params={"class_name": "9a"},
                         json={"target_classes": ["9b"]})
-        mock.assert_called_once_with("9a", ["9b"])
+        mock.assert_called_once_with("9a", ["9b"], engine=ANY)
 
     def test_no_body_passes_none_targets(self, client):
         """No JSON body → helper receives None (sync all)."""
         with patch("routers.competences.sync_competences_to_parallel", return_value=["9b"]) as mock:
             client.post("/api/competences/sync-to-parallel", params={"class_name": "9a"})
-        mock.assert_called_once_with("9a", None)
+        mock.assert_called_once_with("9a", None, engine=ANY)
 
     def test_empty_target_list_passes_none(self, client):
         """Empty target_classes list → treated as None (sync all)."""
@@ -303,7 +303,7 @@ class TestSyncToParallel:
             client.post("/api/competences/sync-to-parallel",
                         params={"class_name": "9a"},
                         json={"target_classes": []})
-        mock.assert_called_once_with("9a", None)
+        mock.assert_called_once_with("9a", None, engine=ANY)
 
     def test_multiple_targets_returned(self, client):
         with patch("routers.competences.sync_competences_to_parallel", return_value=["9b", "9c"]):
@@ -361,7 +361,7 @@ class TestPreviewTable:
         rows_56 = rows_56 if rows_56 is not None else _PREVIEW_ROWS_56
         rows_78 = rows_78 if rows_78 is not None else _PREVIEW_ROWS_78
 
-        def _rows(cn, subj, block):
+        def _rows(cn, subj, block, engine=None):
             return rows_56 if block == "5/6" else rows_78
 
         custom_kwargs = ({"side_effect": custom} if callable(custom)
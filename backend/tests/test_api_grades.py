@@ -1,6 +1,6 @@
 """test_api_grades.py — HTTP-layer tests for routers/students.py (grade matrix).
 
-Covers GET /api/students/matrix and POST /api/students/matrix,
+Covers GET, POST and PATCH /api/students/matrix,
 including the Lebenspraxis special path.
 """
 from __future__ import annotations
@@ -315,6 +315,25 @@ class TestTopicMerge:
         row = r.json()["rows"][0]
         assert row["grades"][str(merge_seed["t78_id"])] == "4"
 
+    def test_patch_clear_removes_alias_grades(self, client, merge_seed, sqlite_engine):
+        """Clearing a merged cell must not bring back the alias topic's grade."""
+        from db_schema import Grade
+        sid, canon = merge_seed["stu_id"], merge_seed["t78_id"]
+        with Session(sqlite_engine) as ses:
+            ses.add(Grade(student_id=sid, topic_id=merge_seed["t56_id"], value="3"))
+            ses.add(Grade(student_id=sid, topic_id=canon, value="2"))
+            ses.commit()
+        params = {"class_name": "merge_cls", "subject": "merge_subj"}
+        version = client.get("/api/students/matrix", params=params).json()["rows"][0]["version"]
+        r = client.patch("/api/students/matrix", json={
+            **params,
+            "changes": [{"student_id": sid, "topic_id": canon, "value": " "}],
+            "versions": {str(sid): version},
+        })
+        assert r.status_code == 200
+        row = client.get("/api/students/matrix", params=params).json()["rows"][0]
+        assert row["grades"][str(canon)] == ""
+
     def test_no_duplicate_names_unchanged(self, client, grade_seed):
         """Matrix without name-duplicates is not affected by merge logic."""
         r = client.get("/api/students/matrix", params={
@@ -434,3 +453,92 @@ class TestSaveMatrix:
         r = client.post("/api/students/matrix", json=payload)
         assert r.status_code == 200
         assert r.json()["ok"] is True
+
+
+# ---------------------------------------------------------------------------
+# PATCH /api/students/matrix
+# ---------------------------------------------------------------------------
+
+class TestPatchMatrix:
+    def _load(self, client) -> dict[int, dict]:
+        r = client.get("/api/students/matrix", params={
+            "class_name": "6a_g", "subject": "Physik_g",
+        })
+        return {row["student_id"]: row for row in r.json()["rows"]}
+
+    def _patch(self, client, changes: list[dict], versions: dict[int, str]):
+        return client.patch("/api/students/matrix", json={
+            "class_name": "6a_g",
+            "subject": "Physik_g",
+            "changes": changes,
+            "versions": {str(k): v for k, v in versions.items()},
+        })
+
+    def test_rows_carry_version(self, client, grade_seed):
+        rows = self._load(client)
+        assert all(row["version"] for row in rows.values())
+
+    def test_saves_changed_cell_only(self, client, grade_seed):
+        anna, tid = grade_seed["anna_id"], grade_seed["t1_id"]
+        before = self._load(client)
+        r = self._patch(client, [{"student_id": anna, "topic_id": tid, "value": "2"}],
+                        {anna: before[anna]["version"]})
+        assert r.status_code == 200
+        after = self._load(client)
+        assert after[anna]["grades"][str(tid)] == "2"
+        assert r.json()["versions"] == {str(anna): after[anna]["version"]}
+        assert after[grade_seed["bob_id"]]["version"] == before[grade_seed["bob_id"]]["version"]
+
+    def test_saves_niveau(self, client, grade_seed):
+        anna = grade_seed["anna_id"]
+        version = self._load(client)[anna]["version"]
+        r = self._patch(client, [{"student_id": anna, "topic_id": None, "value": "G"}],
+                        {anna: version})
+        assert r.status_code == 200
+        assert self._load(client)[anna]["niveau"] == "G"
+
+    def test_empty_value_clears_grade(self, client, grade_seed):
+        anna, tid = grade_seed["anna_id"], grade_seed["t1_id"]
+        cell = {"student_id": anna, "topic_id": tid}
+        version = self._load(client)[anna]["version"]
+        r = self._patch(client, [{**cell, "value": "3"}], {anna: version})
+        r = self._patch(client, [{**cell, "value": ""}], {anna: r.json()["versions"][str(anna)]})
+        assert r.status_code == 200
+        assert self._load(client)[anna]["grades"][str(tid)] == ""
+
+    def test_value_cleaned_like_full_save(self, client, grade_seed):
+        anna, tid = grade_seed["anna_id"], grade_seed["t1_id"]
+        version = self._load(client)[anna]["version"]
+        self._patch(client, [{"student_id": anna, "topic_id": tid, "value": " 2 "}],
+                    {anna: version})
+        assert self._load(client)[anna]["grades"][str(tid)] == "2"
+
+    def test_stale_version_returns_409(self, client, grade_seed):
+        anna, tid = grade_seed["anna_id"], grade_seed["t1_id"]
+        stale = self._load(client)[anna]["version"]
+        self._patch(client, [{"student_id": anna, "topic_id": tid, "value": "1"}], {anna: stale})
+        r = self._patch(client, [{"student_id": anna, "topic_id": tid, "value": "4"}], {anna: stale})
+        assert r.status_code == 409
+        assert self._load(client)[anna]["grades"][str(tid)] == "1"
+
+    def test_missing_version_returns_428(self, client, grade_seed):
+        r = self._patch(client, [{"student_id": grade_seed["anna_id"],
+                                  "topic_id": grade_seed["t1_id"], "value": "1"}], {})
+        assert r.status_code == 428
+
+    def test_foreign_topic_returns_400(self, client, grade_seed):
+        anna = grade_seed["anna_id"]
+        version = self._load(client)[anna]["version"]
+        r = self._patch(client, [{"student_id": anna, "topic_id": 999_999, "value": "1"}],
+                        {anna: version})
+        assert r.status_code == 400
+
+    def test_student_of_other_class_returns_404(self, client, grade_seed):
+        r = self._patch(client, [{"student_id": 999_999, "topic_id": None, "value": "G"}],
+                        {999_999: "x"})
+        assert r.status_code == 404
+
+    def test_no_changes_is_noop(self, client, grade_seed):
+        r = self._patch(client, [], {})
+        assert r.status_code == 200
+        assert r.json()["versions"] == {}
@@ -1,7 +1,7 @@
 """test_api_setup.py — API-level tests for the setup router.
 
 All PostgreSQL-specific functions (list_report_dbs, create_report_db,
-switch_engine) are mocked so these tests run without a live database.
+get_engine) are mocked so these tests run without a live database.
 The DB dependency is served by the SQLite engine from conftest.
 """
 from __future__ import annotations
@@ -93,7 +93,7 @@ class TestCreateDatabase:
         with (
             patch("routers.setup.list_report_dbs", return_value=[]),
             patch("routers.setup.create_report_db", return_value=None),
-            patch("routers.setup.switch_engine", return_value=None),
+            patch("routers.setup.get_engine", return_value=None),
             patch("routers.setup.init_db", return_value=None),
             patch("routers.setup.list_report_dbs", return_value=[VALID_DB_NAME]),
         ):
@@ -104,7 +104,7 @@ class TestCreateDatabase:
         with (
             patch("routers.setup.list_report_dbs", return_value=[]),
             patch("routers.setup.create_report_db", return_value=None),
-            patch("routers.setup.switch_engine", return_value=None),
+            patch("routers.setup.get_engine", return_value=None),
             patch("routers.setup.init_db", return_value=None),
             patch("routers.setup.list_report_dbs", return_value=[EJ_DB_NAME]),
         ):
@@ -117,7 +117,7 @@ class TestCreateDatabase:
         with (
             patch("routers.setup.list_report_dbs", return_value=[VALID_DB_NAME]),
             patch("routers.setup.create_report_db", mock_create),
-            patch("routers.setup.switch_engine", return_value=None),
+            patch("routers.setup.get_engine", return_value=None),
             patch("routers.setup.init_db", return_value=None),
         ):
             r = client.post("/api/databases", json={"name": VALID_DB_NAME})
@@ -133,7 +133,7 @@ class TestSelectDatabase:
     def test_select_existing_db(self, client):
         with (
             patch("routers.setup.list_report_dbs", return_value=[VALID_DB_NAME]),
-            patch("routers.setup.switch_engine", return_value=None),
+            patch("routers.setup.get_engine", return_value=None),
         ):
             r = client.post("/api/databases/select", json={"name": VALID_DB_NAME})
         assert r.status_code == 200
@@ -152,18 +152,25 @@ class TestSelectDatabase:
 
 class TestDeleteDatabase:
     def test_delete_existing(self, client):
-        mock_eng = MagicMock()
-        mock_conn = MagicMock()
-        mock_eng.connect.return_value.__enter__ = lambda s: mock_conn
-        mock_eng.connect.return_value.__exit__ = MagicMock(return_value=False)
+        mock_drop = MagicMock()
         with (
             patch("routers.setup.list_report_dbs", return_value=[VALID_DB_NAME]),
-            patch("routers.setup._pg_base_url", return_value="postgresql://localhost"),
-            patch("sqlalchemy.create_engine", return_value=mock_eng),
+            patch("routers.setup.drop_report_db", mock_drop),
         ):
             r = client.delete(f"/api/databases/{VALID_DB_NAME}")
         assert r.status_code == 200
         assert r.json()["ok"] is True
+        mock_drop.assert_called_once_with(VALID_DB_NAME)
+
+    def test_rereads_list_before_404(self, client):
+        """A DB created by another worker may be missing from the cached list."""
+        mock_list = MagicMock(side_effect=lambda fresh=False: [VALID_DB_NAME] if fresh else [])
+        with (
+            patch("routers.setup.list_report_dbs", mock_list),
+            patch("routers.setup.drop_report_db"),
+        ):
+            r = client.delete(f"/api/databases/{VALID_DB_NAME}")
+        assert r.status_code == 200
 
     def test_delete_nonexistent_returns_404(self, client):
         with patch("routers.setup.list_report_dbs", return_value=[]):
@@ -273,7 +280,7 @@ class TestPublicLatestDb:
         expected = dbs[-1]
         with (
             patch("routers.setup.list_report_dbs", return_value=[VALID_DB_NAME, EJ_DB_NAME]),
-            patch("routers.setup.switch_engine", return_value=None),
+            patch("routers.setup.get_engine", return_value=None),
         ):
             r = client.get("/api/public/latest-db")
         assert r.status_code == 200
@@ -10,7 +10,9 @@ from datetime import date
 import pytest
 from sqlalchemy.orm import Session
 
-from db_schema import Base, SchoolClass, Student
+import db_helpers
+from db_helpers import latex_digest
+from db_schema import Base, LatexCache, SchoolClass, Student
 
 
 # ---------------------------------------------------------------------------
@@ -173,6 +175,26 @@ class TestReportText:
         r = client.get(f"/api/stammdaten/{student}/report-text")
         assert r.json()["report_text"] == "Sehr gut gemacht."
 
+    def test_put_stores_rendered_latex(self, client, student, sqlite_engine):
+        html = "<p>Karl arbeitet <strong>sorgfältig</strong>.</p>"
+        client.put(f"/api/stammdaten/{student}/report-text", json={"report_text": html})
+        with Session(sqlite_engine) as ses:
+            row = ses.get(LatexCache, latex_digest(html))
+            assert row.body == r"Karl arbeitet \textbf{sorgfältig}."
+            client.put(f"/api/stammdaten/{student}/report-text", json={"report_text": "neu"})
+            ses.expire_all()
+            assert ses.get(LatexCache, latex_digest(html)) is None   # replaced, unused
+
+    def test_put_unconvertible_text_returns_422(self, client, student, monkeypatch):
+        def broken(htmls, par_mode=False):
+            raise IndexError("kaputt")
+        monkeypatch.setattr(db_helpers, "html_to_latex_many", broken)
+        r = client.put(f"/api/stammdaten/{student}/report-text",
+                       json={"report_text": "<p>x</p>"})
+        assert r.status_code == 422
+        assert "kaputt" in r.json()["detail"]
+        assert client.get(f"/api/stammdaten/{student}/report-text").json()["report_text"] == ""
+
     def test_get_unknown_student_returns_404(self, client):
         r = client.get("/api/stammdaten/999999/report-text")
         assert r.status_code == 404
@@ -68,7 +68,7 @@ class TestStudentPreviewEndpoint:
     def test_update_fields_parsed_as_set(self, client):
         captured = {}
 
-        def fake_preview(csv_bytes, remove_missing, update_fields):
+        def fake_preview(csv_bytes, remove_missing, update_fields, engine=None):
             captured["fields"] = update_fields
             return PREVIEW_RESULT
 
@@ -85,7 +85,7 @@ class TestStudentPreviewEndpoint:
     def test_remove_missing_passed_correctly(self, client):
         captured = {}
 
-        def fake_preview(csv_bytes, remove_missing, update_fields):
+        def fake_preview(csv_bytes, remove_missing, update_fields, engine=None):
             captured["remove_missing"] = remove_missing
             return PREVIEW_RESULT
 
@@ -112,7 +112,7 @@ class TestStudentPreviewEndpoint:
     def test_default_update_fields_used_when_not_provided(self, client):
         captured = {}
 
-        def fake_preview(csv_bytes, remove_missing, update_fields):
+        def fake_preview(csv_bytes, remove_missing, update_fields, engine=None):
             captured["fields"] = update_fields
             return PREVIEW_RESULT
 
@@ -168,7 +168,7 @@ class TestStudentUploadEndpoint:
     def test_update_fields_passed_to_loader(self, client):
         captured = {}
 
-        def fake_upload(csv_bytes, remove_missing, update_fields):
+        def fake_upload(csv_bytes, remove_missing, update_fields, engine=None):
             captured["fields"] = update_fields
             return UPLOAD_RESULT
 
@@ -186,7 +186,7 @@ class TestStudentUploadEndpoint:
         """Default should NOT include zeugnistext or bemerkungen."""
         captured = {}
 
-        def fake_upload(csv_bytes, remove_missing, update_fields):
+        def fake_upload(csv_bytes, remove_missing, update_fields, engine=None):
             captured["fields"] = update_fields
             return UPLOAD_RESULT
 
@@ -9,16 +9,21 @@ Covers:
 - create_user (admin and lehrer roles)
 - list_users (ordering, structure)
 - delete_user (existing, missing)
-- get_role (existing user, unknown username)
-- check_credentials (correct, wrong password, unknown user)
+- check_credentials (role on success, None for wrong password / unknown user)
+- user count cache (TTL, invalidation, "no users" never cached)
+- _ensure_table (DDL once per process, plain SELECT on the login path)
+- hashing pool (bounded queue, metrics, work factor, async helpers)
 """
 from __future__ import annotations
 
+import asyncio
+
+import threading
 from unittest.mock import patch
 
 import bcrypt
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import Session
 from sqlalchemy.pool import StaticPool
 
@@ -30,10 +35,12 @@ from auth_pure import (
     create_user,
     list_users,
     delete_user,
-    get_role,
     check_credentials,
 )
 
+# the real one — patch_auth stubs auth_pure._ensure_table for every test
+_real_ensure_table = auth_pure._ensure_table
+
 
 # ---------------------------------------------------------------------------
 # Fixtures
@@ -56,11 +63,13 @@ def patch_auth(auth_engine):
     def _noop_ensure():
         AuthBase.metadata.create_all(auth_engine)
 
+    auth_pure.cache_clear()
     with (
         patch.object(auth_pure, "_auth_engine", auth_engine),
         patch.object(auth_pure, "_ensure_table", side_effect=_noop_ensure),
     ):
         yield
+    auth_pure.cache_clear()
 
 
 # ---------------------------------------------------------------------------
@@ -198,50 +207,189 @@ class TestDeleteUser:
         assert list_users()[0]["username"] == "bob"
 
 
-# ---------------------------------------------------------------------------
-# get_role
-# ---------------------------------------------------------------------------
-
-class TestGetRole:
-    def test_returns_admin_role(self, auth_engine):
-        _add_user(auth_engine, "alice", "pw", "admin")
-        assert get_role("alice") == "admin"
-
-    def test_returns_lehrer_role(self, auth_engine):
-        _add_user(auth_engine, "bob", "pw", "lehrer")
-        assert get_role("bob") == "lehrer"
-
-    def test_returns_user_for_unknown(self):
-        assert get_role("nobody") == "user"
-
-
 # ---------------------------------------------------------------------------
 # check_credentials
 # ---------------------------------------------------------------------------
 
 class TestCheckCredentials:
-    def test_correct_password_returns_true(self, auth_engine):
+    def test_correct_password_returns_role(self, auth_engine):
         _add_user(auth_engine, "alice", "correct_pw")
-        assert check_credentials("alice", "correct_pw") is True
+        assert check_credentials("alice", "correct_pw") == "admin"
 
-    def test_wrong_password_returns_false(self, auth_engine):
+    def test_wrong_password_returns_none(self, auth_engine):
         _add_user(auth_engine, "alice", "correct_pw")
-        assert check_credentials("alice", "wrong_pw") is False
+        assert check_credentials("alice", "wrong_pw") is None
 
-    def test_unknown_user_returns_false(self):
-        assert check_credentials("nobody", "pw") is False
+    def test_unknown_user_returns_none(self):
+        assert check_credentials("nobody", "pw") is None
 
-    def test_empty_password_returns_false(self, auth_engine):
+    def test_empty_password_returns_none(self, auth_engine):
         _add_user(auth_engine, "alice", "correct_pw")
-        assert check_credentials("alice", "") is False
+        assert check_credentials("alice", "") is None
 
     def test_case_sensitive_username(self, auth_engine):
         _add_user(auth_engine, "Alice", "pw")
-        assert check_credentials("alice", "pw") is False
+        assert check_credentials("alice", "pw") is None
+
+    def test_returns_lehrer_role(self, auth_engine):
+        _add_user(auth_engine, "bob", "pw", role="lehrer")
+        assert check_credentials("bob", "pw") == "lehrer"
 
     def test_different_users_checked_independently(self, auth_engine):
         _add_user(auth_engine, "alice", "pw_alice")
         _add_user(auth_engine, "bob", "pw_bob")
-        assert check_credentials("alice", "pw_alice") is True
-        assert check_credentials("bob", "pw_alice") is False
-        assert check_credentials("alice", "pw_bob") is False
+        assert check_credentials("alice", "pw_alice") == "admin"
+        assert check_credentials("bob", "pw_alice") is None
+        assert check_credentials("alice", "pw_bob") is None
+
+
+# ---------------------------------------------------------------------------
+# _ensure_table
+# ---------------------------------------------------------------------------
+
+class TestEnsureTable:
+    @pytest.fixture
+    def real_ensure(self):
+        with (
+            patch.object(auth_pure, "_ensure_table", _real_ensure_table),
+            patch.object(auth_pure, "_table_ready", False),
+            patch.object(auth_pure, "_create_schema") as create,
+        ):
+            yield create
+
+    def test_schema_created_once_per_process(self, real_ensure, auth_engine):
+        _add_user(auth_engine, "alice", "pw")
+        check_credentials("alice", "pw")
+        user_count()
+        list_users()
+        assert real_ensure.call_count == 1
+
+    def test_failed_setup_is_retried(self, real_ensure):
+        real_ensure.side_effect = [RuntimeError("DB down"), None]
+        with pytest.raises(RuntimeError):
+            user_count()
+        assert user_count() == 0
+        assert real_ensure.call_count == 2
+
+    def test_login_is_one_select(self, real_ensure, auth_engine):
+        _add_user(auth_engine, "alice", "pw")
+        auth_pure._ensure_table()
+        statements = []
+        listener = lambda _c, _cur, stmt, *_a: statements.append(stmt)
+        event.listen(auth_engine, "before_cursor_execute", listener)
+        try:
+            assert check_credentials("alice", "pw") == "admin"
+        finally:
+            event.remove(auth_engine, "before_cursor_execute", listener)
+        assert len(statements) == 1 and statements[0].lstrip().upper().startswith("SELECT")
+
+
+# ---------------------------------------------------------------------------
+# Hashing pool
+# ---------------------------------------------------------------------------
+
+class TestHashPool:
+    @pytest.fixture(autouse=True)
+    def fresh_pool(self):
+        with (
+            patch.object(auth_pure, "_hash_pool", None),
+            patch.object(auth_pure, "_hash_stats", {k: type(v)() for k, v in
+                                                    auth_pure._hash_stats.items()}),
+            patch.object(auth_pure, "BCRYPT_ROUNDS", 4),
+        ):
+            yield
+            if auth_pure._hash_pool is not None:
+                auth_pure._hash_pool.shutdown()
+
+    def test_full_queue_is_rejected(self):
+        release, started = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return True
+
+        with patch.object(auth_pure, "HASH_WORKERS", 1), patch.object(auth_pure, "HASH_QUEUE", 0):
+            t = threading.Thread(target=auth_pure._run_hash, args=(slow,))
+            t.start()
+            started.wait(5)
+            with pytest.raises(auth_pure.HashPoolBusy):
+                auth_pure._run_hash(slow)
+            info = auth_pure.hash_pool_info()
+            release.set()
+            t.join(5)
+        assert (info["pending"], info["rejected"]) == (1, 1)
+        assert auth_pure.hash_pool_info()["completed"] == 1
+
+    def test_create_user_uses_configured_rounds(self, auth_engine):
+        create_user("alice", "pw")
+        with Session(auth_engine) as ses:
+            assert ses.query(AdminUser).one().password_hash.startswith("$2b$04$")
+
+    def test_async_helpers_match_sync(self, auth_engine):
+        asyncio.run(auth_pure.create_user_async("alice", "pw", role="lehrer"))
+        assert asyncio.run(auth_pure.check_credentials_async("alice", "pw")) == "lehrer"
+        assert asyncio.run(auth_pure.check_credentials_async("alice", "nope")) is None
+        assert asyncio.run(auth_pure.check_credentials_async("nobody", "pw")) is None
+        assert auth_pure.hash_pool_info()["pending"] == 0
+
+    def test_async_waits_without_a_thread(self):
+        release = threading.Event()
+
+        async def many():
+            waiting = [asyncio.ensure_future(auth_pure._await_hash(release.wait, 5))
+                       for _ in range(3)]
+            await asyncio.sleep(0.05)
+            # three hashes pending on one worker, all awaited on this one thread
+            assert auth_pure.hash_pool_info()["pending"] == 3
+            with pytest.raises(auth_pure.HashPoolBusy):
+                await auth_pure._await_hash(release.wait, 5)
+            release.set()
+            return await asyncio.gather(*waiting)
+
+        with patch.object(auth_pure, "HASH_WORKERS", 1), patch.object(auth_pure, "HASH_QUEUE", 2):
+            assert asyncio.run(many()) == [True, True, True]
+        assert auth_pure.hash_pool_info()["pending"] == 0
+
+
+# ---------------------------------------------------------------------------
+# User count cache
+# ---------------------------------------------------------------------------
+
+class TestUserCache:
+    @staticmethod
+    def _queries(auth_engine, fn, *args):
+        statements = []
+        listener = lambda _c, _cur, stmt, *_a: statements.append(stmt)
+        event.listen(auth_engine, "before_cursor_execute", listener)
+        try:
+            result = fn(*args)
+        finally:
+            event.remove(auth_engine, "before_cursor_execute", listener)
+        # only SELECTs: the stubbed _ensure_table issues PRAGMAs (create_all)
+        return result, sum(1 for st in statements if st.lstrip().upper().startswith("SELECT"))
+
+    def test_count_is_cached(self, auth_engine):
+        _add_user(auth_engine, "alice", "pw")
+        assert self._queries(auth_engine, user_count) == (1, 1)
+        assert self._queries(auth_engine, user_count) == (1, 0)
+
+    def test_zero_is_not_cached(self, auth_engine):
+        assert user_count() == 0
+        _add_user(auth_engine, "alice", "pw")     # e.g. created by another worker
+        assert auth_pure.needs_setup() is False
+
+    def test_create_and_delete_invalidate(self, auth_engine):
+        _add_user(auth_engine, "alice", "pw")
+        assert user_count() == 1
+        with patch.object(auth_pure, "BCRYPT_ROUNDS", 4):
+            create_user("bob", "pw", role="lehrer")
+        assert user_count() == 2 and user_count("lehrer") == 1
+        delete_user("bob")
+        assert user_count() == 1 and [u["username"] for u in list_users()] == ["alice"]
+
+    def test_cache_expires(self, auth_engine):
+        _add_user(auth_engine, "alice", "pw")
+        with patch.object(auth_pure, "CACHE_TTL", 0):
+            user_count()
+            assert self._queries(auth_engine, user_count) == (1, 1)
@@ -15,7 +15,9 @@ Covers:
 - sync_competences_to_parallel: copies selections, stays in year group
 - get_custom_competences / add / delete
 - fetch_grade_matrix: shape, niveau, grades
+- load_grade_matrix / get_niveaus: compact maps, same-name merge, query count
 - persist_grade_matrix: upsert grades and niveau
+- save_grade_matrix / upsert_grades / upsert_niveaus: set-based upsert, query count
 """
 from __future__ import annotations
 
@@ -24,14 +26,15 @@ from unittest.mock import patch
 
 import pytest
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import Session
 from sqlalchemy.pool import StaticPool
 
 from db_schema import (
     Base, Subject, Topic, Competence, SchoolClass,
-    ClassCompetence, CustomCompetence, Student, StudentSubject, Grade,
+    ClassCompetence, CustomCompetence, Student, StudentSubject, Grade, LatexCache,
 )
+import db_helpers
 from db_helpers import (
     _clean_grade,
     _get_or_create_class,
@@ -42,13 +45,21 @@ from db_helpers import (
     load_topic_rows,
     toggle_topic,
     get_niveau,
+    get_niveaus,
     set_niveau,
     sync_competences_to_parallel,
     get_custom_competences,
     add_custom_competence,
     delete_custom_competence,
     fetch_grade_matrix,
+    load_grade_matrix,
     persist_grade_matrix,
+    save_grade_matrix,
+    upsert_grades,
+    upsert_niveaus,
+    latex_digest,
+    load_latex,
+    store_latex,
 )
 
 
@@ -608,6 +619,102 @@ class TestFetchGradeMatrix:
         assert anna_row.iloc[0]["Niveau"] == "B2"
 
 
+# ---------------------------------------------------------------------------
+# load_grade_matrix / get_niveaus
+# ---------------------------------------------------------------------------
+
+class _QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class TestLoadGradeMatrix:
+    def test_empty_grades_and_niveaus(self, populated):
+        with Session(populated) as ses:
+            students = get_students_by_class("7a", ses)
+            topics   = get_topics_by_subject("Mathematik", ses)
+            m = load_grade_matrix(students, topics, "Mathematik", ses)
+            stu_ids  = {s.id for s in students}
+        assert set(m.grades) == stu_ids
+        assert all(v == "" for row in m.grades.values() for v in row.values())
+        assert m.niveaus == {}
+
+    def test_grades_and_niveau_by_id(self, populated):
+        with Session(populated) as ses:
+            students = get_students_by_class("7a", ses)
+            topics   = get_topics_by_subject("Mathematik", ses)
+            anna     = next(s for s in students if s.first_name == "Anna")
+            subj     = ses.query(Subject).filter_by(name="Mathematik").first()
+            set_niveau(anna.id, subj.id, "B2", ses)
+            ses.add(Grade(student_id=anna.id, topic_id=topics[0].id, value="2"))
+            ses.commit()
+            m = load_grade_matrix(students, topics, "Mathematik", ses)
+            assert m.grades[anna.id][topics[0].id] == "2"
+            assert m.niveaus[anna.id] == "B2"
+
+    def test_same_name_topics_merged(self, populated):
+        with Session(populated) as ses:
+            subj  = ses.query(Subject).filter_by(name="Mathematik").first()
+            alias = Topic(name="Algebra", block="9/10", subject=subj)
+            ses.add(alias)
+            ses.commit()
+            students = get_students_by_class("7a", ses)
+            topics   = get_topics_by_subject("Mathematik", ses)
+            old_id   = min(t.id for t in topics if t.name == "Algebra")
+            anna     = next(s for s in students if s.first_name == "Anna")
+            ses.add(Grade(student_id=anna.id, topic_id=old_id, value="3"))
+            ses.commit()
+            m = load_grade_matrix(students, topics, "Mathematik", ses)
+            names = [t.name for t, _ in m.columns]
+            merged = {t.name: flag for t, flag in m.columns}
+            canon = next(t.id for t, _ in m.columns if t.name == "Algebra")
+            assert names.count("Algebra") == 1
+            assert merged == {"Algebra": True, "Zahlen": False}
+            assert canon == alias.id
+            assert m.grades[anna.id][canon] == "3"
+
+    def test_raises_for_unknown_subject(self, populated):
+        with Session(populated) as ses:
+            students = get_students_by_class("7a", ses)
+            with pytest.raises(ValueError, match="not found"):
+                load_grade_matrix(students, [], "Nichtexistent", ses)
+
+    def test_query_count_independent_of_class_size(self, populated):
+        with Session(populated) as ses:
+            cls = ses.query(SchoolClass).filter_by(name="7a").first()
+            for i in range(30):
+                ses.add(Student(last_name=f"N{i:02d}", first_name="X",
+                                birthday=date(2012, 3, 1), school_class=cls))
+            ses.commit()
+            students = get_students_by_class("7a", ses)
+            topics   = get_topics_by_subject("Mathematik", ses)
+            with _QueryCounter(populated) as qc:
+                load_grade_matrix(students, topics, "Mathematik", ses)
+        assert qc.count == 3
+
+
+class TestGetNiveaus:
+    def test_returns_only_set_niveaus(self, populated):
+        with Session(populated) as ses:
+            students = get_students_by_class("7a", ses)
+            subj     = ses.query(Subject).filter_by(name="Mathematik").first()
+            anna     = next(s for s in students if s.first_name == "Anna")
+            set_niveau(anna.id, subj.id, "A1", ses)
+            result = get_niveaus(subj.id, [s.id for s in students], ses)
+            assert result == {anna.id: "A1"}
+
+
 # ---------------------------------------------------------------------------
 # persist_grade_matrix
 # ---------------------------------------------------------------------------
@@ -688,3 +795,136 @@ class TestPersistGradeMatrix:
         df = pd.concat([df, extra], ignore_index=True)
         with Session(populated) as ses:
             persist_grade_matrix("7a", "Mathematik", df, ses)  # must not raise
+
+
+# ---------------------------------------------------------------------------
+# save_grade_matrix / upsert_grades / upsert_niveaus
+# ---------------------------------------------------------------------------
+
+class TestSaveGradeMatrix:
+    def test_inserts_then_updates(self, populated):
+        with Session(populated) as ses:
+            topics = get_topics_by_subject("Mathematik", ses)
+            tid = topics[0].id
+            save_grade_matrix("7a", "Mathematik",
+                              [("Müller", "Anna", "B1", {str(tid): "2"})], ses)
+            save_grade_matrix("7a", "Mathematik",
+                              [("Müller", "Anna", "B2", {str(tid): "4"})], ses)
+        with Session(populated) as ses:
+            anna = ses.query(Student).filter_by(first_name="Anna").first()
+            subj = ses.query(Subject).filter_by(name="Mathematik").first()
+            grades = ses.query(Grade).filter_by(student_id=anna.id).all()
+            assert [(g.topic_id, g.value) for g in grades] == [(tid, "4")]
+            assert get_niveau(anna.id, subj.id, ses) == "B2"
+            assert ses.query(StudentSubject).filter_by(student_id=anna.id).count() == 1
+
+    def test_empty_cell_keeps_existing_grade(self, populated):
+        with Session(populated) as ses:
+            tid = get_topics_by_subject("Mathematik", ses)[0].id
+            save_grade_matrix("7a", "Mathematik", [("Müller", "Anna", "", {str(tid): "3"})], ses)
+            save_grade_matrix("7a", "Mathematik", [("Müller", "Anna", "", {str(tid): ""})], ses)
+            anna = ses.query(Student).filter_by(first_name="Anna").first()
+            grade = ses.query(Grade).filter_by(student_id=anna.id, topic_id=tid).one()
+            assert grade.value == "3"
+
+    def test_query_count_independent_of_class_size(self, populated):
+        with Session(populated) as ses:
+            cls = ses.query(SchoolClass).filter_by(name="7a").first()
+            for i in range(30):
+                ses.add(Student(last_name=f"N{i:02d}", first_name="X",
+                                birthday=date(2012, 3, 1), school_class=cls))
+            ses.commit()
+            students = get_students_by_class("7a", ses)
+            topics   = get_topics_by_subject("Mathematik", ses)
+            rows = [
+                (s.last_name, s.first_name, "B1", {str(t.id): "2" for t in topics})
+                for s in students
+            ]
+            with _QueryCounter(populated) as qc:
+                save_grade_matrix("7a", "Mathematik", rows, ses)
+        # class lookup, student map, subject id, previous niveaus, niveau upsert,
+        # grade upsert (no HTML niveaus: latex_cache untouched)
+        assert qc.count == 6
+        with Session(populated) as ses:
+            assert ses.query(Grade).count() == len(students) * len(topics)
+
+
+class TestUpsertHelpers:
+    def test_upsert_grades_empty_is_noop(self, populated):
+        with Session(populated) as ses, _QueryCounter(populated) as qc:
+            upsert_grades({}, ses)
+        assert qc.count == 0
+
+    def test_upsert_niveaus_does_not_commit(self, populated):
+        with Session(populated) as ses:
+            anna = ses.query(Student).filter_by(first_name="Anna").first()
+            subj = ses.query(Subject).filter_by(name="Mathematik").first()
+            upsert_niveaus(subj.id, {anna.id: "A2"}, ses)
+            ses.rollback()
+            assert get_niveau(anna.id, subj.id, ses) == ""
+
+
+# ---------------------------------------------------------------------------
+# latex_cache: store_latex / load_latex
+# ---------------------------------------------------------------------------
+
+class TestLatexCache:
+    HTML = "<p>Erster Absatz</p><p>Zweiter <em>Absatz</em></p>"
+
+    def test_stores_both_modes(self, populated):
+        with Session(populated) as ses:
+            store_latex([self.HTML, self.HTML, None, ""], ses)
+            assert ses.query(LatexCache).count() == 1
+            cell, body = load_latex([self.HTML], ses)[self.HTML]
+        assert r"\par" in body and r"\par" not in cell
+        assert r"\textit{Absatz}" in cell
+
+    def test_replaced_text_dropped_only_when_unused(self, populated):
+        with Session(populated) as ses:
+            anna, bob = ses.query(Student).order_by(Student.first_name).all()
+            anna.report_text = bob.remarks = self.HTML
+            store_latex([self.HTML], ses)
+            anna.report_text = "neu"
+            store_latex(["neu"], ses, replaced=[self.HTML])
+            assert load_latex([self.HTML], ses)          # still Bob's remark
+            bob.remarks = ""
+            store_latex([""], ses, replaced=[self.HTML])
+            assert load_latex([self.HTML, "neu"], ses).keys() == {"neu"}
+
+    def test_conversion_error_is_value_error(self, populated, monkeypatch):
+        def broken(htmls, par_mode=False):
+            raise RecursionError()
+        monkeypatch.setattr(db_helpers, "html_to_latex_many", broken)
+        with Session(populated) as ses, pytest.raises(ValueError, match="RecursionError"):
+            store_latex(["<p>x</p>"], ses)
+
+    def test_converter_version_is_part_of_key(self, populated, monkeypatch):
+        with Session(populated) as ses:
+            store_latex([self.HTML], ses)
+            monkeypatch.setattr(db_helpers, "CONVERTER_VERSION", db_helpers.CONVERTER_VERSION + 1)
+            assert load_latex([self.HTML], ses) == {}
+            store_latex([self.HTML], ses)
+            assert ses.query(LatexCache).count() == 2
+
+    def test_purge_drops_other_converter_versions(self, populated, monkeypatch):
+        with Session(populated) as ses:
+            store_latex([self.HTML], ses)
+            ses.commit()
+        monkeypatch.setattr(db_helpers, "CONVERTER_VERSION", db_helpers.CONVERTER_VERSION + 1)
+        with Session(populated) as ses:
+            store_latex(["<p>neu</p>"], ses)
+            ses.commit()
+        assert db_helpers.purge_stale_latex(populated) == 1
+        with Session(populated) as ses:
+            assert load_latex(["<p>neu</p>"], ses)
+            assert ses.scalars(select(LatexCache.converter_version)).all() == [
+                db_helpers.CONVERTER_VERSION]
+
+    def test_upsert_niveaus_renders_html_niveaus_only(self, populated):
+        with Session(populated) as ses:
+            anna, bob = ses.query(Student).order_by(Student.first_name).all()
+            subj = ses.query(Subject).filter_by(name="Mathematik").first()
+            upsert_niveaus(subj.id, {anna.id: " <p>LB-Text</p> ", bob.id: "B1"}, ses)
+            assert ses.scalars(select(LatexCache.cell)).all() == ["LB-Text"]
+            upsert_niveaus(subj.id, {anna.id: "A2"}, ses)
+            assert ses.query(LatexCache).count() == 0
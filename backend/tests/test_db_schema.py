@@ -6,7 +6,9 @@ Covers:
 - populate_from_dict: initial population, idempotency
 - ensure_default_classes: creation, idempotency
 - switch_engine: no-op when same DB, module propagation
-- list_report_dbs / create_report_db: tested via mocking
+- get_engine / dispose_engine: per-DB registry, LRU eviction
+- list_report_dbs / create_report_db / drop_report_db: tested via mocking,
+  including the report-DB list cache
 """
 from __future__ import annotations
 
@@ -28,6 +30,8 @@ from db_schema import (
     populate_from_dict,
     suggest_db_name,
     switch_engine,
+    get_engine,
+    dispose_engine,
     list_report_dbs,
     create_report_db,
     _pg_base_url,
@@ -183,7 +187,7 @@ class TestEnsureDefaultClasses:
 class TestInitDb:
     def test_creates_tables(self, fresh_engine, monkeypatch):
         monkeypatch.setattr(db_schema, "ENGINE", fresh_engine)
-        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda: None)
+        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda engine=None: None)
         init_db(populate=False)
         inspector = sa_inspect(fresh_engine)
         tables = inspector.get_table_names()
@@ -193,7 +197,7 @@ class TestInitDb:
 
     def test_populate_true_fills_subjects(self, fresh_engine, monkeypatch):
         monkeypatch.setattr(db_schema, "ENGINE", fresh_engine)
-        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda: None)
+        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda engine=None: None)
         # Use real COMPETENCES (large but tests real data path)
         init_db(populate=True)
         with Session(fresh_engine) as ses:
@@ -202,7 +206,7 @@ class TestInitDb:
 
     def test_drop_true_recreates_schema(self, fresh_engine, monkeypatch):
         monkeypatch.setattr(db_schema, "ENGINE", fresh_engine)
-        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda: None)
+        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda engine=None: None)
         # First init
         init_db(populate=False)
         # Add a class manually
@@ -217,7 +221,7 @@ class TestInitDb:
 
     def test_init_is_safe_to_call_twice(self, fresh_engine, monkeypatch):
         monkeypatch.setattr(db_schema, "ENGINE", fresh_engine)
-        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda: None)
+        monkeypatch.setattr(db_schema, "ensure_school_year_entry", lambda engine=None: None)
         init_db(populate=False)
         init_db(populate=False)  # must not raise
 
@@ -226,6 +230,23 @@ class TestInitDb:
 # switch_engine
 # ---------------------------------------------------------------------------
 
+@pytest.fixture
+def empty_registry():
+    """Isolate the engine registry so mocked engines don't leak between tests."""
+    saved = dict(db_schema._engines)
+    db_schema._engines.clear()
+    yield db_schema._engines
+    db_schema._engines.clear()
+    db_schema._engines.update(saved)
+
+
+def _mock_engine(db_name: str) -> MagicMock:
+    eng = MagicMock()
+    eng.url.database = db_name
+    return eng
+
+
+@pytest.mark.usefixtures("empty_registry")
 class TestSwitchEngine:
     def test_noop_when_same_db(self, monkeypatch):
         original = db_schema.ENGINE
@@ -284,63 +305,170 @@ class TestSwitchEngine:
 
 
 # ---------------------------------------------------------------------------
-# list_report_dbs / create_report_db (mock PG admin connection)
+# get_engine / dispose_engine
+# ---------------------------------------------------------------------------
+
+class TestEngineRegistry:
+    def test_same_name_returns_same_engine(self, empty_registry):
+        with (
+            patch.object(db_schema, "_make_engine", side_effect=_mock_engine) as mk,
+            patch("migrations.run_migrations", return_value=None),
+        ):
+            first = get_engine("reports_2025_26_hj")
+            second = get_engine("reports_2025_26_hj")
+        assert first is second
+        assert mk.call_count == 1
+
+    def test_different_names_get_different_engines(self, empty_registry):
+        with (
+            patch.object(db_schema, "_make_engine", side_effect=_mock_engine),
+            patch("migrations.run_migrations", return_value=None),
+        ):
+            hj = get_engine("reports_2025_26_hj")
+            ej = get_engine("reports_2025_26_ej")
+        assert hj is not ej
+        assert hj.url.database == "reports_2025_26_hj"
+        assert ej.url.database == "reports_2025_26_ej"
+
+    def test_does_not_touch_global_engine(self, empty_registry):
+        original = db_schema.ENGINE
+        with (
+            patch.object(db_schema, "_make_engine", side_effect=_mock_engine),
+            patch("migrations.run_migrations", return_value=None),
+        ):
+            get_engine("reports_2025_26_hj")
+        assert db_schema.ENGINE is original
+
+    def test_lru_evicts_and_disposes_oldest(self, empty_registry, monkeypatch):
+        monkeypatch.setattr(db_schema, "ENGINE_CACHE_SIZE", 2)
+        with (
+            patch.object(db_schema, "_make_engine", side_effect=_mock_engine),
+            patch("migrations.run_migrations", return_value=None),
+        ):
+            a = get_engine("reports_a")
+            b = get_engine("reports_b")
+            get_engine("reports_a")           # touch a → b is now oldest
+            c = get_engine("reports_c")
+        assert list(empty_registry) == ["reports_a", "reports_c"]
+        b.dispose.assert_called_once()
+        a.dispose.assert_not_called()
+        c.dispose.assert_not_called()
+
+    def test_failed_connection_not_cached(self, empty_registry):
+        bad_engine = _mock_engine("reports_9999_99_hj")
+        bad_engine.connect.side_effect = Exception("connection refused")
+        with patch.object(db_schema, "_make_engine", return_value=bad_engine):
+            with pytest.raises(Exception, match="connection refused"):
+                get_engine("reports_9999_99_hj")
+        assert "reports_9999_99_hj" not in empty_registry
+
+    def test_dispose_engine_removes_entry(self, empty_registry):
+        with (
+            patch.object(db_schema, "_make_engine", side_effect=_mock_engine),
+            patch("migrations.run_migrations", return_value=None),
+        ):
+            eng = get_engine("reports_2025_26_hj")
+        dispose_engine("reports_2025_26_hj")
+        assert "reports_2025_26_hj" not in empty_registry
+        eng.dispose.assert_called_once()
+
+    def test_dispose_unknown_is_noop(self, empty_registry):
+        dispose_engine("reports_does_not_exist")
+
+
+# ---------------------------------------------------------------------------
+# list_report_dbs / create_report_db / drop_report_db (mock MAINT_ENGINE)
 # ---------------------------------------------------------------------------
 
+def _mock_maint(rows=()):
+    """A MAINT_ENGINE stand-in whose connection returns *rows*."""
+    conn = MagicMock()
+    conn.execute.return_value = list(rows)
+    conn.execution_options.return_value = conn
+    eng = MagicMock()
+    eng.connect.return_value.__enter__ = lambda s: conn
+    eng.connect.return_value.__exit__ = MagicMock(return_value=False)
+    return eng, conn
+
+
+@pytest.fixture
+def no_db_list_cache():
+    db_schema.forget_report_dbs()
+    yield
+    db_schema.forget_report_dbs()
+
+
+@pytest.mark.usefixtures("no_db_list_cache")
 class TestListReportDbs:
-    def test_returns_only_reports_dbs(self, monkeypatch):
-        mock_rows = [("reports_2024_25_hj",), ("reports_2025_26_ej",)]
-        mock_conn = MagicMock()
-        mock_conn.execute.return_value = mock_rows
-        mock_ctx = MagicMock()
-        mock_ctx.__enter__ = lambda s: mock_conn
-        mock_ctx.__exit__ = MagicMock(return_value=False)
-        mock_eng = MagicMock()
-        mock_eng.connect.return_value = mock_ctx
-
-        with patch("db_schema.create_engine", return_value=mock_eng):
+    def test_returns_only_reports_dbs(self):
+        eng, _ = _mock_maint([("reports_2024_25_hj",), ("reports_2025_26_ej",)])
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
             result = list_report_dbs()
 
         assert result == ["reports_2024_25_hj", "reports_2025_26_ej"]
 
-    def test_returns_empty_list_when_none(self, monkeypatch):
-        mock_conn = MagicMock()
-        mock_conn.execute.return_value = []
-        mock_ctx = MagicMock()
-        mock_ctx.__enter__ = lambda s: mock_conn
-        mock_ctx.__exit__ = MagicMock(return_value=False)
-        mock_eng = MagicMock()
-        mock_eng.connect.return_value = mock_ctx
-
-        with patch("db_schema.create_engine", return_value=mock_eng):
+    def test_returns_empty_list_when_none(self):
+        eng, _ = _mock_maint()
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
             result = list_report_dbs()
 
         assert result == []
 
+    def test_cached_within_ttl(self):
+        eng, conn = _mock_maint([("reports_2025_26_hj",)])
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
+            first = list_report_dbs()
+            first.append("mutated by caller")
+            assert list_report_dbs() == ["reports_2025_26_hj"]
+        assert conn.execute.call_count == 1
+
+    def test_fresh_and_expired_reread(self):
+        eng, conn = _mock_maint([("reports_2025_26_hj",)])
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
+            list_report_dbs()
+            list_report_dbs(fresh=True)
+            with patch.object(db_schema, "REPORT_DBS_TTL", 0):
+                list_report_dbs()
+        assert conn.execute.call_count == 3
+
+    def test_create_and_drop_invalidate(self, empty_registry):
+        eng, conn = _mock_maint([("reports_2025_26_hj",)])
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
+            list_report_dbs()
+            create_report_db("reports_2025_26_ej")
+            list_report_dbs()
+            db_schema.drop_report_db("reports_2025_26_ej")
+            list_report_dbs()
+        selects = [c for c in conn.execute.call_args_list if "pg_database" in str(c.args[0])]
+        assert len(selects) == 3
+
 
 class TestCreateReportDb:
     def test_executes_create_database(self):
-        mock_conn = MagicMock()
-        mock_ctx = MagicMock()
-        mock_ctx.__enter__ = lambda s: mock_conn
-        mock_ctx.__exit__ = MagicMock(return_value=False)
-        mock_eng = MagicMock()
-        mock_eng.connect.return_value = mock_ctx
-
-        with patch("db_schema.create_engine", return_value=mock_eng):
+        eng, conn = _mock_maint()
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
             create_report_db("reports_2025_26_hj")
 
-        executed_sql = mock_conn.execute.call_args[0][0]
+        executed_sql = conn.execute.call_args[0][0]
         assert "CREATE DATABASE" in str(executed_sql)
         assert "reports_2025_26_hj" in str(executed_sql)
 
     def test_uses_autocommit_isolation(self):
-        mock_eng = MagicMock()
-        mock_eng.connect.return_value.__enter__ = lambda s: MagicMock()
-        mock_eng.connect.return_value.__exit__ = MagicMock(return_value=False)
-
-        with patch("db_schema.create_engine", return_value=mock_eng) as mock_ce:
+        eng, conn = _mock_maint()
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
             create_report_db("reports_2025_26_hj")
 
-        _, kwargs = mock_ce.call_args
-        assert kwargs.get("isolation_level") == "AUTOCOMMIT"
+        conn.execution_options.assert_called_once_with(isolation_level="AUTOCOMMIT")
+
+
+class TestDropReportDb:
+    def test_disposes_engine_then_drops(self, empty_registry):
+        registered = MagicMock()
+        empty_registry["reports_2025_26_hj"] = registered
+        eng, conn = _mock_maint()
+        with patch.object(db_schema, "MAINT_ENGINE", eng):
+            db_schema.drop_report_db("reports_2025_26_hj")
+
+        registered.dispose.assert_called_once()
+        assert 'DROP DATABASE IF EXISTS "reports_2025_26_hj" WITH (FORCE)' in \
+            str(conn.execute.call_args[0][0])
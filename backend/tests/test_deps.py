@@ -167,3 +167,58 @@ class TestOptionalUserRole:
         token = create_token("alice", role="admin")
         result = optional_user_role(access_token=token)
         assert result == ("alice", "admin")
+
+
+# ---------------------------------------------------------------------------
+# Verified-token cache / once per request
+# ---------------------------------------------------------------------------
+
+class TestTokenCache:
+    @pytest.fixture(autouse=True)
+    def _clear(self):
+        deps.token_cache_clear()
+        yield
+        deps.token_cache_clear()
+
+    def test_second_decode_skips_signature_check(self):
+        token = create_token("alice", role="lehrer")
+        with patch.object(deps.jwt, "decode", wraps=jwt.decode) as dec:
+            assert _decode_token(token) == ("alice", "lehrer")
+            assert _decode_token(token) == ("alice", "lehrer")
+        assert dec.call_count == 1
+
+    def test_invalid_token_not_cached(self):
+        _decode_token("not.a.token")
+        assert "not.a.token" not in deps._token_cache
+
+    def test_cached_token_expires(self):
+        token = create_token("alice")
+        assert _decode_token(token) == ("alice", "admin")
+        exp = deps._token_cache[token][2]
+        with patch.object(deps.time, "time", return_value=exp + 1):
+            assert _decode_token(token) is None
+        assert token not in deps._token_cache
+
+    def test_bounded_lru(self):
+        tokens = [create_token(f"user{i}") for i in range(4)]
+        with patch.object(deps, "JWT_CACHE_SIZE", 3):
+            for t in tokens[:3]:
+                _decode_token(t)
+            _decode_token(tokens[0])             # most recently used now
+            _decode_token(tokens[3])
+        assert list(deps._token_cache) == [tokens[2], tokens[0], tokens[3]]
+
+    def test_size_zero_disables(self):
+        with patch.object(deps, "JWT_CACHE_SIZE", 0):
+            _decode_token(create_token("alice"))
+        assert not deps._token_cache
+
+    def test_principal_resolved_once_per_request(self):
+        token = create_token("alice", role="admin")
+        request = MagicMock()
+        request.state = type("State", (), {})()
+        with patch.object(deps, "_decode_token", wraps=_decode_token) as dec:
+            assert get_current_user(access_token=token, request=request) == "alice"
+            assert get_current_admin(access_token=token, request=request) == "alice"
+            assert optional_user_role(access_token=token, request=request) == ("alice", "admin")
+        assert dec.call_count == 1
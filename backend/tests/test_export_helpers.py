@@ -5,17 +5,27 @@ Covers:
 - _lua: dict/list/str/bool/int/float/None serialisation, string escaping
 - _numeric_or_str: grade coercion, 0-9 only int-cast, comma decimal
 - _student_to_lua: topic inclusion for custom-only competences
+- PDF cache: pdf_is_current / compile_one / _compile_selected source digests
+- prepare_export: class-level prefetch, query count independent of class size
 """
 from __future__ import annotations
 
 import datetime
+import os
+from pathlib import Path
+from unittest.mock import patch
+
 import pytest
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
 
+import export
 from export import _slug, _lua, _numeric_or_str, _student_to_lua
 from db_schema import (
-    SchoolClass, SchoolYear, Student, Subject, Topic,
-    StudentSubject, Competence, ClassCompetence, CustomCompetence,
+    Base, SchoolClass, SchoolYear, Student, Subject, Topic,
+    StudentSubject, Competence, ClassCompetence, CustomCompetence, Grade, LatexCache,
 )
+from db_helpers import store_latex
 
 
 # ---------------------------------------------------------------------------
@@ -155,6 +165,21 @@ class TestLuaCollections:
         assert result.startswith("{")
         assert result.endswith("}")
 
+    def test_exact_layout(self):
+        assert _lua({"a": [1, {"b": "x"}, []], "c": {}}) == (
+            "{\n  a = {\n1,\n{\n      b = 'x',\n    },\n{},\n  },\n  c = {},\n}"
+        )
+
+    def test_compact(self):
+        assert _lua({"a": [1, {"b": "it's"}, []], "c": None}, compact=True) == \
+            "{a={1,{b='it\\'s',},{},},c=null,}"
+
+    def test_deep_nesting_does_not_recurse(self):
+        obj: list = []
+        for _ in range(5000):
+            obj = [obj, 1]
+        assert _lua(obj, compact=True).count("{") == 5001
+
 
 # ---------------------------------------------------------------------------
 # _numeric_or_str
@@ -281,3 +306,477 @@ class TestStudentToLuaCustomOnlyTopic:
         sel_comp = {comp_id + 1000}
         result = _student_to_lua(stu, sy, sel_comp, db_session)
         assert "Kann Farben mischen" not in result
+
+
+# ---------------------------------------------------------------------------
+# Template deployment
+# ---------------------------------------------------------------------------
+
+class TestCopyTemplate:
+    @pytest.fixture
+    def src(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        src = tmp_path / "TexTemplate"
+        (src / "img").mkdir(parents=True)
+        (src / "Zeugnis.tex").write_text("v1")
+        (src / "img" / "logo.png").write_bytes(b"png")
+        return src
+
+    def test_first_deploy_copies_tree(self, src, tmp_path):
+        dst = tmp_path / "out"
+        assert export._copy_template(dst) == 2
+        assert (dst / "img" / "logo.png").read_bytes() == b"png"
+
+    def test_unchanged_files_are_not_rewritten(self, src, tmp_path):
+        dst = tmp_path / "out"
+        export._copy_template(dst)
+        inode = (dst / "Zeugnis.tex").stat().st_ino
+        assert export._copy_template(dst) == 0
+        assert (dst / "Zeugnis.tex").stat().st_ino == inode
+
+    def test_changed_file_is_replaced(self, src, tmp_path):
+        import os
+        dst = tmp_path / "out"
+        export._copy_template(dst)
+        (src / "Zeugnis.tex").write_text("v2")
+        os.utime(src / "Zeugnis.tex", ns=(1, 1))
+        assert export._copy_template(dst) == 1
+        assert (dst / "Zeugnis.tex").read_text() == "v2"
+        assert not list(dst.glob(".*.tmp"))
+
+
+# ---------------------------------------------------------------------------
+# PDF cache
+# ---------------------------------------------------------------------------
+
+class TestPdfCache:
+    @pytest.fixture
+    def cl_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "TexTemplate").mkdir()
+        (tmp_path / "TexTemplate" / "Zeugnis.tex").write_text("template v1")
+        d = tmp_path / "5a"
+        d.mkdir()
+        (d / "anna.lua").write_text("student = {}")
+        (d / "anna.tex").write_text("tex")
+        return d
+
+    @staticmethod
+    def _fake_compile(class_dir, base, passes=None):
+        pdf = class_dir / f"{base}.pdf"
+        pdf.write_bytes(b"%PDF")
+        return pdf
+
+    def _compile(self, cl_dir):
+        with patch.object(export, "_compile_tex", side_effect=self._fake_compile):
+            return export.compile_one(cl_dir, "anna")
+
+    def test_not_current_before_first_compile(self, cl_dir):
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_current_after_compile(self, cl_dir):
+        self._compile(cl_dir)
+        assert export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_lua_change_invalidates(self, cl_dir):
+        self._compile(cl_dir)
+        (cl_dir / "anna.lua").write_text("student = { name = 'x' }")
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_template_change_invalidates(self, cl_dir):
+        self._compile(cl_dir)
+        (cl_dir.parent / "TexTemplate" / "Zeugnis.tex").write_text("template v2.0")
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_failed_compile_drops_digest(self, cl_dir):
+        import subprocess
+        self._compile(cl_dir)
+        err = subprocess.CalledProcessError(1, "lualatex", output=b"", stderr=b"boom")
+        with patch.object(export, "_compile_tex", side_effect=err):
+            _, msg = export.compile_one(cl_dir, "anna")
+        assert msg == "boom"
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_compile_selected_skips_current(self, cl_dir):
+        self._compile(cl_dir)
+        with patch.object(export, "_compile_tex", side_effect=self._fake_compile) as run:
+            compiled, errors = export._compile_selected(cl_dir, ["anna"])
+        run.assert_not_called()
+        assert compiled == [cl_dir / "anna.pdf"] and errors == {}
+
+    def test_compile_selected_force_recompiles(self, cl_dir):
+        self._compile(cl_dir)
+        with patch.object(export, "_compile_tex", side_effect=self._fake_compile) as run:
+            export._compile_selected(cl_dir, ["anna"], force=True)
+        run.assert_called_once()
+
+    def test_build_output_in_template_is_ignored(self, cl_dir):
+        self._compile(cl_dir)
+        (cl_dir.parent / "TexTemplate" / "Zeugnis.log").write_text("log")
+        (cl_dir.parent / "TexTemplate" / "Zeugnis.aux").write_text("aux")
+        assert export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_image_change_invalidates(self, cl_dir):
+        (cl_dir.parent / "TexTemplate" / "Stiftung.png").write_bytes(b"png1")
+        self._compile(cl_dir)
+        (cl_dir.parent / "TexTemplate" / "Stiftung.png").write_bytes(b"png22")
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+    def test_template_digest_cached_until_mtime_changes(self, cl_dir):
+        tex = cl_dir.parent / "TexTemplate" / "Zeugnis.tex"
+        digest = export.template_digest()
+        with patch.object(Path, "read_bytes", side_effect=AssertionError("re-read")):
+            assert export.template_digest() == digest
+        st = tex.stat()
+        os.utime(tex, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        with patch.object(Path, "read_bytes", return_value=b"template v1") as read:
+            assert export.template_digest() == digest
+        read.assert_called_once()
+
+    def test_format_setting_invalidates(self, cl_dir, monkeypatch):
+        self._compile(cl_dir)
+        monkeypatch.setattr(export, "EXPORT_FORMAT", True)
+        assert not export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+
+# ---------------------------------------------------------------------------
+# Precompiled format
+# ---------------------------------------------------------------------------
+
+class TestFormat:
+    @pytest.fixture
+    def root(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(export, "EXPORT_FORMAT", True)
+        (tmp_path / "TexTemplate").mkdir()
+        (tmp_path / "TexTemplate" / "ZeugnisFormat.tex").write_text("v1")
+        root = tmp_path / "Zeugnisse"
+        (root / "2025-1" / "5a").mkdir(parents=True)
+        return root
+
+    @staticmethod
+    def _fake_ini(cmd, cwd, **_):
+        job = next(a for a in cmd if a.startswith("-jobname=")).split("=", 1)[1]
+        (Path(cwd) / f"{job}.fmt").write_bytes(b"fmt")
+
+    def test_builds_once_per_template(self, root):
+        with patch.object(export.subprocess, "run", side_effect=self._fake_ini) as run:
+            assert export.build_format(root) == root / "zeugnis.fmt"
+            export.build_format(root)
+        run.assert_called_once()
+        assert "mylatexformat.ltx" in run.call_args.args[0]
+        assert not list(root.glob("zeugnis-*"))
+
+    def test_template_change_rebuilds(self, root):
+        with patch.object(export.subprocess, "run", side_effect=self._fake_ini) as run:
+            export.build_format(root)
+            (root.parent / "TexTemplate" / "ZeugnisFormat.tex").write_text("v2.0")
+            export.build_format(root)
+        assert run.call_count == 2
+
+    def test_failed_build_compiles_without_format(self, root):
+        with patch.object(export.subprocess, "run", side_effect=FileNotFoundError):
+            assert export.build_format(root) is None
+        assert not (root / "zeugnis.fmt").exists()
+
+    def test_compile_uses_format(self, root):
+        cl_dir = root / "2025-1" / "5a"
+        (cl_dir / "anna.tex").write_text("tex")
+        with patch.object(export, "_run_lualatex", return_value=(None, None)) as run:
+            export._compile_tex(cl_dir, "anna")
+            (root / "zeugnis.fmt").write_bytes(b"fmt")
+            export._compile_tex(cl_dir, "anna")
+        without, with_fmt = (c.args[0] for c in run.call_args_list)
+        assert not any(a.startswith("--fmt=") for a in without)
+        assert f"--fmt={root / 'zeugnis.fmt'}" in with_fmt
+
+    def test_driver_inputs_format_preamble(self, root):
+        drivers = []
+
+        def fake_ini(cmd, cwd, **kw):
+            drivers.append((Path(cwd) / cmd[-1]).read_text())
+            self._fake_ini(cmd, cwd, **kw)
+
+        with patch.object(export.subprocess, "run", side_effect=fake_ini):
+            export.build_format(root)
+        assert drivers[0].startswith("\\input{ZeugnisFormat.tex}")
+
+    def test_generated_tex_inputs_format_preamble_only_when_on(self, root, monkeypatch):
+        src = root.parent / "TexTemplate" / "Zeugnis.tex"
+        src.write_text("\\input{../../ZeugnisPackages.tex}\n")
+        assert export._template_tex(src) == "\\input{../../ZeugnisFormat.tex}\n"
+        monkeypatch.setattr(export, "EXPORT_FORMAT", False)
+        assert export._template_tex(src) == "\\input{../../ZeugnisPackages.tex}\n"
+
+    def test_plain_preamble_has_no_dump_split(self):
+        tpl = Path(__file__).resolve().parents[2] / "TexTemplate"
+        assert "endofdump" not in (tpl / "ZeugnisPackages.tex").read_text(encoding="utf-8")
+        assert "\n\\endofdump\n" in (tpl / "ZeugnisFormat.tex").read_text(encoding="utf-8")
+
+    def test_disabled_ignores_existing_format(self, root, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_FORMAT", False)
+        cl_dir = root / "2025-1" / "5a"
+        (cl_dir / "anna.tex").write_text("tex")
+        (root / "zeugnis.fmt").write_bytes(b"fmt")
+        with patch.object(export, "_run_lualatex", return_value=(None, None)) as run:
+            assert export.build_format(root) is None
+            export._compile_tex(cl_dir, "anna")
+        assert not any(a.startswith("--fmt=") for a in run.call_args.args[0])
+
+
+# ---------------------------------------------------------------------------
+# lualatex passes
+# ---------------------------------------------------------------------------
+
+class TestCompilePasses:
+    @pytest.fixture
+    def cl_dir(self, tmp_path):
+        d = tmp_path / "root" / "2025-1" / "5a"
+        d.mkdir(parents=True)
+        (d / "anna.tex").write_text("tex")
+        return d
+
+    @staticmethod
+    def _runs(cl_dir, logs):
+        """Fake lualatex writing the given log texts, one per run."""
+        it = iter(logs)
+
+        def run(cmd, cwd):
+            (cl_dir / "anna.log").write_text(next(it))
+            return 0.5, 120_000
+        return run
+
+    def _compile(self, cl_dir, logs):
+        passes = []
+        with patch.object(export, "_run_lualatex", side_effect=self._runs(cl_dir, logs)) as run:
+            export._compile_tex(cl_dir, "anna", passes)
+        return run.call_count, passes
+
+    def test_single_pass_when_log_is_clean(self, cl_dir):
+        calls, passes = self._compile(cl_dir, ["Output written on anna.pdf"])
+        assert calls == 1
+        assert passes[0].log_bytes == len("Output written on anna.pdf")
+        assert passes[0].rerun is False
+
+    def test_reruns_while_labels_change(self, cl_dir):
+        logs = ["LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.",
+                "Output written on anna.pdf"]
+        calls, passes = self._compile(cl_dir, logs)
+        assert calls == 2
+        assert [p.rerun for p in passes] == [True, False]
+
+    def test_pass_limit(self, cl_dir, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_MAX_PASSES", 2)
+        calls, _ = self._compile(cl_dir, ["Package x Warning: Rerun LaTeX."] * 3)
+        assert calls == 2
+
+    def test_pass_records_resources_and_pages(self, cl_dir):
+        _, passes = self._compile(cl_dir, ["Output written on anna.pdf (12 pages, 80000 bytes)."])
+        assert (passes[0].cpu_seconds, passes[0].max_rss_kb, passes[0].pages) == (0.5, 120_000, 12)
+
+    @pytest.mark.skipif(not hasattr(export.os, "wait4"), reason="needs os.wait4")
+    def test_run_lualatex_measures_child(self, tmp_path):
+        import sys
+        cpu, rss = export._run_lualatex([sys.executable, "-c", "sum(range(10**6))"], tmp_path)
+        assert cpu is not None and cpu > 0
+        assert rss > 0
+
+    @pytest.mark.skipif(not hasattr(export.os, "wait4"), reason="needs os.wait4")
+    def test_run_lualatex_raises_with_output(self, tmp_path):
+        import subprocess, sys
+        with pytest.raises(subprocess.CalledProcessError) as exc:
+            export._run_lualatex([sys.executable, "-c", "import sys; sys.exit('boom')"], tmp_path)
+        assert exc.value.returncode == 1
+        assert b"boom" in exc.value.stderr
+
+    def test_rerunfilecheck_info_is_not_a_signal(self, cl_dir):
+        calls, _ = self._compile(cl_dir, ["Package rerunfilecheck Info: File `anna.out' has not changed."])
+        assert calls == 1
+
+
+# ---------------------------------------------------------------------------
+# Class booklet
+# ---------------------------------------------------------------------------
+
+class TestBooklet:
+    TEMPLATE = (
+        "\\input{../../ZeugnisPackages.tex}\n"
+        "\\begin{luacode*}\n\tstudent = require(\"studentdata\")\n\\end{luacode*}\n"
+        "\\begin{document}\n\t\\input{../../ZeugnisTitlepage.tex}\n\\end{document}\n"
+    )
+
+    @pytest.fixture
+    def cl_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "TexTemplate").mkdir()
+        (tmp_path / "TexTemplate" / "Zeugnis.tex").write_text(self.TEMPLATE)
+        d = tmp_path / "5a"
+        d.mkdir()
+        for base in ("anna", "ben"):
+            (d / f"{base}.lua").write_text(f"return {{ name = '{base}' }}")
+        return d
+
+    def test_requires_every_student_and_resets_pages(self, cl_dir):
+        name = export.write_booklet(cl_dir, "5a", ["anna", "ben"])
+        tex = (cl_dir / f"{name}.tex").read_text()
+        assert name == "klasse_5a"
+        assert 'require("studentdata")' not in tex
+        assert 'require("anna")' in tex and 'require("ben")' in tex
+        assert tex.count("\\setcounter{page}{1}\\directlua{booklet_begin(") == 2
+        assert tex.count("ZeugnisTitlepage") == 2
+        assert tex.count("\\begin{document}") == tex.count("\\end{document}") == 1
+
+    def test_student_change_invalidates_booklet_pdf(self, cl_dir):
+        name = export.write_booklet(cl_dir, "5a", ["anna", "ben"])
+        with patch.object(export, "_compile_tex", side_effect=TestPdfCache._fake_compile):
+            export.compile_one(cl_dir, name)
+        assert export.pdf_is_current(cl_dir, name, export.template_digest())
+        (cl_dir / "ben.lua").write_text("return { name = 'Ben' }")
+        export.write_booklet(cl_dir, "5a", ["anna", "ben"])
+        assert not export.pdf_is_current(cl_dir, name, export.template_digest())
+
+    def test_split_student_pdfs_are_not_cached(self, cl_dir):
+        pypdf = pytest.importorskip("pypdf")
+        writer = pypdf.PdfWriter()
+        for _ in range(5):
+            writer.add_blank_page(width=595, height=842)
+        with open(cl_dir / "klasse_5a.pdf", "wb") as fh:
+            writer.write(fh)
+        (cl_dir / "klasse_5a.pages").write_text("1\n4")
+        for base in ("anna", "ben"):
+            (cl_dir / f"{base}.tex").write_text("tex")
+        with patch.object(export, "_compile_tex", side_effect=TestPdfCache._fake_compile):
+            export.compile_one(cl_dir, "anna")
+        assert export.pdf_is_current(cl_dir, "anna", export.template_digest())
+
+        pdfs = export.split_booklet(cl_dir, "klasse_5a", ["anna", "ben"])
+        assert [len(pypdf.PdfReader(p).pages) for p in pdfs] == [3, 2]
+        # a normal export must compile them singly, not reuse the split pages
+        assert not any(export.pdf_is_current(cl_dir, b, export.template_digest())
+                       for b in ("anna", "ben"))
+
+    def test_split_rejects_page_count_mismatch(self, cl_dir):
+        (cl_dir / "klasse_5a.pages").write_text("1")
+        with pytest.raises(RuntimeError):
+            export.split_booklet(cl_dir, "klasse_5a", ["anna", "ben"])
+
+
+# ---------------------------------------------------------------------------
+# prepare_export — class-level prefetch
+# ---------------------------------------------------------------------------
+
+class TestPrepareExportPrefetch:
+    @pytest.fixture
+    def export_env(self, fresh_engine, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(export.Path, "home", classmethod(lambda cls: tmp_path / "home"))
+        (tmp_path / "TexTemplate").mkdir()
+        (tmp_path / "TexTemplate" / "Zeugnis.tex").write_text('require("studentdata")')
+        Base.metadata.create_all(fresh_engine)
+        with Session(fresh_engine) as ses:
+            ses.add(SchoolYear(name="2025/2026", endjahr=False,
+                               report_day=datetime.date(2026, 1, 30)))
+            cls = SchoolClass(name="5p")
+            ses.add(cls)
+            ses.flush()
+            comp_ids = []
+            for sname in ("Deutsch", "Mathematik", "Sport"):
+                subj = Subject(name=sname)
+                for t in range(3):
+                    tp = Topic(name=f"{sname} T{t}", block="5/6", subject=subj)
+                    for c in range(2):
+                        comp = Competence(text=f"{sname} T{t} K{c}", topic=tp)
+                        ses.add(comp)
+                        ses.flush()
+                        comp_ids.append(comp.id)
+                    ses.add(CustomCompetence(text=f"Eigene {sname} T{t}", topic=tp, class_id=cls.id))
+                ses.add(subj)
+            ses.flush()
+            ses.add_all(ClassCompetence(class_id=cls.id, competence_id=cid, selected=True)
+                        for cid in comp_ids[::2])
+            topics = ses.query(Topic).all()
+            for i in range(6):
+                stu = Student(last_name=f"Schüler{i}", first_name="Max",
+                              birthday=datetime.date(2014, 1, i + 1), class_id=cls.id)
+                ses.add(stu)
+                ses.flush()
+                for subj in ses.query(Subject):
+                    ses.add(StudentSubject(student_id=stu.id, subject_id=subj.id, niveau="2"))
+                ses.add_all(Grade(student_id=stu.id, topic_id=tp.id, value=str(1 + i % 4))
+                            for tp in topics)
+            ses.commit()
+            ids = [s.id for s in ses.query(Student).order_by(Student.id)]
+        return fresh_engine, ids
+
+    def _count_queries(self, engine, student_ids) -> int:
+        count = 0
+
+        def on_execute(*_args, **_kw):
+            nonlocal count
+            count += 1
+
+        event.listen(engine, "before_cursor_execute", on_execute)
+        try:
+            export.prepare_export(student_ids, "5p", engine=engine)
+        finally:
+            event.remove(engine, "before_cursor_execute", on_execute)
+        return count
+
+    def test_query_count_independent_of_class_size(self, export_env):
+        engine, ids = export_env
+        assert self._count_queries(engine, ids[:1]) == self._count_queries(engine, ids)
+
+    def test_timings_per_phase(self, export_env):
+        engine, ids = export_env
+        timings = {}
+        export.prepare_export(ids, "5p", engine=engine, timings=timings)
+        assert set(timings) == {"db", "template", "latex", "lua"}
+        assert all(v >= 0 for v in timings.values())
+
+    def test_rich_text_converted_in_one_batch_per_mode(self, export_env, monkeypatch):
+        engine, ids = export_env
+        with Session(engine) as ses:
+            for stu in ses.query(Student):
+                stu.report_text = "<p>Gute <b>Mitarbeit</b></p>"
+                stu.remarks = f"<p>Bemerkung {stu.id}</p>"
+            ses.query(StudentSubject).update({"niveau": "<p>Niveau <i>LB</i></p>"})
+            ses.commit()
+        batches = []
+
+        def many(htmls, par_mode=False):
+            batches.append((len(htmls), par_mode))
+            return real_many(htmls, par_mode)
+
+        real_many = export.html_to_latex_many
+        monkeypatch.setattr(export, "html_to_latex_many", many)
+        monkeypatch.setattr(export, "html_to_latex", None)   # no per-field calls
+        cl_dir, bases = export.prepare_export(ids, "5p", engine=engine)
+        assert batches == [(12, True), (18, False)]
+        lua = (cl_dir / f"{bases[0]}.lua").read_text(encoding="utf-8")
+        assert r"Gute \\textbf{Mitarbeit}" in lua and r"Niveau \\textit{LB}" in lua
+
+    def test_precomputed_latex_skips_conversion(self, export_env, monkeypatch):
+        engine, ids = export_env
+        with Session(engine) as ses:
+            stu = ses.get(Student, ids[0])
+            stu.report_text = "<p>Vorab</p>"
+            store_latex([stu.report_text], ses)
+            ses.execute(update(LatexCache).values(body="GESPEICHERT"))
+            ses.commit()
+        batches = []
+        monkeypatch.setattr(export, "html_to_latex_many",
+                            lambda htmls, par_mode=False: batches.append(htmls) or ["" for _ in htmls])
+        cl_dir, bases = export.prepare_export(ids[:1], "5p", engine=engine)
+        assert "GESPEICHERT" in (cl_dir / f"{bases[0]}.lua").read_text(encoding="utf-8")
+        assert "<p>Vorab</p>" not in [h for batch in batches for h in batch]
+
+    def test_prefetched_lua_matches_per_student_lua(self, export_env):
+        engine, ids = export_env
+        cl_dir, bases = export.prepare_export(ids, "5p", engine=engine)
+        with Session(engine) as ses:
+            sy = ses.query(SchoolYear).one()
+            sel_comp = export._selected_comp_ids(ses, ses.query(SchoolClass).one())
+            for stu, base in zip(export._load_students(ses, ids), bases):
+                expected = _student_to_lua(stu, sy, sel_comp, ses)
+                assert (cl_dir / f"{base}.lua").read_text(encoding="utf-8") == expected
+                assert "Eigene Deutsch T0" in expected
@@ -0,0 +1,275 @@
+"""test_export_jobs.py — unit tests for the export job store on SQLite.
+
+Covers:
+- create_job / get_job: round trip, unknown id, results_after filter
+- add_result / cancel / finish: state transitions
+- prune: TTL expiry, size cap keeps unfinished jobs
+- job_metrics / recent_metrics: percentiles, slowest students, prepare phases
+- add_result: indexes allocated per job, unique under concurrent writers
+- lease / fail_unfinished: only jobs whose worker stopped renewing are failed
+- ensure_tables: versioned columns added to tables created by older versions
+- _create_engine: own, sized pool on PostgreSQL
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import delete
+
+from export_jobs import ExportJob, ExportJobResult
+
+
+@pytest.fixture
+def store(job_store):
+    with job_store._session() as ses:
+        ses.execute(delete(ExportJobResult))
+        ses.execute(delete(ExportJob))
+        ses.commit()
+    return job_store
+
+
+class TestJobLifecycle:
+    def test_create_and_get(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], "reports_2025_26_hj", force=True)
+        job = store.get_job(job_id)
+        assert job["basenames"] == ["a", "b"]
+        assert job["active_db"] == "reports_2025_26_hj"
+        assert job["force"] is True
+        assert job["done"] is False and job["cancelled"] is False
+        assert job["results"] == []
+
+    def test_unknown_job_is_none(self, store):
+        assert store.get_job("nope") is None
+
+    def test_results_in_completion_order(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        assert store.add_result(job_id, "b", "boom", seconds=1.5) == 1
+        assert store.add_result(job_id, "a", None, cached=True) == 2
+        results = store.get_job(job_id)["results"]
+        assert [(r["index"], r["basename"]) for r in results] == [(1, "b"), (2, "a")]
+        assert results[1]["cached"] is True and results[1]["success"] is True
+        assert results[0]["error"] == "boom" and results[0]["seconds"] == 1.5
+        assert all(r["total"] == 2 for r in results)
+
+    def test_results_after(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        store.add_result(job_id, "a", None)
+        store.add_result(job_id, "b", None)
+        assert [r["basename"] for r in store.get_job(job_id, results_after=1)["results"]] == ["b"]
+
+    def test_passes_round_trip(self, store):
+        job_id = store.create_job("/tmp/cl", ["a"], None)
+        passes = [{"seconds": 1.2, "log_bytes": 900, "rerun": True},
+                  {"seconds": 1.1, "log_bytes": 850, "rerun": False}]
+        store.add_result(job_id, "a", None, passes=passes)
+        assert store.get_job(job_id)["results"][0]["passes"] == passes
+
+    def test_cancel_and_finish(self, store):
+        job_id = store.create_job("/tmp/cl", ["a"], None)
+        assert store.is_cancelled(job_id) is False
+        store.cancel(job_id)
+        store.finish(job_id)
+        job = store.get_job(job_id)
+        assert store.is_cancelled(job_id) is True
+        assert job["cancelled"] is True and job["done"] is True
+
+
+class TestPrune:
+    def test_expired_jobs_removed_with_results(self, store):
+        job_id = store.create_job("/tmp/cl", ["a"], None)
+        store.add_result(job_id, "a", None)
+        assert store.prune(now=datetime.utcnow() + store.JOB_TTL + timedelta(minutes=1)) == 1
+        assert store.get_job(job_id) is None
+        with store._session() as ses:
+            assert ses.query(ExportJobResult).count() == 0
+
+    def test_fresh_jobs_kept(self, store):
+        job_id = store.create_job("/tmp/cl", ["a"], None)
+        assert store.prune() == 0
+        assert store.get_job(job_id) is not None
+
+    def test_size_cap_drops_oldest_finished(self, store):
+        with patch.object(store, "MAX_JOBS", 3):
+            ids = [store.create_job("/tmp/cl", ["a"], None) for _ in range(3)]
+            store.finish(ids[0])
+            store.finish(ids[1])
+            newest = store.create_job("/tmp/cl", ["a"], None)
+        assert store.get_job(ids[0]) is None
+        assert store.get_job(ids[1]) is not None
+        assert store.get_job(ids[2]) is not None
+        assert store.get_job(newest) is not None
+
+    def test_size_cap_keeps_running_jobs(self, store):
+        with patch.object(store, "MAX_JOBS", 2):
+            ids = [store.create_job("/tmp/cl", ["a"], None) for _ in range(3)]
+        assert all(store.get_job(i) is not None for i in ids)
+
+
+class TestMetrics:
+    def _job(self, store, seconds: list[float], prepare=None) -> str:
+        names = [f"s{i}" for i in range(len(seconds))]
+        job_id = store.create_job("/tmp/cl", names, None, prepare=prepare)
+        for i, (name, sec) in enumerate(zip(names, seconds), start=1):
+            store.add_result(job_id, name, None, seconds=sec, cpu_seconds=sec / 2,
+                             max_rss_kb=1000 * i, pages=4, pdf_bytes=100,
+                             passes=[{"seconds": sec}])
+        return job_id
+
+    def test_percentiles_and_slowest(self, store):
+        job_id = self._job(store, [float(s) for s in range(1, 21)], prepare={"db": 0.2})
+        m = store.job_metrics(job_id)
+        assert m["compiled"] == 20 and m["failed"] == 0
+        assert m["wall_p50"] == 10.0 and m["wall_p95"] == 19.0
+        assert m["cpu_total"] == 105.0
+        assert m["max_rss_kb"] == 20_000
+        assert m["pages"] == 80 and m["pdf_bytes"] == 2000
+        assert [s["basename"] for s in m["slowest"]] == ["s19", "s18", "s17", "s16", "s15"]
+        assert m["prepare"] == {"db": 0.2}
+
+    def test_cached_results_excluded_from_timings(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        store.add_result(job_id, "a", None, cached=True, seconds=0.001)
+        store.add_result(job_id, "b", None, seconds=3.0)
+        m = store.job_metrics(job_id)
+        assert m["cached"] == 1 and m["compiled"] == 1
+        assert m["wall_p50"] == 3.0
+
+    def test_unknown_job(self, store):
+        assert store.job_metrics("nope") is None
+
+    def test_recent_sums_prepare_phases(self, store):
+        self._job(store, [1.0], prepare={"db": 0.5, "lua": 1.0})
+        self._job(store, [2.0], prepare={"db": 0.25})
+        m = store.recent_metrics()
+        assert m["jobs"] == 2 and m["compiled"] == 2
+        assert m["prepare"] == {"db": 0.75, "lua": 1.0}
+
+
+class TestResultIndex:
+    def test_concurrent_writers_get_distinct_indexes(self, store):
+        names = [f"s{i}" for i in range(20)]
+        job_id = store.create_job("/tmp/cl", names, None)
+        threads = [threading.Thread(target=store.add_result, args=(job_id, n, None))
+                   for n in names]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(r["index"] for r in store.get_job(job_id)["results"]) == list(range(1, 21))
+
+    def test_indexes_are_per_job(self, store):
+        one = store.create_job("/tmp/cl", ["a"], None)
+        two = store.create_job("/tmp/cl", ["a"], None)
+        assert store.add_result(one, "a", None) == store.add_result(two, "a", None) == 1
+
+    def test_unknown_job(self, store):
+        assert store.add_result("nope", "a", None) is None
+
+
+class TestFailUnfinished:
+    @staticmethod
+    def _later(store) -> datetime:
+        return datetime.utcnow() + store.LEASE + timedelta(seconds=1)
+
+    def test_missing_students_get_restart_error(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b", "c"], None)
+        store.add_result(job_id, "b", None)
+        assert store.fail_unfinished(now=self._later(store)) == 1
+        job = store.get_job(job_id)
+        assert job["done"] is True
+        assert [(r["index"], r["basename"], r["error"]) for r in job["results"]] == [
+            (1, "b", None), (2, "a", store.RESTART_ERROR), (3, "c", store.RESTART_ERROR)]
+
+    def test_cancelled_job_finished_without_results(self, store):
+        job_id = store.create_job("/tmp/cl", ["a"], None)
+        store.cancel(job_id)
+        store.fail_unfinished(now=self._later(store))
+        job = store.get_job(job_id)
+        assert job["done"] is True and job["results"] == []
+
+    def test_recent_and_finished_jobs_untouched(self, store):
+        done = store.create_job("/tmp/cl", ["a"], None)
+        store.finish(done)
+        running = store.create_job("/tmp/cl", ["a"], None)
+        assert store.fail_unfinished() == 0
+        assert store.fail_unfinished(now=self._later(store)) == 1
+        assert store.get_job(done)["results"] == []
+        assert store.get_job(running)["done"] is True
+
+    def test_live_lease_is_respected(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        with patch.object(store, "LEASE", timedelta(seconds=0.15)):
+            with store.lease(job_id):
+                time.sleep(0.3)    # older than the lease, but renewed meanwhile
+                assert store.fail_unfinished() == 0
+                store.add_result(job_id, "a", None)
+            time.sleep(0.2)        # worker gone: no more renewals
+            assert store.fail_unfinished() == 1
+        assert [(r["index"], r["basename"]) for r in store.get_job(job_id)["results"]] == [
+            (1, "a"), (2, "b")]
+
+    def test_late_result_after_sweep_gets_next_index(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        store.fail_unfinished(now=self._later(store))
+        assert store.add_result(job_id, "a", None) == 3
+
+    def test_legacy_job_without_counter(self, store):
+        job_id = store.create_job("/tmp/cl", ["a", "b"], None)
+        store.add_result(job_id, "a", None)
+        with store._session() as ses:
+            ses.get(ExportJob, job_id).next_idx = 0
+            ses.commit()
+        store.fail_unfinished(now=self._later(store))
+        assert [r["index"] for r in store.get_job(job_id)["results"]] == [1, 2]
+
+
+class TestEnsureTables:
+    @pytest.fixture
+    def old_engine(self, tmp_path):
+        import export_jobs
+        from sqlalchemy import create_engine
+        eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with patch.object(export_jobs, "_engine", eng), \
+             patch.object(export_jobs, "_tables_ready", False):
+            yield eng
+        eng.dispose()
+
+    def _versions(self, eng) -> list[int]:
+        from sqlalchemy import text
+        with eng.connect() as conn:
+            return [v for (v,) in conn.execute(
+                text("SELECT version FROM export_jobs_migrations ORDER BY version"))]
+
+    def test_adds_columns_missing_from_older_tables(self, old_engine):
+        import export_jobs
+        from sqlalchemy import inspect, text
+        with old_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE export_job_results (id INTEGER PRIMARY KEY, "
+                              "job_id VARCHAR(36), idx INTEGER, basename VARCHAR, "
+                              "success BOOLEAN, error TEXT, cached BOOLEAN, seconds FLOAT)"))
+        export_jobs.ensure_tables()
+        cols = {c["name"] for c in inspect(old_engine).get_columns("export_job_results")}
+        assert {"passes", "cpu_seconds", "pdf_bytes"} <= cols
+        assert self._versions(old_engine) == list(range(1, len(export_jobs._ADDED_COLUMNS) + 1))
+
+    def test_fresh_tables_recorded_as_migrated(self, old_engine):
+        import export_jobs
+        export_jobs.ensure_tables()
+        assert len(self._versions(old_engine)) == len(export_jobs._ADDED_COLUMNS)
+
+
+class TestEngine:
+    def test_postgres_pool_is_sized(self):
+        import export_jobs
+        with patch.object(export_jobs, "POOL_SIZE", 3), patch.object(export_jobs, "MAX_OVERFLOW", 2):
+            eng = export_jobs._create_engine("postgresql://u:p@localhost/postgres")
+        assert (eng.pool.size(), eng.pool._max_overflow) == (3, 2)
+
+    def test_not_shared_with_maintenance_engine(self):
+        import export_jobs
+        from db_schema import MAINT_ENGINE
+        assert export_jobs._engine is not MAINT_ENGINE
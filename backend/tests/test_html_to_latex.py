@@ -1,12 +1,14 @@
 """test_html_to_latex.py — unit tests for html_to_latex.py.
 
 Covers the public html_to_latex() function: HTML parsing, character escaping,
-inline formatting, paragraph breaks, lists, and the legacy plain-text path.
+inline formatting, paragraph breaks, lists, and the legacy plain-text path,
+plus the (html, par_mode) conversion cache.
 """
 from __future__ import annotations
 
 import pytest
 
+import html_to_latex as h2l
 from html_to_latex import html_to_latex
 
 
@@ -613,3 +615,154 @@ class TestParModeVsCellMode:
         out = par("A\nB")
         assert "\\par " in out
         assert "\\\\" not in out
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer edge cases
+# ---------------------------------------------------------------------------
+
+class TestTokenizer:
+    def test_uppercase_tags(self):
+        assert latex("<P><STRONG>x</STRONG></P>") == r"\textbf{x}"
+
+    def test_entities_decoded_then_escaped(self):
+        assert latex("<p>a &amp; b &auml;</p>") == r"a \& b ä"
+
+    def test_gt_inside_quoted_attribute(self):
+        assert latex('<p title="a>b" style="text-align: center">x</p>') == r"{\centering x\par}"
+
+    def test_stray_lt_is_text(self):
+        assert latex("<p>1 < 2</p>") == "1 < 2"
+
+    def test_comments_ignored(self):
+        assert latex("<p>a<!-- <b>x</b> --></p>") == "a"
+
+    def test_unterminated_tag_at_end_dropped(self):
+        assert latex("<p>a</p>b<stro") == "a b"
+
+    @pytest.mark.parametrize("html,expected", [
+        ("<br><", "\\newline"),
+        ("<p>x</p><", "x"),
+        ("<p>x</p> <", "x"),
+        ("<p>x</p><<", "x <"),
+        ("<b>x<", "\\textbf{x"),
+    ])
+    def test_lone_lt_at_end_dropped(self, html, expected):
+        assert latex(html) == expected
+
+    def test_unterminated_comment_drops_rest(self):
+        assert latex("<p>a</p><!-- <b>x</b>") == "a"
+
+    def test_possible_entity_at_end_dropped(self):
+        assert latex("<p>a</p>b&c") == "a"
+        assert latex("<p>a</p>b & c") == "a b \\& c"
+
+    def test_slash_in_bare_attribute_value_not_self_closing(self):
+        # "x/" is the class value: the paragraph stays open and is never emitted
+        assert latex("<p>a</p><p class=x/>b") == "a"
+        assert latex("<p>a</p><p class=\"x\"/>b").endswith("\\newline b")
+
+    def test_escape_covers_every_mapped_character(self):
+        raw = "".join(h2l._ESCAPE)
+        assert h2l._esc(raw) == "".join(h2l._ESCAPE.values())
+
+    def test_br_in_ordered_list_then_bullet_list(self):
+        out = latex("<ol><li>a<br>b</li></ol><ul><li>x</li></ul>")
+        assert r"1.\enspace a\newline b" in out
+        assert r"\textbullet\enspace x" in out
+
+
+# ---------------------------------------------------------------------------
+# Conversion cache
+# ---------------------------------------------------------------------------
+
+class TestConversionCache:
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self):
+        h2l.cache_clear()
+        yield
+        h2l.cache_clear()
+
+    def test_repeat_is_a_hit_with_same_result(self):
+        first = html_to_latex("<p>Hallo <b>Welt</b></p>")
+        assert html_to_latex("<p>Hallo <b>Welt</b></p>") == first
+        info = h2l.cache_info()
+        assert (info["hits"], info["misses"], info["entries"]) == (1, 1, 1)
+
+    def test_par_mode_is_part_of_the_key(self):
+        html = "<p>A</p><p>B</p>"
+        assert html_to_latex(html, par_mode=True) != html_to_latex(html)
+        assert h2l.cache_info()["misses"] == 2
+
+    def test_hit_does_not_reparse(self, monkeypatch):
+        html_to_latex("<p>x</p>")
+        monkeypatch.setattr(h2l, "_Conv", None)
+        assert html_to_latex("<p>x</p>") == "x"
+
+    def test_entry_limit_evicts_least_recently_used(self, monkeypatch):
+        monkeypatch.setattr(h2l, "CACHE_SIZE", 2)
+        html_to_latex("<p>a</p>")
+        html_to_latex("<p>b</p>")
+        html_to_latex("<p>a</p>")          # a is now most recent
+        html_to_latex("<p>c</p>")          # evicts b
+        assert h2l.cache_info()["evictions"] == 1
+        html_to_latex("<p>a</p>")
+        assert h2l.cache_info()["hits"] == 2
+
+    def test_char_limit(self, monkeypatch):
+        monkeypatch.setattr(h2l, "CACHE_CHARS", 40)
+        html_to_latex("<p>" + "x" * 100 + "</p>")   # larger than the cache: not stored
+        assert h2l.cache_info()["entries"] == 0
+        for t in ("a", "b", "c"):
+            html_to_latex(f"<p>{t}</p>")           # 9 chars each incl. result
+        info = h2l.cache_info()
+        assert info["chars"] <= 40 and info["entries"] == 3
+
+
+class TestBatch:
+    INPUTS = ["<p>Hallo <b>Welt</b></p>", "", "Zeile 1\n\nZeile 2",
+              "<ol><li>a</li></ol><ul><li>b</li></ul>", "<p>Hallo <b>Welt</b></p>"]
+
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self):
+        h2l.cache_clear()
+        yield
+        h2l.cache_clear()
+
+    @pytest.mark.parametrize("par_mode", [False, True])
+    def test_same_as_single_calls_in_input_order(self, par_mode):
+        out = h2l.html_to_latex_many(self.INPUTS, par_mode)
+        h2l.cache_clear()
+        assert out == [html_to_latex(t, par_mode=par_mode) for t in self.INPUTS]
+
+    def test_duplicates_convert_once(self):
+        h2l.html_to_latex_many(self.INPUTS)
+        info = h2l.cache_info()
+        assert (info["hits"], info["misses"], info["entries"]) == (1, 3, 3)
+
+    def test_cached_inputs_skip_the_converter(self, monkeypatch):
+        html_to_latex("<p>x</p>")
+        monkeypatch.setattr(h2l, "_Conv", None)
+        assert h2l.html_to_latex_many(["<p>x</p>", ""]) == ["x", ""]
+
+    def test_converter_is_reused_without_leaking_state(self):
+        # an unclosed list / table must not bleed into the next input
+        out = h2l.html_to_latex_many(["<ol><li>a", "<table><tr><td>x", "<p>b</p>"])
+        assert out[2] == "b"
+
+    def test_process_pool(self, monkeypatch):
+        monkeypatch.setattr(h2l, "BATCH_POOL_CHARS", 1)
+        inputs = [f"<p>Nr. {i} &amp; <em>mehr</em></p>" for i in range(6)]
+        started = []
+        real = h2l.ProcessPoolExecutor
+        monkeypatch.setattr(h2l, "ProcessPoolExecutor",
+                            lambda *a, **kw: started.append(1) or real(*a, **kw))
+        try:
+            assert h2l.html_to_latex_many(inputs, processes=2) == \
+                [h2l._convert(t, False) for t in inputs]
+            h2l.cache_clear()
+            h2l.html_to_latex_many(inputs, processes=2)
+            assert len(started) == 1   # reused, not one pool per call
+        finally:
+            h2l.shutdown_batch_pool()
+        assert h2l._pools == {}
@@ -142,22 +142,24 @@ class TestRunMigrations:
 
 @requires_pg
 class TestDbSchemaIntegration:
-    def test_list_report_dbs_returns_existing(self):
+    @pytest.fixture
+    def maint_engine(self):
+        """Point the shared maintenance engine at our test postgres."""
         import db_schema
-        with sqlalchemy.create_engine(POSTGRES_URL).connect() as conn:
-            pass
-        # Point _pg_base_url at our test postgres
+        eng = create_engine(POSTGRES_URL, future=True)
         with pytest.MonkeyPatch().context() as mp:
-            mp.setenv("POSTGRES_URL", PG_BASE)
-            from db_schema import list_report_dbs
-            dbs = list_report_dbs()
+            mp.setattr(db_schema, "MAINT_ENGINE", eng)
+            yield eng
+        eng.dispose()
+
+    def test_list_report_dbs_returns_existing(self, maint_engine):
+        from db_schema import list_report_dbs
+        dbs = list_report_dbs(fresh=True)
         assert "reports_2025_26_ej" in dbs
 
-    def test_list_report_dbs_excludes_postgres_db(self):
-        with pytest.MonkeyPatch().context() as mp:
-            mp.setenv("POSTGRES_URL", PG_BASE)
-            from db_schema import list_report_dbs
-            dbs = list_report_dbs()
+    def test_list_report_dbs_excludes_postgres_db(self, maint_engine):
+        from db_schema import list_report_dbs
+        dbs = list_report_dbs(fresh=True)
         assert "postgres" not in dbs
         assert "template0" not in dbs
 
@@ -211,17 +213,12 @@ class TestAuthPureIntegration:
     def test_create_and_check_credentials(self):
         import auth_pure
         auth_pure.create_user("inttest_user", "Test1234!", role="lehrer")
-        assert auth_pure.check_credentials("inttest_user", "Test1234!") is True
+        assert auth_pure.check_credentials("inttest_user", "Test1234!") == "lehrer"
 
     def test_wrong_password_returns_false(self):
         import auth_pure
         auth_pure.create_user("inttest_user", "Test1234!", role="lehrer")
-        assert auth_pure.check_credentials("inttest_user", "wrongpw") is False
-
-    def test_get_role(self):
-        import auth_pure
-        auth_pure.create_user("inttest_user", "Test1234!", role="lehrer")
-        assert auth_pure.get_role("inttest_user") == "lehrer"
+        assert auth_pure.check_credentials("inttest_user", "wrongpw") is None
 
     def test_list_users_includes_new(self):
         import auth_pure
@@ -233,7 +230,7 @@ class TestAuthPureIntegration:
         import auth_pure
         auth_pure.create_user("inttest_user", "Test1234!", role="lehrer")
         assert auth_pure.delete_user("inttest_user") is True
-        assert auth_pure.check_credentials("inttest_user", "Test1234!") is False
+        assert auth_pure.check_credentials("inttest_user", "Test1234!") is None
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,126 @@
+"""test_migrations.py — unit tests for migrations.py on SQLite.
+
+Covers:
+- run_migrations: applies pending migrations, records them in schema_migrations
+- run_migrations: skips recorded versions without re-running the check
+- run_migrations: failed migration is not recorded, reports incomplete
+- ensure_migrated / forget_verified: once-per-process verification cache
+- ensure_migrated: a slow DB does not block migrations of another DB
+
+The real MIGRATIONS use information_schema (PostgreSQL only), so these tests
+swap in SQLite-compatible definitions.
+"""
+from __future__ import annotations
+
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+
+import migrations
+from migrations import ensure_migrated, forget_verified, run_migrations
+
+
+_SQLITE_MIGRATIONS = [
+    (
+        "widgets table",
+        "CREATE TABLE widgets (id INTEGER PRIMARY KEY)",
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='widgets'",
+    ),
+    (
+        "widgets.label column",
+        "ALTER TABLE widgets ADD COLUMN label TEXT",
+        "SELECT 1 FROM pragma_table_info('widgets') WHERE name='label'",
+    ),
+]
+
+
+@pytest.fixture
+def sqlite_migrations(monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", list(_SQLITE_MIGRATIONS))
+    monkeypatch.setattr(migrations, "_verified", set())
+    monkeypatch.setattr(migrations, "_db_locks", {})
+
+
+def _recorded(engine) -> list[int]:
+    with engine.connect() as conn:
+        return [v for (v,) in conn.execute(
+            text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+@pytest.mark.usefixtures("sqlite_migrations")
+class TestRunMigrations:
+    def test_applies_and_records_all(self, fresh_engine):
+        assert run_migrations(fresh_engine) is True
+        assert _recorded(fresh_engine) == [1, 2]
+        with fresh_engine.connect() as conn:
+            cols = {r[1] for r in conn.execute(text("PRAGMA table_info(widgets)"))}
+        assert "label" in cols
+
+    def test_second_run_skips_recorded_versions(self, fresh_engine):
+        run_migrations(fresh_engine)
+        with patch.object(migrations, "text", wraps=text) as spy:
+            assert run_migrations(fresh_engine) is True
+        issued = [str(c.args[0]) for c in spy.call_args_list]
+        assert not any("sqlite_master" in sql or "pragma_table_info" in sql for sql in issued)
+
+    def test_already_done_migration_recorded_without_running(self, fresh_engine):
+        with fresh_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE widgets (id INTEGER PRIMARY KEY, label TEXT)"))
+        assert run_migrations(fresh_engine) is True
+        assert _recorded(fresh_engine) == [1, 2]
+
+    def test_failed_migration_not_recorded(self, fresh_engine, monkeypatch):
+        monkeypatch.setattr(migrations, "MIGRATIONS", [
+            ("broken", "ALTER TABLE missing ADD COLUMN x TEXT", "SELECT 1 WHERE 0"),
+        ])
+        assert run_migrations(fresh_engine) is False
+        assert _recorded(fresh_engine) == []
+
+
+@pytest.mark.usefixtures("sqlite_migrations")
+class TestEnsureMigrated:
+    def test_runs_once_per_db(self, fresh_engine):
+        with patch.object(migrations, "run_migrations", return_value=True) as run:
+            ensure_migrated(fresh_engine)
+            ensure_migrated(fresh_engine)
+        run.assert_called_once_with(fresh_engine)
+
+    def test_incomplete_run_is_retried(self, fresh_engine):
+        with patch.object(migrations, "run_migrations", return_value=False) as run:
+            ensure_migrated(fresh_engine)
+            ensure_migrated(fresh_engine)
+        assert run.call_count == 2
+
+    def test_forget_verified_forces_rerun(self, fresh_engine):
+        with patch.object(migrations, "run_migrations", return_value=True) as run:
+            ensure_migrated(fresh_engine)
+            forget_verified(fresh_engine.url.database or "")
+            ensure_migrated(fresh_engine)
+        assert run.call_count == 2
+
+    def test_slow_db_does_not_block_other_db(self, fresh_engine):
+        other = SimpleNamespace(url=SimpleNamespace(database="reports_other"))
+        started, release = threading.Event(), threading.Event()
+        ran_while_slow = []
+
+        def _run(engine):
+            if engine is fresh_engine:
+                started.set()
+                release.wait(5)
+            else:
+                ran_while_slow.append(not release.is_set())
+            return True
+
+        with patch.object(migrations, "run_migrations", side_effect=_run):
+            slow = threading.Thread(target=ensure_migrated, args=(fresh_engine,))
+            slow.start()
+            assert started.wait(5)
+            try:
+                ensure_migrated(other)
+            finally:
+                release.set()
+                slow.join(5)
+        assert ran_while_slow == [True]
@@ -21,6 +21,9 @@ export default function AdminPage() {
   // Export state
   const [selectedClass, setSelectedClass] = useState("");
   const [checkedIds, setCheckedIds] = useState<Set<number>>(new Set());
+  const [forceCompile, setForceCompile] = useState(false);
+  const [booklet, setBooklet] = useState(false);
+  const [splitBooklet, setSplitBooklet] = useState(false);
 
   const { addJob } = useExportJobsContext();
 
@@ -60,7 +63,13 @@ export default function AdminPage() {
 
   const prepareMutation = useMutation({
     mutationFn: (ids: number[]) =>
-      adminApi.prepareExport(ids, selectedClass).then((r) => r.data),
+      adminApi
+        .prepareExport(ids, selectedClass, {
+          force: forceCompile,
+          booklet,
+          split: booklet && splitBooklet,
+        })
+        .then((r) => r.data),
     onSuccess: (data) => {
       addJob(data.job_id, selectedClass, data.total);
     },
@@ -97,7 +106,7 @@ export default function AdminPage() {
           <HelpButton
             title="Admin-Bereich"
             sections={[
-              { heading: "Export-Tab", text: 'Klasse auswählen, Schüler per Checkbox markieren und "Exportieren" klicken. LuaLaTeX kompiliert die PDFs serverseitig. Die Dateien landen in ~/Zeugnisse/[Jahr]-[HJ|EJ]/[Klasse]/ auf dem Server.' },
+              { heading: "Export-Tab", text: 'Klasse auswählen, Schüler per Checkbox markieren und "Exportieren" klicken. LuaLaTeX kompiliert die PDFs serverseitig; Zeugnisse ohne Änderungen werden aus dem Cache übernommen ("Unveränderte neu kompilieren" erzwingt einen Neubau). Die Dateien landen in ~/Zeugnisse/[Jahr]-[HJ|EJ]/[Klasse]/ auf dem Server.' },
               { heading: "Benutzer-Tab", text: "Neue Nutzer anlegen (Benutzername + Passwort + Rolle). Rolle Admin: voller Zugriff inkl. Setup und Übersicht. Rolle Lehrer: nur Kompetenzen, Schülerdaten und Stammdaten." },
               { heading: "Hinweis zum Export", text: "Vor dem Export sicherstellen, dass für alle Schüler Niveau, Themenurteile und Zeugnistext vollständig sind. Die Übersicht zeigt den aktuellen Stand." },
             ]}
@@ -208,6 +217,35 @@ export default function AdminPage() {
                         <FileText className="h-4 w-4" />
                         Alle erstellen ({studentList.length})
                       </button>
+                      <label className="flex items-center gap-2 text-sm text-muted-foreground">
+                        <input
+                          type="checkbox"
+                          checked={forceCompile}
+                          onChange={(e) => setForceCompile(e.target.checked)}
+                          className="h-4 w-4"
+                        />
+                        Unveränderte neu kompilieren
+                      </label>
+                      <label className="flex items-center gap-2 text-sm text-muted-foreground">
+                        <input
+                          type="checkbox"
+                          checked={booklet}
+                          onChange={(e) => setBooklet(e.target.checked)}
+                          className="h-4 w-4"
+                        />
+                        Ein Dokument für die Klasse
+                      </label>
+                      {booklet && (
+                        <label className="flex items-center gap-2 text-sm text-muted-foreground">
+                          <input
+                            type="checkbox"
+                            checked={splitBooklet}
+                            onChange={(e) => setSplitBooklet(e.target.checked)}
+                            className="h-4 w-4"
+                          />
+                          Zusätzlich je Schüler aufteilen
+                        </label>
+                      )}
                     </div>
                   </div>
                 )}
@@ -9,9 +9,14 @@ export async function GET(
   const backendUrl = process.env.BACKEND_URL || "http://localhost:8000";
   const { job_id } = await params;
 
+  // Forward the auth cookie; the backend endpoint requires a logged-in user.
+  const headers: Record<string, string> = { Accept: "text/event-stream" };
+  const cookie = request.headers.get("cookie");
+  if (cookie) headers.Cookie = cookie;
+
   const upstream = await fetch(
     `${backendUrl}/api/admin/export/stream/${job_id}`,
-    { headers: { Accept: "text/event-stream" } }
+    { headers, signal: request.signal }
   );
 
   if (!upstream.ok || !upstream.body) {
@@ -35,7 +35,12 @@ export default function LoginPage() {
         router.replace("/kompetenzen");
       }
     },
-    onError: () => toast.error("Ungültige Anmeldedaten"),
+    onError: (e: any) =>
+      toast.error(
+        e?.response?.status === 503
+          ? e.response.data?.detail ?? "Server ausgelastet – bitte erneut versuchen"
+          : "Ungültige Anmeldedaten",
+      ),
   });
 
   const setupMutation = useMutation({
@@ -20,6 +20,7 @@ export function ExportProgress({ label, events, total, isDone, onStop, onClose }
 
   const errors = progressEvents.filter((e) => !e.success);
   const successes = progressEvents.filter((e) => e.success);
+  const cached = successes.filter((e) => e.cached);
 
   return (
     <div className="bg-white border rounded-xl p-5 space-y-4">
@@ -66,6 +67,9 @@ export function ExportProgress({ label, events, total, isDone, onStop, onClose }
           <p className="flex items-center gap-1.5 text-green-600">
             <CheckCircle className="h-4 w-4" />
             {successes.length} Zeugnis{successes.length !== 1 ? "se" : ""} erstellt
+            {cached.length > 0 && (
+              <span className="text-muted-foreground">({cached.length} unverändert übernommen)</span>
+            )}
           </p>
           {errors.length > 0 && (
             <p className="flex items-center gap-1.5 text-red-600">
@@ -107,6 +111,15 @@ export function ExportProgress({ label, events, total, isDone, onStop, onClose }
               <XCircle className="h-3.5 w-3.5 text-red-500 shrink-0" />
             )}
             <span className="font-mono truncate">{e.basename}</span>
+            {e.cached && <span className="text-muted-foreground">(unverändert)</span>}
+            {e.passes && e.passes.length > 1 && (
+              <span
+                className="text-muted-foreground"
+                title={e.passes.map((p) => `${p.seconds.toFixed(1)} s`).join(" + ")}
+              >
+                ({e.passes.length} Läufe)
+              </span>
+            )}
           </div>
         ))}
         {!isDone && (
@@ -5,7 +5,7 @@ import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { toast } from "sonner";
 import { studentsApi } from "@/lib/api";
 import { QK } from "@/lib/queries";
-import { GradeMatrixResponse, GradeMatrixRow } from "@/types/api";
+import { GradeCellChange, GradeMatrixResponse, GradeMatrixRow } from "@/types/api";
 import { NiveauSelect } from "./NiveauSelect";
 import { RichTextEditorModal } from "@/components/stammdaten/RichTextEditorModal";
 import { Save, Pencil } from "lucide-react";
@@ -79,14 +79,48 @@ export function GradeMatrixTable({ classNameValue, subject }: Props) {
     }
   }, [data]); // eslint-disable-line react-hooks/exhaustive-deps
 
+  // Only cells that differ from the loaded data are sent, together with the
+  // version of each touched row; the server answers 409 if someone else
+  // changed one of those rows in the meantime.
+  const collectChanges = () => {
+    const changes: GradeCellChange[] = [];
+    const versions: Record<string, string> = {};
+    const loaded = new Map((data?.rows ?? []).map((r) => [r.student_id, r]));
+    for (const row of rows) {
+      const orig = loaded.get(row.student_id);
+      if (!orig) continue;
+      const before = changes.length;
+      if (row.niveau !== orig.niveau) {
+        changes.push({ student_id: row.student_id, topic_id: null, value: row.niveau });
+      }
+      for (const [tid, value] of Object.entries(row.grades)) {
+        if ((orig.grades[tid] ?? "") !== value) {
+          changes.push({ student_id: row.student_id, topic_id: Number(tid), value });
+        }
+      }
+      if (changes.length > before) versions[String(row.student_id)] = orig.version;
+    }
+    return { changes, versions };
+  };
+
   const saveMutation = useMutation({
-    mutationFn: () => studentsApi.saveMatrix(classNameValue, subject, rows),
+    mutationFn: () => {
+      const { changes, versions } = collectChanges();
+      return studentsApi.patchMatrix(classNameValue, subject, changes, versions);
+    },
     onSuccess: () => {
       qc.invalidateQueries({ queryKey: QK.matrix(classNameValue, subject) });
       setDirty(false);
       toast.success("Änderungen gespeichert");
     },
-    onError: () => toast.error("Fehler beim Speichern"),
+    onError: (err: { response?: { status?: number } }) => {
+      if (err.response?.status === 409) {
+        toast.error("Zwischenzeitlich von anderer Stelle geändert – Daten wurden neu geladen");
+        qc.invalidateQueries({ queryKey: QK.matrix(classNameValue, subject) });
+      } else {
+        toast.error("Fehler beim Speichern");
+      }
+    },
   });
 
   const updateNiveau = (studentId: number, value: string) => {
@@ -189,4 +189,32 @@ describe("useExportJobs", () => {
 
     expect(mockGet.mock.calls.length).toBeGreaterThan(callsAfterAdd);
   });
+
+  it("follows a job via SSE when EventSource is available", async () => {
+    const sources: { url: string; onmessage?: (m: { data: string }) => void; close: () => void }[] = [];
+    vi.stubGlobal("EventSource", vi.fn(function (this: (typeof sources)[number], url: string) {
+      this.url = url;
+      this.close = vi.fn();
+      sources.push(this);
+    }));
+
+    const { result } = renderHook(() => useExportJobs());
+    await act(async () => {
+      result.current.addJob("sse-job", "7ef", 2);
+    });
+    const callsAfterAdd = mockGet.mock.calls.length;
+
+    expect(sources[0].url).toBe("/api/admin/export/stream/sse-job");
+    act(() => {
+      sources[0].onmessage?.({ data: JSON.stringify({ type: "progress", basename: "a", success: true, index: 1, total: 2 }) });
+      sources[0].onmessage?.({ data: JSON.stringify({ type: "done", index: 1, total: 2 }) });
+    });
+
+    expect(result.current.jobs[0].events).toHaveLength(1);
+    expect(result.current.jobs[0].isDone).toBe(true);
+    expect(sources[0].close).toHaveBeenCalled();
+    // Streamed jobs are not polled
+    expect(mockGet.mock.calls.length).toBe(callsAfterAdd);
+    vi.unstubAllGlobals();
+  });
 });
@@ -16,6 +16,8 @@ export function useExportJobs() {
   const [jobs, setJobs] = useState<ExportJob[]>([]);
   // Ref keeps closures up-to-date without re-creating the interval
   const jobsRef = useRef<ExportJob[]>([]);
+  // Jobs followed via SSE; polling only covers jobs without an open stream
+  const streamsRef = useRef<Map<string, EventSource>>(new Map());
 
   const _set = useCallback((updater: (prev: ExportJob[]) => ExportJob[]) => {
     setJobs(prev => {
@@ -26,7 +28,7 @@ export function useExportJobs() {
   }, []);
 
   const poll = useCallback(async () => {
-    const active = jobsRef.current.filter(j => !j.isDone);
+    const active = jobsRef.current.filter(j => !j.isDone && !streamsRef.current.has(j.id));
     if (!active.length) return;
 
     const results = await Promise.all(
@@ -51,20 +53,53 @@ export function useExportJobs() {
     return () => clearInterval(t);
   }, [poll]);
 
+  const closeStream = useCallback((id: string) => {
+    streamsRef.current.get(id)?.close();
+    streamsRef.current.delete(id);
+  }, []);
+
+  // One event per compiled student; falls back to polling if the stream fails
+  const openStream = useCallback((id: string) => {
+    if (typeof EventSource === "undefined") return false;
+    const es = new EventSource(`/api/admin/export/stream/${id}`);
+    streamsRef.current.set(id, es);
+    es.onmessage = (msg) => {
+      const ev = JSON.parse(msg.data) as ExportProgressEvent;
+      if (ev.type === "done") {
+        closeStream(id);
+        _set(prev => prev.map(j => j.id === id ? { ...j, isDone: true } : j));
+      } else {
+        _set(prev => prev.map(j => j.id === id ? { ...j, events: [...j.events, ev] } : j));
+      }
+    };
+    es.onerror = () => {
+      closeStream(id);
+      poll();
+    };
+    return true;
+  }, [_set, closeStream, poll]);
+
+  useEffect(() => {
+    const streams = streamsRef.current;
+    return () => streams.forEach(es => es.close());
+  }, []);
+
   const addJob = useCallback((id: string, label: string, total: number) => {
     _set(prev => [...prev, { id, label, total, events: [], isDone: false }]);
-    // Immediate poll so the new card fills in quickly
-    setTimeout(poll, 300);
-  }, [_set, poll]);
+    // Immediate poll so the new card fills in quickly (only without SSE)
+    if (!openStream(id)) setTimeout(poll, 300);
+  }, [_set, openStream, poll]);
 
   const cancelJob = useCallback((id: string) => {
+    closeStream(id);
     api.post(`/admin/export/cancel/${id}`).catch(() => {});
     _set(prev => prev.map(j => j.id === id ? { ...j, isDone: true } : j));
-  }, [_set]);
+  }, [_set, closeStream]);
 
   const dismissJob = useCallback((id: string) => {
+    closeStream(id);
     _set(prev => prev.filter(j => j.id !== id));
-  }, [_set]);
+  }, [_set, closeStream]);
 
   return { jobs, addJob, cancelJob, dismissJob };
 }
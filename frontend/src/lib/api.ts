@@ -100,8 +100,15 @@ export const competenceApi = {
 export const studentsApi = {
   matrix: (class_name: string, subject: string) =>
     api.get("/students/matrix", { params: { class_name, subject } }),
-  saveMatrix: (class_name: string, subject: string, rows: import("@/types/api").GradeMatrixRow[]) =>
+  saveMatrix: (class_name: string, subject: string, rows: Omit<import("@/types/api").GradeMatrixRow, "version">[]) =>
     api.post("/students/matrix", { class_name, subject, rows }),
+  patchMatrix: (
+    class_name: string,
+    subject: string,
+    changes: import("@/types/api").GradeCellChange[],
+    versions: Record<string, string>,
+  ) =>
+    api.patch("/students/matrix", { class_name, subject, changes, versions }),
   lbProfile: (student_id: number) =>
     api.get(`/students/${student_id}/lb-profile`),
 };
@@ -130,8 +137,12 @@ export const stammdatenApi = {
 export const adminApi = {
   students: (class_name: string) =>
     api.get("/admin/students", { params: { class_name } }),
-  prepareExport: (student_ids: number[], classroom: string) =>
-    api.post("/admin/export/prepare", { student_ids, classroom }),
+  prepareExport: (
+    student_ids: number[],
+    classroom: string,
+    { force = false, booklet = false, split = false } = {}
+  ) =>
+    api.post("/admin/export/prepare", { student_ids, classroom, force, booklet, split }),
   competenceSyncDiff: () => api.get("/admin/competence-sync/diff"),
   competenceSyncApply: () => api.post("/admin/competence-sync/apply"),
 };
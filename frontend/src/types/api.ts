@@ -90,6 +90,13 @@ export interface GradeMatrixRow {
   niveau: string;
   grades: Record<string, string>;
   student_type: "normal" | "lb" | "gb";
+  version: string;
+}
+
+export interface GradeCellChange {
+  student_id: number;
+  topic_id: number | null; // null → Niveau
+  value: string;
 }
 
 export interface GradeMatrixResponse {
@@ -180,4 +187,20 @@ export interface ExportProgressEvent {
   basename?: string;
   success?: boolean;
   error?: string | null;
+  cached?: boolean; // PDF reused, sources unchanged
+  seconds?: number | null;
+  passes?: CompilePass[] | null; // one entry per lualatex run
+  cpu_seconds?: number | null;
+  max_rss_kb?: number | null;
+  pages?: number | null;
+  pdf_bytes?: number | null;
+}
+
+export interface CompilePass {
+  seconds: number;
+  log_bytes: number;
+  rerun: boolean;
+  cpu_seconds?: number | null;
+  max_rss_kb?: number | null;
+  pages?: number | null;
 }